@@ -0,0 +1,363 @@
+"""Overlapping the git processes of a run with asyncio
+
+The stages of a run mostly wait for git. Here, they are driven by
+asyncio subprocesses so that they overlap:
+
+* The upstream and downstream remotes are fetched concurrently.
+* The upstream and downstream commits are walked by two git log
+  processes streaming side by side.
+* As soon as the downstream walk is complete, the upstream commits that
+  need a cherry-pick check are known while they are still being parsed.
+  They are queued to a bounded number of merge-tree processes right
+  away, instead of after the walk.
+
+The stages produce the same commits and merge-tree results as the
+sequential ones, so the output is identical.
+"""
+
+import asyncio
+import logging
+import typing
+
+import git
+
+import commit_log
+import fetch_strategy
+import merge_tree
+import perf
+import verdict_cache
+
+CHUNK_SIZE = 1 << 16
+
+async def run_git(git_dir: str, *args: str) -> str:
+    """Run a git command
+
+    Returns:
+        str: The output of the command
+
+    Raises:
+        git.GitCommandError: The command failed
+    """
+    process = await asyncio.create_subprocess_exec(
+        'git', '--git-dir', git_dir, *args,
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise git.GitCommandError(['git', *args], process.returncode,
+                                  stderr.decode(errors='replace'))
+    return stdout.decode('utf-8', errors='surrogateescape')
+
+async def fetch_concurrently(repo: git.Repo,
+                             remotes: typing.List[typing.Tuple[str, typing.List[str]]],
+                             strategy: fetch_strategy.FetchStrategy):
+    """Fetch several remotes at the same time
+
+    The commit-graph is written once, after all of them were fetched.
+
+    Args:
+        repo (git.Repo): The git repo
+        remotes: The name of each remote along with the branches to fetch
+        strategy (FetchStrategy): How to fetch
+    """
+    for remote_name, branches in remotes:
+        logging.info("Fetching %s from %s", ', '.join(branches or ['all branches']),
+                     remote_name)
+    # Concurrent fetches would overwrite each other's FETCH_HEAD
+    await asyncio.gather(*(
+        run_git(repo.git_dir, 'fetch', '--no-write-fetch-head',
+                *fetch_strategy.fetch_arguments(remote_name, branches, strategy))
+        for remote_name, branches in remotes))
+
+    if strategy.commit_graph:
+        await run_git(repo.git_dir, 'commit-graph', 'write', '--reachable',
+                      '--changed-paths', '--split')
+
+async def stream_log(git_dir: str, rev: str) -> typing.AsyncIterator[commit_log.LogCommit]:
+    """Iterate over the commits of a revision range while git log runs
+
+    The commits are listed in the same order as commit_log.iter_log_commits()
+    lists them.
+
+    Args:
+        git_dir (str): The git directory of the repo
+        rev (str): The revision range, e.g. 'base..tip'
+
+    Yields:
+        LogCommit: The commits
+    """
+    process = await asyncio.create_subprocess_exec(
+        'git', '--git-dir', git_dir, 'log', '-z', f'--format={commit_log.LOG_FORMAT}', rev, '--',
+        stdout=asyncio.subprocess.PIPE)
+    fields = []
+    remainder = b''
+    try:
+        while True:
+            chunk = await process.stdout.read(CHUNK_SIZE)
+            if not chunk:
+                break
+
+            tokens = (remainder + chunk).split(b'\0')
+            remainder = tokens.pop()
+            for token in tokens:
+                fields.append(token.decode('utf-8', errors='replace'))
+                if len(fields) == commit_log.LOG_FIELD_COUNT:
+                    yield commit_log.log_commit_from_fields(fields)
+                    fields = []
+
+        if remainder:
+            fields.append(remainder.decode('utf-8', errors='replace'))
+        if len(fields) == commit_log.LOG_FIELD_COUNT:
+            yield commit_log.log_commit_from_fields(fields)
+    finally:
+        if process.returncode is None and not process.stdout.at_eof():
+            process.kill()
+        if await process.wait() not in (0, -9):
+            raise git.GitCommandError(['git', 'log', rev], process.returncode)
+
+class _MergeTreeProcess:
+    """A git merge-tree --stdin process answering one merge at a time"""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self._process = process
+
+    @classmethod
+    async def start(cls, git_dir: str) -> '_MergeTreeProcess':
+        return cls(await asyncio.create_subprocess_exec(
+            'git', '--git-dir', git_dir, 'merge-tree', '--write-tree',
+            '--stdin', '--name-only', '--no-messages',
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE))
+
+    async def _read_token(self) -> str:
+        try:
+            token = await self._process.stdout.readuntil(b'\0')
+        except asyncio.IncompleteReadError as e:
+            raise EOFError('git merge-tree terminated unexpectedly') from e
+        return token[:-1].decode('utf-8', errors='surrogateescape')
+
+    async def cherry_pick(self, base_sha: str, sha: str, parent_sha: str) \
+            -> merge_tree.MergeTreeResult:
+        self._process.stdin.write(f'{parent_sha} -- {base_sha} {sha}\n'.encode())
+        await self._process.stdin.drain()
+
+        status = await self._read_token()
+        if status not in ('0', '1'):
+            raise RuntimeError(f'git merge-tree failed with status {status}')
+        tree = await self._read_token()
+        conflicting_paths = []
+        while True:
+            path = await self._read_token()
+            if not path:
+                break
+            conflicting_paths.append(path)
+
+        clean = status == '1'
+        return merge_tree.MergeTreeResult(clean, tuple(conflicting_paths),
+                                          tree if clean else None)
+
+    async def close(self):
+        self._process.stdin.close()
+        await self._process.wait()
+
+class CherryPickChecker:
+    """Runs cherry-pick checks with a bounded number of git processes
+
+    Checks are submitted while the commits are being walked, and run by
+    up to `jobs` workers. With the batch backend, every worker owns a
+    git merge-tree --stdin process. Otherwise, every check is a legacy
+    git merge-tree process.
+    """
+
+    def __init__(self,
+                 git_dir: str,
+                 base_sha: str,
+                 backend: str,
+                 jobs: int,
+                 cache: typing.Optional[verdict_cache.CherryPickCache] = None,
+                 base_tree: typing.Optional[str] = None):
+        """
+        Args:
+            git_dir (str): The git directory of the repo
+            base_sha (str): The commit to cherry-pick onto
+            backend (str): Either 'batch' or 'legacy', see merge_tree.resolve_backend()
+            jobs (int): The maximum number of checks running at the same time
+            cache: Cache of verdicts from earlier runs. Only misses are checked.
+            base_tree (str): The tree of the base commit, required with a cache
+        """
+        self._git_dir = git_dir
+        self._base_sha = base_sha
+        self._backend = backend
+        self._cache = cache
+        self._base_tree = base_tree
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._work()) for _ in range(max(1, jobs))]
+        self._queued = []
+        self.checked = 0
+
+    def submit(self, sha: str, parent_sha: str) -> asyncio.Future:
+        """Queue the check of a commit
+
+        Returns:
+            asyncio.Future: The merge-tree result
+        """
+        future = asyncio.get_running_loop().create_future()
+        if self._cache:
+            cached = self._cache.get_many(self._base_tree, self._backend, [(sha, parent_sha)])[0]
+            if cached is not None:
+                future.set_result(cached)
+                return future
+
+        self._queued.append((sha, parent_sha, future))
+        self._queue.put_nowait((sha, parent_sha, future))
+        return future
+
+    async def _work(self):
+        merger = None
+        if self._backend == 'batch':
+            merger = await _MergeTreeProcess.start(self._git_dir)
+        try:
+            while True:
+                sha, parent_sha, future = await self._queue.get()
+                if sha is None:
+                    break
+                try:
+                    if merger:
+                        result = await merger.cherry_pick(self._base_sha, sha, parent_sha)
+                    else:
+                        status = await run_git(self._git_dir, 'merge-tree',
+                                               self._base_sha, sha, parent_sha)
+                        result = merge_tree.MergeTreeResult(
+                            merge_tree.parse_legacy_status(status.rstrip('\n')))
+                    self.checked += 1
+                    future.set_result(result)
+                except Exception as e:
+                    # Reported to the caller awaiting the result
+                    future.set_exception(e)
+        finally:
+            if merger:
+                await merger.close()
+
+    async def close(self):
+        """Wait for the queued checks, then stop the workers
+
+        The verdicts of the successful checks are stored in the cache.
+
+        Raises:
+            Exception: The error of the first check that failed, if any
+        """
+        for _ in self._workers:
+            self._queue.put_nowait((None, None, None))
+        await asyncio.gather(*self._workers)
+
+        succeeded = []
+        errors = []
+        for sha, parent_sha, future in self._queued:
+            if not future.done() or future.cancelled():
+                continue
+            if future.exception() is None:
+                succeeded.append((sha, parent_sha, future.result()))
+            else:
+                errors.append(future.exception())
+
+        if self._cache and succeeded:
+            self._cache.put_many(self._base_tree, self._backend,
+                                 [(sha, parent_sha) for sha, parent_sha, _ in succeeded],
+                                 [result for _, _, result in succeeded])
+        if errors:
+            raise errors[0]
+
+class WalkResult(typing.NamedTuple):
+    """The commits of both ranges, with the results of the checks"""
+
+    upstream_items: list
+    downstream_items: list
+    # The merge-tree result of every checked upstream commit, by SHA
+    cherry_pick_results: typing.Dict[str, merge_tree.MergeTreeResult]
+
+async def walk_and_check(repo: git.Repo,
+                         merge_base: str,
+                         upstream_tip: str,
+                         downstream_tip: str,
+                         make_upstream_item: typing.Callable,
+                         make_downstream_item: typing.Callable,
+                         needs_check: typing.Callable[[list], typing.Callable[[typing.Any], bool]],
+                         backend: str = 'auto',
+                         jobs: int = 1,
+                         cache: typing.Optional[verdict_cache.CherryPickCache] = None,
+                         upstream_commits: typing.Optional[list] = None) \
+                             -> WalkResult:
+    """Walk both ranges side by side, checking upstream commits as they arrive
+
+    The upstream range is not walked again if its commits are given, as
+    when several downstream revisions share a single upstream walk.
+
+    Args:
+        repo (git.Repo): The git repo
+        merge_base (str): The merge base of both tips
+        upstream_tip (str): The upstream tip
+        downstream_tip (str): The downstream tip
+        make_upstream_item: Creates the item of an upstream commit
+        make_downstream_item: Creates the item of a downstream commit
+        needs_check: Given all the downstream items, returns whether an
+            upstream item needs a cherry-pick check
+        backend (str): One of merge_tree.MERGE_TREE_BACKENDS
+        jobs (int): The maximum number of checks running at the same time
+        cache: Cache of verdicts from earlier runs
+        upstream_commits (list): The upstream commits after the merge base,
+            in the order git log lists them, if they were already walked
+
+    Returns:
+        WalkResult: The items in the order git log lists them, and the results
+    """
+    backend = merge_tree.resolve_backend(repo, backend)
+    base_tree = repo.git.rev_parse(f'{merge_base}^{{tree}}') if cache else None
+    checker = CherryPickChecker(repo.git_dir, merge_base, backend, jobs, cache, base_tree)
+
+    downstream_items = []
+    downstream_done = asyncio.Event()
+    predicate = None
+
+    async def walk_downstream():
+        nonlocal predicate
+        async for commit in stream_log(repo.git_dir, f'{merge_base}..{downstream_tip}'):
+            downstream_items.append(make_downstream_item(commit))
+        predicate = needs_check(downstream_items)
+        downstream_done.set()
+
+    upstream_items = []
+    futures = {}
+
+    def submit(items):
+        for item in items:
+            if predicate(item):
+                futures[item.sha] = checker.submit(item.sha, item.parent_sha)
+
+    async def walk_upstream():
+        pending = 0
+        if upstream_commits is not None:
+            upstream_items.extend(map(make_upstream_item, upstream_commits))
+            await downstream_done.wait()
+            submit(upstream_items)
+            return
+
+        async for commit in stream_log(repo.git_dir, f'{merge_base}..{upstream_tip}'):
+            upstream_items.append(make_upstream_item(commit))
+            if downstream_done.is_set():
+                # The commits parsed while the downstream walk was running
+                submit(upstream_items[pending:])
+                pending = len(upstream_items)
+        await downstream_done.wait()
+        submit(upstream_items[pending:])
+
+    # The checks run while the commits are walked, so the phase spans the
+    # walks as well
+    with perf.phase('cherry_pick_checks') as counters:
+        try:
+            await asyncio.gather(walk_downstream(), walk_upstream())
+            results = {sha: await future for sha, future in futures.items()}
+        finally:
+            await checker.close()
+            counters['commits'] = checker.checked
+
+    logging.info("Walked %d upstream and %d downstream commits, checked %d",
+                 len(upstream_items), len(downstream_items), checker.checked)
+    return WalkResult(upstream_items, downstream_items, results)
@@ -0,0 +1,109 @@
+"""Benchmark backfilling InfluxDB from the history of data.json
+
+A repository with automatic commits of a synthetic data.json is created,
+and every version is pushed to a local stand-in InfluxDB. With
+--compare-legacy, the versions are also pushed one at a time the way
+push_to_influx_all.sh used to: one git process, one JSON parse and one
+InfluxDB client per commit, without the checkout and shell overhead of
+the interactive rebase.
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+from influxdb_client import InfluxDBClient
+from influxdb_client.client.write_api import SYNCHRONOUS
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import data_history
+import influx_writer
+import push_to_influx
+import synthetic_repo
+from fake_influxdb import FakeInfluxDB
+
+def synthetic_data(version: int, upstream_count: int, downstream_count: int) -> dict:
+    """Create a data.json document"""
+    def item(prefix, index):
+        return {
+            'sha': f'{index:040x}',
+            'authored_seconds_since_epoch': 1700000000 + index,
+            'committed_seconds_since_epoch': 1700000000 + index,
+            'author': 'Jane Doe',
+            'author_email': 'jane.doe@example.com',
+            'title': f'{prefix}{synthetic_repo.SUBSYSTEMS[index % 6]}: change {index}',
+        }
+
+    return {
+        'meta': {'authored_seconds_since_epoch': 1700000000 + version * 86400},
+        'merge_base': item('', 0),
+        'upstream_commits': [item('', index) for index in range(upstream_count + version)],
+        'downstream_commits': [item('[nrf noup] ', index) for index in range(downstream_count)],
+    }
+
+def create_history(repo_dir: pathlib.Path, versions: int, upstream_count: int,
+                   downstream_count: int):
+    """Create a repository with one automatic commit per version of data.json"""
+    subprocess.run(['git', 'init', '--quiet', '-b', 'main', str(repo_dir)], check=True)
+
+    def commits():
+        for version in range(versions):
+            data = synthetic_data(version, upstream_count, downstream_count)
+            yield (f'(auto) Update fork state {version}\n',
+                   {data_history.DEFAULT_DATA_PATH: json.dumps(data)})
+            if version % 10 == 0:
+                yield (f'Manual change {version}\n', {'README.md': f'{version}\n'})
+
+    synthetic_repo.fast_import_commits(repo_dir, 'main', commits())
+
+def legacy_push(repo_dir: pathlib.Path, url: str):
+    """Push every version of data.json one at a time"""
+    for sha, _ in data_history.list_commits(str(repo_dir), 'main'):
+        content = subprocess.run(
+            ['git', '-C', str(repo_dir), 'show', f'{sha}:{data_history.DEFAULT_DATA_PATH}'],
+            check=True, capture_output=True).stdout
+        with InfluxDBClient(url=url, token=None, org='org') as client:
+            with client.write_api(write_options=SYNCHRONOUS) as api:
+                api.write(bucket='bucket', record=push_to_influx.get_entry(json.loads(content)))
+
+def main():
+    """Main function of this script"""
+    parser = argparse.ArgumentParser(prog="Benchmark InfluxDB backfill")
+    parser.add_argument('--versions', type=int, default=200)
+    parser.add_argument('--upstream-commits', type=int, default=4000)
+    parser.add_argument('--downstream-commits', type=int, default=1500)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--compare-legacy', default=False, action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo_dir = pathlib.Path(temp_dir)
+        start = time.perf_counter()
+        create_history(repo_dir, args.versions, args.upstream_commits, args.downstream_commits)
+        print(f'Created {args.versions} versions of data.json in '
+              f'{time.perf_counter() - start:.2f}s')
+
+        with FakeInfluxDB() as server:
+            start = time.perf_counter()
+            entries = push_to_influx.get_backfill_entries(
+                str(repo_dir), 'main', data_history.DEFAULT_DATA_PATH, args.jobs)
+            push_to_influx.push_entries_to_influx(entries, influx_writer.WriterSettings(
+                url=server.url, org='org', bucket='bucket', batch_size=5000))
+            print(f'Backfill: {len(server.lines)} points in {server.requests} requests, '
+                  f'{time.perf_counter() - start:.2f}s')
+
+        if args.compare_legacy:
+            with FakeInfluxDB() as server:
+                start = time.perf_counter()
+                legacy_push(repo_dir, server.url)
+                print(f'One push per commit: {len(server.lines)} points in '
+                      f'{server.requests} requests, {time.perf_counter() - start:.2f}s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark cherry_pick_commits.py on a synthetic fork
+
+Upstream-only commits of a synthetic fork are picked onto the downstream
+branch, without a worktree by cherry_pick_commits.pick_commits(), and
+with --compare-legacy also the way the script used to: resetting the
+worktree, then git cherry-pick -x and git commit --amend per commit.
+Only commits that pick cleanly are used, as the legacy way stops at the
+first conflict.
+"""
+
+import argparse
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+import git
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import cherry_pick_commits
+import synthetic_fork
+
+def legacy_pick(repo: git.Repo, onto: git.Commit, commits, title_prefix: str):
+    """Cherry-pick commits the way cherry_pick_commits.py used to"""
+    repo.head.reference = repo.create_head(path='legacy', commit=onto, force=True)
+    repo.head.reset(index=True, working_tree=True)
+    for commit in commits:
+        repo.git.cherry_pick(commit, '-x')
+        new_commit_message = ''.join([title_prefix,
+                                      commit.message,
+                                      f'(cherry picked from commit {commit})'])
+        repo.git.commit('--amend', '-m', new_commit_message)
+
+def main():
+    """Main function of this script"""
+    parser = argparse.ArgumentParser(prog="Benchmark cherry-picking commits")
+    parser.add_argument('--preset', choices=synthetic_fork.PRESETS, default='medium')
+    parser.add_argument('--commits', type=int, default=50,
+                        help='Number of commits to cherry-pick')
+    parser.add_argument('--compare-legacy', default=False, action='store_true')
+    args = parser.parse_args()
+
+    # The picked commits need a committer
+    for variable in ('GIT_COMMITTER_NAME', 'GIT_COMMITTER_EMAIL'):
+        os.environ.setdefault(variable, 'benchmark')
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = pathlib.Path(temp_dir)
+        start = time.perf_counter()
+        fork = synthetic_fork.create_fork(temp_dir / 'fork', synthetic_fork.PRESETS[args.preset])
+        repo = git.Repo.clone_from(fork.downstream_url, temp_dir / 'clone')
+        repo.create_remote('upstream', fork.upstream_url).fetch()
+        print(f'Generated the {args.preset} fork in {time.perf_counter() - start:.2f}s')
+
+        onto = repo.commit('origin/main')
+        candidates = [repo.commit(sha) for sha in repo.git.rev_list(
+            '--reverse', '--no-merges', 'origin/main..upstream/main').split()]
+
+        # Find commits that pick cleanly one after another
+        results = cherry_pick_commits.pick_commits(repo, onto, candidates[:args.commits * 2])
+        clean = {result.sha for result in results if result.new_sha}
+        commits = [commit for commit in candidates if str(commit) in clean][:args.commits]
+
+        start = time.perf_counter()
+        results = cherry_pick_commits.pick_commits(repo, onto, commits, '[nrf fromtree] ')
+        print(f'Without worktree: {len(results)} commits in {time.perf_counter() - start:.2f}s')
+
+        if args.compare_legacy:
+            start = time.perf_counter()
+            legacy_pick(repo, onto, commits, '[nrf fromtree] ')
+            print(f'With worktree: {len(commits)} commits in {time.perf_counter() - start:.2f}s')
+
+            same_tree = repo.commit(results[-1].new_sha).tree == repo.head.commit.tree
+            print('Same resulting tree' if same_tree else 'The resulting trees differ')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Benchmark reading commits with git log against GitPython
+
+Both readers are used to build the CommitRepr dictionaries of all
+commits of a synthetic repository.
+"""
+
+import argparse
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import commit_log
+import synthetic_repo
+from fork_sync_data import CommitRepr
+
+def to_dicts(commits) -> list:
+    """Build the dictionary representation of the commits"""
+    return [CommitRepr(commit, parse_message_for_upstream_info=True).to_dict()
+            for commit in commits]
+
+def main():
+    """Main function of this script"""
+    parser = argparse.ArgumentParser(prog="Benchmark commit readers")
+    parser.add_argument('--commits', type=int, default=50000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        start = time.perf_counter()
+        repo = synthetic_repo.create_linear_repo(pathlib.Path(temp_dir), args.commits)
+        print(f'Created {args.commits} commits in {time.perf_counter() - start:.2f}s')
+
+        start = time.perf_counter()
+        gitpython_dicts = to_dicts(repo.iter_commits('main'))
+        gitpython_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        log_dicts = to_dicts(commit_log.iter_log_commits(repo, 'main'))
+        log_time = time.perf_counter() - start
+
+        assert gitpython_dicts == log_dicts
+
+        print(f'GitPython iter_commits: {gitpython_time:.2f}s')
+        print(f'git log reader:         {log_time:.2f}s')
+        print(f'Speedup:                {gitpython_time / log_time:.1f}x')
+
+if __name__ == '__main__':
+    main()
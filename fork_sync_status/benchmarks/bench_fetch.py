@@ -0,0 +1,153 @@
+"""Benchmark cloning and fetching the fork with the fetch strategies
+
+A synthetic fork is generated with realistically sized blobs, and extra
+upstream branches standing in for the release and collaboration
+branches of the real repositories. It is then fetched through file://
+remotes:
+
+* like the script used to: a full clone with a checkout, all branches
+  and tags of both remotes
+* with only the analyzed branches
+* with only the analyzed branches, without blobs
+* again into the cached partial clone, which only fetches new objects
+
+The wall time and the size of the .git directory are printed for each.
+Unless --no-analysis is given, fork_sync_data.py is then run on the
+clones, which for the partial clone includes fetching the blobs needed
+by the cherry-pick checks.
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+import git
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import fetch_strategy
+import synthetic_fork
+import synthetic_repo
+
+SCRIPT = pathlib.Path(__file__).resolve().parents[1] / 'fork_sync_data.py'
+
+def add_extra_branches(repo_dir: pathlib.Path, count: int, commits: int,
+                       spec: synthetic_fork.ForkSpec):
+    """Add branches that are not analyzed to a bare repository"""
+    for branch in range(count):
+        padding = os.urandom(spec.blob_size // 2).hex()
+        synthetic_repo.fast_import_commits(
+            repo_dir, f'extra-{branch}',
+            [(f'extra: branch {branch} commit {index}\n',
+              {f'extra/{branch}/file_{index}.c': f'/* {index} {padding} */\n'})
+             for index in range(commits)],
+            from_ref='refs/heads/main^0')
+        subprocess.run(['git', 'tag', f'v{branch}.0.0', f'extra-{branch}'],
+                       cwd=repo_dir, check=True)
+
+def legacy_fetch(clone_dir: pathlib.Path, fork: synthetic_fork.SyntheticFork):
+    """Clone and fetch the way fork_sync_data.py used to"""
+    repo = git.Repo.clone_from(fork.upstream_url, clone_dir)
+    repo.create_remote('downstream', fork.downstream_url)
+    repo.remotes['downstream'].fetch()
+
+def strategy_fetch(clone_dir: pathlib.Path,
+                   fork: synthetic_fork.SyntheticFork,
+                   strategy: fetch_strategy.FetchStrategy):
+    """Clone and fetch the way fork_sync_data.py does"""
+    repo = fetch_strategy.clone(clone_dir, fork.upstream_url, 'origin', ['main'], strategy)
+    fetch_strategy.configure_remote(repo, 'downstream', fork.downstream_url, ['main'], strategy)
+    fetch_strategy.fetch(repo, 'downstream', ['main'], strategy)
+
+def refetch(clone_dir: pathlib.Path, strategy: fetch_strategy.FetchStrategy):
+    """Fetch into a cached clone"""
+    repo = git.Repo(clone_dir)
+    fetch_strategy.fetch(repo, 'origin', ['main'], strategy)
+    fetch_strategy.fetch(repo, 'downstream', ['main'], strategy)
+
+def disk_usage(clone_dir: pathlib.Path) -> int:
+    """The size of the files in the .git directory"""
+    return sum(path.stat().st_size for path in (clone_dir / '.git').rglob('*') if path.is_file())
+
+def analyze(clone_dir: pathlib.Path,
+            fork: synthetic_fork.SyntheticFork,
+            output_file: pathlib.Path,
+            *options: str) -> float:
+    """Run fork_sync_data.py on an existing clone
+
+    Returns:
+        float: The wall time
+    """
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(SCRIPT),
+                    '--upstream-url', fork.upstream_url,
+                    '--downstream-url', fork.downstream_url,
+                    '--clone-dir', str(clone_dir),
+                    '--output-file', str(output_file), *options],
+                   check=True, capture_output=True)
+    return time.perf_counter() - start
+
+def main():
+    """Main function of this script"""
+    parser = argparse.ArgumentParser(prog="Benchmark the fetch strategies")
+    parser.add_argument('--preset', choices=synthetic_fork.PRESETS, default='small')
+    parser.add_argument('--blob-size', type=int, default=4096,
+                        help='Approximate size of the files of the synthetic fork')
+    parser.add_argument('--extra-branches', type=int, default=10)
+    parser.add_argument('--extra-commits', type=int, default=200,
+                        help='Number of commits on each of the extra branches')
+    parser.add_argument('--no-analysis', default=False, action='store_true')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = pathlib.Path(temp_dir)
+        start = time.perf_counter()
+        spec = synthetic_fork.PRESETS[args.preset]._replace(blob_size=args.blob_size)
+        fork = synthetic_fork.create_fork(temp_dir / 'fork', spec)
+        add_extra_branches(temp_dir / 'fork' / 'upstream.git',
+                           args.extra_branches, args.extra_commits, spec)
+        print(f'Generated the {args.preset} fork in {time.perf_counter() - start:.2f}s')
+
+        full = fetch_strategy.FetchStrategy()
+        partial = fetch_strategy.FetchStrategy(partial=True)
+        runs = [
+            ('All refs, with checkout', 'legacy', lambda path: legacy_fetch(path, fork)),
+            ('Analyzed branches', 'full', lambda path: strategy_fetch(path, fork, full)),
+            ('Analyzed branches, blobless', 'partial',
+             lambda path: strategy_fetch(path, fork, partial)),
+            ('Cached blobless clone', 'partial', lambda path: refetch(path, partial)),
+        ]
+
+        print(f"{'Fetch':30} {'Time':>9} {'Disk':>11}")
+        for name, directory, run in runs:
+            clone_dir = temp_dir / directory
+            start = time.perf_counter()
+            run(clone_dir)
+            print(f'{name:30} {time.perf_counter() - start:8.2f}s '
+                  f'{disk_usage(clone_dir) / 2**20:7.1f} MiB')
+
+        if args.no_analysis:
+            return
+
+        print(f"{'Analysis':30} {'Time':>9} {'Disk':>11}")
+        for name, directory, options in (('Full clone', 'full', ()),
+                                         ('Blobless clone', 'partial', ('--partial-clone',))):
+            clone_dir = temp_dir / directory
+            seconds = analyze(clone_dir, fork, temp_dir / f'{directory}.json', *options)
+            print(f'{name:30} {seconds:8.2f}s {disk_usage(clone_dir) / 2**20:7.1f} MiB')
+
+        results = []
+        for directory in ('full', 'partial'):
+            data = json.loads((temp_dir / f'{directory}.json').read_text(encoding='utf-8'))
+            del data['meta']
+            results.append(data)
+        if results[0] != results[1]:
+            print('The results of the full and the blobless clone differ')
+
+if __name__ == '__main__':
+    main()
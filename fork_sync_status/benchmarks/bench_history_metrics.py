@@ -0,0 +1,75 @@
+"""Benchmark reconstructing the metrics over time from the git history
+
+The histories of a synthetic fork are read by history_metrics.py, and
+the metrics are computed for a number of samples spread over them. The
+values of the last sample are compared with the entry push_to_influx.py
+computes from the output of fork_sync_data.py at the tips.
+"""
+
+import argparse
+import json
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+
+import git
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import history_metrics
+import push_to_influx
+import synthetic_fork
+
+SCRIPT = pathlib.Path(__file__).resolve().parents[1] / 'fork_sync_data.py'
+
+def main():
+    """Main function of this script"""
+    parser = argparse.ArgumentParser(prog="Benchmark reconstructing the metrics over time")
+    parser.add_argument('--preset', choices=synthetic_fork.PRESETS, default='medium')
+    parser.add_argument('--samples', type=int, default=365)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = pathlib.Path(temp_dir)
+        start = time.perf_counter()
+        fork = synthetic_fork.create_fork(temp_dir / 'fork', synthetic_fork.PRESETS[args.preset])
+        subprocess.run([sys.executable, str(SCRIPT),
+                        '--upstream-url', fork.upstream_url,
+                        '--downstream-url', fork.downstream_url,
+                        '--clone-dir', str(temp_dir / 'clone'),
+                        '--output-file', str(temp_dir / 'data.json')],
+                       check=True, capture_output=True)
+        print(f'Generated and analyzed the {args.preset} fork in '
+              f'{time.perf_counter() - start:.2f}s')
+
+        repo = git.Repo(temp_dir / 'clone')
+        first = repo.commit(repo.git.rev_list('--max-parents=0', 'origin/main')).committed_date
+        last = max(repo.commit('origin/main').committed_date,
+                   repo.commit('downstream/main').committed_date)
+        interval = max(1, (last - first) // (args.samples - 1))
+        samples = history_metrics.sample_times(last - interval * (args.samples - 1), last, interval)
+
+        start = time.perf_counter()
+        upstream, downstream = history_metrics.read_histories(
+            repo, 'origin/main', 'downstream/main', int(samples[0]))
+        read_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        metrics = history_metrics.compute_metrics(upstream, downstream, samples)
+        compute_seconds = time.perf_counter() - start
+        print(f'Read {len(upstream.shas)} upstream and {len(downstream.titles)} downstream '
+              f'commits in {read_seconds:.2f}s')
+        print(f'Computed {len(samples)} samples in {compute_seconds:.3f}s')
+
+        data = json.loads((temp_dir / 'data.json').read_text(encoding='utf-8'))
+        expected = push_to_influx.get_entry(data)['fields']
+        differences = {field: (int(values[-1]), expected[field])
+                       for field, values in metrics.items() if values[-1] != expected[field]}
+        if differences:
+            print(f'The last sample differs from the pipeline: {differences}')
+        else:
+            print('The last sample matches the pipeline')
+
+if __name__ == '__main__':
+    main()
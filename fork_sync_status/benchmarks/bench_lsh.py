@@ -0,0 +1,72 @@
+"""Benchmark the MinHash/LSH matcher used for fromlist commits
+
+Synthetic upstream commits are indexed, and modified copies of some of
+them are looked up, like fromlist commits that changed before they were
+merged upstream. Both the time and the share of copies for which the
+original commit was found are reported.
+"""
+
+import argparse
+import pathlib
+import random
+import sys
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import fuzzy_match
+
+WORDS = ['bluetooth', 'host', 'controller', 'conn', 'gatt', 'att', 'l2cap', 'net',
+         'driver', 'gpio', 'spi', 'i2c', 'uart', 'kernel', 'thread', 'sem',
+         'board', 'nrf', 'dts', 'kconfig', 'test', 'fix', 'add', 'remove']
+
+def random_commit(generator: random.Random, index: int):
+    """Title and diff lines of a synthetic commit"""
+    title = ' '.join(generator.choice(WORDS) for _ in range(6))
+    lines = [f'+{generator.choice(WORDS)}_{index}_{line}(x, {generator.randrange(1000)});'
+             for line in range(generator.randrange(5, 40))]
+    return title, lines
+
+def modify(generator: random.Random, title: str, lines: list):
+    """Change a commit a bit, like in a review round"""
+    lines = list(lines)
+    for _ in range(max(1, len(lines) // 10)):
+        lines[generator.randrange(len(lines))] = f'+changed_{generator.randrange(10**6)}();'
+    return title, lines
+
+def run(upstream_count: int, query_count: int, seed: int = 1):
+    """Index upstream_count commits and look up query_count modified copies"""
+    generator = random.Random(seed)
+    upstream = [random_commit(generator, index) for index in range(upstream_count)]
+
+    start = time.perf_counter()
+    index = fuzzy_match.MinHashLSH()
+    for key, (title, lines) in enumerate(upstream):
+        index.add(key, index.signature(fuzzy_match.commit_tokens(title, lines)))
+    index_time = time.perf_counter() - start
+
+    targets = generator.sample(range(upstream_count), query_count)
+    start = time.perf_counter()
+    found = 0
+    for target in targets:
+        title, lines = modify(generator, *upstream[target])
+        signature = index.signature(fuzzy_match.commit_tokens('[nrf fromlist] ' + title, lines))
+        if any(key == target for key, _ in index.query(signature)):
+            found += 1
+    query_time = time.perf_counter() - start
+
+    print(f'{upstream_count:>7} upstream commits: index {index_time:6.2f}s, '
+          f'{query_count} queries {query_time:6.2f}s, recall {found / query_count:.1%}')
+
+def main():
+    """Main function of this script"""
+    parser = argparse.ArgumentParser(prog="Benchmark MinHash/LSH matcher")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 40000])
+    parser.add_argument('--queries', type=int, default=1500)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        run(size, min(args.queries, size))
+
+if __name__ == '__main__':
+    main()
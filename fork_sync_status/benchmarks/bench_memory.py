@@ -0,0 +1,82 @@
+"""Benchmark the memory needed to hold commit records
+
+Measures the memory retained by the records of all commits of a
+synthetic repository, for the representations that are kept in memory
+while the fork sync data is computed.
+"""
+
+import argparse
+import gc
+import pathlib
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import commit_log
+import synthetic_repo
+from fork_sync_data import CommitRepr
+
+class UnslottedCommitRepr:
+    """Models the earlier CommitRepr: a git.Commit and a __dict__ per commit"""
+
+    def __init__(self, commit):
+        self._commit = commit
+        self._upstream_sha = None
+        self._upstream_pr = None
+        self._downstream_sha = None
+        self._downstream_sha_guess = None
+        self._upstream_sha_guess = None
+        self._reverts_sha = None
+        self._reverted_by_sha = None
+        self._supports_clean_cherry_pick = None
+
+        # Loads the commit, like the earlier CommitRepr did
+        self._commit.summary # pylint: disable=pointless-statement
+
+def retained_memory(build) -> int:
+    """Memory retained by the object returned by build, in bytes"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return retained
+
+def main():
+    """Main function of this script"""
+    parser = argparse.ArgumentParser(prog="Benchmark commit record memory")
+    parser.add_argument('--commits', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        repo = synthetic_repo.create_linear_repo(pathlib.Path(temp_dir), args.commits)
+
+        def unslotted_commit_reprs():
+            return [UnslottedCommitRepr(commit) for commit in repo.iter_commits('main')]
+
+        def dicts():
+            return [CommitRepr(commit).to_dict()
+                    for commit in commit_log.iter_log_commits(repo, 'main')]
+
+        def commit_reprs():
+            return [CommitRepr(commit)
+                    for commit in commit_log.iter_log_commits(repo, 'main')]
+
+        results = [
+            ('CommitRepr + git.Commit', retained_memory(unslotted_commit_reprs)),
+            ('to_dict() dictionaries', retained_memory(dicts)),
+            ('Slotted CommitRepr', retained_memory(commit_reprs)),
+        ]
+
+        print(f'Memory retained for {args.commits} commits:')
+        for name, size in results:
+            print(f'  {name:24} {size / 2**20:8.1f} MiB '
+                  f'({size / args.commits:.0f} bytes per commit)')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""A local stand-in for the InfluxDB write endpoint
+
+Accepts the writes of influxdb_client on /api/v2/write and keeps the
+received line protocol, so that pushing can be exercised and timed
+without a real server. The first requests can be made to fail, to
+exercise retries and spooling.
+
+Examples:
+    python fake_influxdb.py --port 8086
+    python ../push_to_influx.py --backfill --url http://localhost:8086
+"""
+
+import argparse
+import gzip
+import http.server
+import threading
+import typing
+
+class _WriteHandler(http.server.BaseHTTPRequestHandler):
+    server: 'FakeInfluxDB'
+
+    def do_POST(self):
+        """Handle a write request"""
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+
+        if not self.path.startswith('/api/v2/write'):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        with self.server.lock:
+            self.server.requests += 1
+            failing = self.server.requests <= self.server.fail_requests
+            if not failing:
+                self.server.lines.extend(line for line in body.decode().split('\n') if line)
+        self.send_response(503 if failing else 204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class FakeInfluxDB(http.server.ThreadingHTTPServer):
+    """Records the points written to it
+
+    Use it as a context manager to serve from a background thread.
+    """
+
+    def __init__(self, port: int = 0, verbose: bool = False, fail_requests: int = 0):
+        super().__init__(('127.0.0.1', port), _WriteHandler)
+        self.lock = threading.Lock()
+        self.requests = 0
+        # The first requests are answered with 503 Service Unavailable
+        self.fail_requests = fail_requests
+        self.lines: typing.List[str] = []
+        self.verbose = verbose
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """The URL to pass to InfluxDBClient"""
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self._thread.join()
+        self.server_close()
+
+def main():
+    """Main function of this script"""
+    parser = argparse.ArgumentParser(prog="Stand-in InfluxDB write endpoint")
+    parser.add_argument('--port', type=int, default=8086)
+    parser.add_argument('--fail-requests', type=int, default=0,
+                        help='Answer the first requests with 503 to exercise retries')
+    args = parser.parse_args()
+
+    server = FakeInfluxDB(args.port, verbose=True, fail_requests=args.fail_requests)
+    print(f'Listening on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(f'Received {len(server.lines)} points in {server.requests} requests')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""Benchmark the fork_sync_status pipeline on a synthetic fork
+
+A synthetic upstream/downstream fork is generated locally and the
+pipeline is run against it through file:// remotes, so no network
+access is needed. The wall time and the peak Python heap of each phase
+are measured and compared against the stored baseline.
+
+Examples:
+    python run_benchmarks.py --preset small
+    python run_benchmarks.py --preset medium --update-baseline
+"""
+
+import argparse
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import commit_log
+import fork_sync_data
+import push_to_influx
+import sync_data_io
+import synthetic_fork
+
+BASELINE_FILE = pathlib.Path(__file__).resolve().parent / 'baseline.json'
+
+# Differences below this are considered noise
+MIN_SIGNIFICANT_SECONDS = 0.05
+
+# The timings of shorter phases mostly depend on the machine and its load,
+# so they are not compared
+MIN_COMPARED_SECONDS = 0.5
+
+class PhaseTimer:
+    """Measures the wall time and the peak Python heap of phases"""
+
+    def __init__(self, track_memory: bool = True):
+        self.results = {}
+        self._track_memory = track_memory
+        self._name = None
+        self._start = None
+
+    def __call__(self, name: str):
+        self._name = name
+        return self
+
+    def __enter__(self):
+        if self._track_memory:
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter()
+
+    def __exit__(self, *args):
+        result = {'wall_seconds': round(time.perf_counter() - self._start, 4)}
+        if self._track_memory:
+            result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        self.results[self._name] = result
+
+def run_pipeline(fork: synthetic_fork.SyntheticFork,
+                 clone_dir: pathlib.Path,
+                 output_dir: pathlib.Path,
+                 jobs: int,
+                 track_memory: bool = True) -> dict:
+    """Run every phase of the pipeline once
+
+    Returns:
+        dict: The measurements of each phase
+    """
+    phase = PhaseTimer(track_memory)
+    if track_memory:
+        tracemalloc.start()
+
+    try:
+        with phase('clone'):
+            repo = fork_sync_data.clone_repo_with_remote(clone_dir, fork.upstream_url, 'origin')
+
+        with phase('fetch_downstream'):
+            fork_sync_data.repo_add_remote(repo, fork.downstream_url, 'downstream')
+
+        with phase('merge_base'):
+            upstream_tip = repo.commit('origin/main')
+            downstream_tip = repo.commit('downstream/main')
+            merge_base = repo.merge_base(upstream_tip, downstream_tip)[0]
+
+        with phase('walk_downstream'):
+            downstream_commits = list(commit_log.iter_log_commits(
+                repo, f'{merge_base}..{downstream_tip}'))
+
+        with phase('walk_upstream'):
+            upstream_commits = list(commit_log.iter_log_commits(
+                repo, f'{merge_base}..{upstream_tip}'))
+
+        with phase('commit_records'):
+            downstream_items = [
+                fork_sync_data.CommitRepr(commit, parse_message_for_upstream_info=True)
+                for commit in downstream_commits]
+            upstream_items = [fork_sync_data.CommitRepr(commit) for commit in upstream_commits]
+            needs_check = fork_sync_data.needs_cherry_pick_check(downstream_items)
+            candidates = [item for item in upstream_items if needs_check(item)]
+
+        executor = fork_sync_data.create_cherry_pick_executor('thread', jobs)
+        try:
+            with phase('cherry_pick_checks'):
+                results = fork_sync_data.check_cherry_pickable(
+                    repo, merge_base, [(item.sha, item.parent_sha) for item in candidates],
+                    executor)
+                for item, result in zip(candidates, results):
+                    item.set_cherry_pick_result(result)
+
+            # Only matches the commits, as they were all checked already
+            with phase('fork_sync_items'):
+                items = fork_sync_data.get_fork_sync_items(
+                    repo, merge_base, upstream_items, downstream_items, executor)
+        finally:
+            if executor:
+                executor.shutdown()
+
+        data = {
+            'meta': {'authored_seconds_since_epoch': int(time.time())},
+            'merge_base': fork_sync_data.CommitRepr(merge_base).to_dict(),
+        }
+        data.update(items)
+
+        with phase('serialize'):
+            with open(output_dir / 'data.json', 'w', encoding='utf-8') as f:
+                sync_data_io.write_sync_data(f, data)
+
+        with phase('load'):
+            loaded = sync_data_io.load_sync_data(output_dir / 'data.json')
+
+        with phase('get_entry'):
+            push_to_influx.get_entry(loaded)
+    finally:
+        if track_memory:
+            tracemalloc.stop()
+
+    phase.results['_counts'] = {
+        'upstream_commits': len(items['upstream_commits']),
+        'downstream_commits': len(items['downstream_commits']),
+        'cherry_pick_checks': len(candidates),
+    }
+
+    return phase.results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Find phases that got slower than the baseline
+
+    Returns:
+        list: Descriptions of the regressions
+    """
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if name.startswith('_') or not expected:
+            continue
+
+        slower = result['wall_seconds'] - expected['wall_seconds']
+        if expected['wall_seconds'] >= MIN_COMPARED_SECONDS and \
+                slower > MIN_SIGNIFICANT_SECONDS and \
+                result['wall_seconds'] > expected['wall_seconds'] * (1 + tolerance):
+            regressions.append(f"{name}: {result['wall_seconds']:.3f}s, "
+                               f"baseline {expected['wall_seconds']:.3f}s")
+
+        if 'peak_memory_bytes' in result and 'peak_memory_bytes' in expected and \
+                result['peak_memory_bytes'] > expected['peak_memory_bytes'] * (1 + tolerance):
+            regressions.append(f"{name}: {result['peak_memory_bytes']} bytes peak, "
+                               f"baseline {expected['peak_memory_bytes']} bytes")
+
+    return regressions
+
+def print_results(results: dict, baseline: dict):
+    """Print the measurements next to the baseline"""
+    print(f"{'Phase':20} {'Time':>10} {'Baseline':>10} {'Peak heap':>12}")
+    for name, result in results.items():
+        if name.startswith('_'):
+            continue
+        expected = baseline.get(name, {}).get('wall_seconds')
+        expected = f'{expected:.3f}s' if expected is not None else '-'
+        memory = result.get('peak_memory_bytes')
+        memory = f'{memory / 2**20:.1f} MiB' if memory is not None else '-'
+        print(f"{name:20} {result['wall_seconds']:9.3f}s {expected:>10} {memory:>12}")
+    print(', '.join(f'{key}: {value}' for key, value in results['_counts'].items()))
+
+def main():
+    """Main function of this script"""
+    parser = argparse.ArgumentParser(prog="Benchmark the fork sync pipeline")
+    parser.add_argument('--preset', choices=synthetic_fork.PRESETS, default='small')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('--no-memory', default=False, action='store_true',
+                        help='Do not track memory, which slows down the pipeline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative slowdown compared to the baseline')
+    parser.add_argument('--update-baseline', default=False, action='store_true')
+    args = parser.parse_args()
+
+    baselines = {}
+    if BASELINE_FILE.exists():
+        baselines = json.loads(BASELINE_FILE.read_text(encoding='utf-8'))
+    baseline = baselines.get(args.preset, {})
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_dir = pathlib.Path(temp_dir)
+        start = time.perf_counter()
+        fork = synthetic_fork.create_fork(temp_dir / 'fork', synthetic_fork.PRESETS[args.preset])
+        print(f'Generated the {args.preset} fork in {time.perf_counter() - start:.2f}s')
+
+        results = run_pipeline(fork, temp_dir / 'clone', temp_dir,
+                               args.jobs, not args.no_memory)
+
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        baselines[args.preset] = results
+        BASELINE_FILE.write_text(json.dumps(baselines, indent=4) + '\n', encoding='utf-8')
+        print(f'Updated {BASELINE_FILE}')
+        return
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f'Regression: {regression}')
+    if regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Generate a synthetic upstream/downstream fork for benchmarks
+
+The generated repositories follow the conventions used in the real fork:
+
+* [nrf fromtree] commits cherry-picked from upstream with a
+  "(cherry picked from commit ...)" trailer
+* [nrf fromlist] commits picked from an upstream PR with an
+  "Upstream PR #: ..." trailer, some of which were merged upstream
+* [nrf noup] commits, some of which edit files also changed upstream so
+  that the corresponding upstream commits do not cherry-pick cleanly
+* Reverts of downstream commits
+
+Both repositories are bare and can be used through file:// URLs, so the
+whole pipeline runs offline. Partial clones of them are allowed.
+"""
+
+import pathlib
+import random
+import subprocess
+import typing
+
+from synthetic_repo import SUBSYSTEMS, fast_import_commits
+
+class ForkSpec(typing.NamedTuple):
+    """The shape of a synthetic fork"""
+
+    base_commits: int = 200
+    upstream_commits: int = 1000
+    downstream_commits: int = 400
+    fromtree_ratio: float = 0.3
+    fromlist_ratio: float = 0.15
+    conflict_ratio: float = 0.1
+    revert_ratio: float = 0.03
+    file_count: int = 500
+    # Random bytes added to every file, to make the blobs realistically sized
+    blob_size: int = 0
+    seed: int = 1
+
+PRESETS = {
+    'small': ForkSpec(),
+    'medium': ForkSpec(base_commits=1000, upstream_commits=4300, downstream_commits=1600,
+                       file_count=2000),
+    'large': ForkSpec(base_commits=5000, upstream_commits=20000, downstream_commits=8000,
+                      file_count=10000),
+}
+
+class SyntheticFork(typing.NamedTuple):
+    """URLs of a generated fork"""
+
+    upstream_url: str
+    downstream_url: str
+
+def _git(cwd: pathlib.Path, *args: str) -> str:
+    return subprocess.run(['git', *args], cwd=cwd, check=True,
+                          capture_output=True, text=True).stdout
+
+def _import_with_marks(repo_dir: pathlib.Path,
+                       branch: str,
+                       commits: typing.List[typing.Tuple[str, typing.Dict[str, str]]],
+                       start_time: int) -> typing.List[str]:
+    """Import commits and return their SHAs"""
+    fast_import_commits(repo_dir, branch, commits, start_time=start_time,
+                        from_ref=f'refs/heads/{branch}^0' if _branch_exists(repo_dir, branch)
+                        else None)
+    return _git(repo_dir, 'rev-list', '--reverse', f'-{len(commits)}', branch).split()
+
+def _branch_exists(repo_dir: pathlib.Path, branch: str) -> bool:
+    return subprocess.run(['git', 'rev-parse', '--verify', '--quiet', f'refs/heads/{branch}'],
+                          cwd=repo_dir, capture_output=True, check=False).returncode == 0
+
+def _upstream_commit(generator: random.Random, spec: ForkSpec, index: int):
+    subsystem = SUBSYSTEMS[index % len(SUBSYSTEMS)]
+    path = f'{subsystem.lower()}/file_{generator.randrange(spec.file_count)}.c'
+    title = f'{subsystem}: upstream change {index}'
+    message = f'{title}\n\nDescription of change {index}.\n\nSigned-off-by: Upstream Dev\n'
+    return title, message, path
+
+def _padded(text: str, padding: random.Random, spec: ForkSpec) -> str:
+    if not spec.blob_size:
+        return text
+    return f'{text}/* {padding.randbytes(spec.blob_size // 2).hex()} */\n'
+
+def create_fork(directory: pathlib.Path, spec: ForkSpec = ForkSpec()) -> SyntheticFork:
+    """Create an upstream and a downstream repository
+
+    Args:
+        directory: An empty directory to create the repositories in
+        spec (ForkSpec): The shape of the fork
+
+    Returns:
+        SyntheticFork: The file:// URLs of the repositories
+    """
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    work = directory / 'work'
+    _git(directory, 'init', '--quiet', str(work))
+    generator = random.Random(spec.seed)
+    padding = random.Random(spec.seed)
+    start_time = 1700000000
+
+    # Shared history up to the merge base
+    base = []
+    for index in range(spec.base_commits):
+        path = f'{SUBSYSTEMS[index % len(SUBSYSTEMS)].lower()}/file_{index % spec.file_count}.c'
+        base.append((f'base: commit {index}\n', {path: _padded(f'/* base {index} */\n', padding, spec)}))
+    _import_with_marks(work, 'upstream', base, start_time)
+    _git(work, 'branch', 'downstream', 'upstream')
+
+    # Upstream commits after the merge base
+    upstream = [_upstream_commit(generator, spec, index)
+                for index in range(spec.upstream_commits)]
+    upstream_shas = _import_with_marks(
+        work, 'upstream',
+        [(message, {path: _padded(f'/* upstream {index} */\n', padding, spec)})
+         for index, (_, message, path) in enumerate(upstream)],
+        start_time + spec.base_commits * 60)
+
+    # Downstream commits after the merge base
+    picked = generator.sample(range(spec.upstream_commits),
+                              min(spec.upstream_commits,
+                                  int(spec.downstream_commits *
+                                      (spec.fromtree_ratio + spec.fromlist_ratio))))
+    downstream = []
+    titles = []
+    for index in range(spec.downstream_commits):
+        kind = generator.random()
+        if kind < spec.fromtree_ratio and picked:
+            upstream_index = picked.pop()
+            title, message, path = upstream[upstream_index]
+            title = f'[nrf fromtree] {title}'
+            message = (f'[nrf fromtree] {message}\n'
+                       f'(cherry picked from commit {upstream_shas[upstream_index]})\n')
+            files = {path: f'/* upstream {upstream_index} */\n'}
+        elif kind < spec.fromtree_ratio + spec.fromlist_ratio and picked:
+            upstream_index = picked.pop()
+            title, message, path = upstream[upstream_index]
+            if generator.random() < 0.5:
+                # Not merged upstream yet, or merged with another title
+                title = f'{title} (v{generator.randrange(2, 5)})'
+            title = f'[nrf fromlist] {title}'
+            message = (f'{title}\n\nDescription.\n\n'
+                       f'Upstream PR #: {10000 + upstream_index}\n\n'
+                       f'Signed-off-by: Downstream Dev\n')
+            files = {path: f'/* upstream {upstream_index} from PR */\n'}
+        else:
+            if generator.random() < spec.conflict_ratio:
+                # Also changed upstream, which results in conflicts
+                path = upstream[generator.randrange(spec.upstream_commits)][2]
+            else:
+                path = f'nrf/noup_{index}.c'
+            title = f'[nrf noup] downstream change {index}'
+            message = f'{title}\n\nSigned-off-by: Downstream Dev\n'
+            files = {path: f'/* downstream {index} */\n'}
+        titles.append(title)
+        downstream.append((message, files))
+    downstream_start_time = start_time + (spec.base_commits + spec.upstream_commits) * 60
+    downstream_shas = _import_with_marks(work, 'downstream', downstream, downstream_start_time)
+
+    # Reverts of downstream commits
+    reverted = generator.sample(range(spec.downstream_commits),
+                                int(spec.downstream_commits * spec.revert_ratio))
+    reverts = [(f'Revert "{titles[index]}"\n\nThis reverts commit {downstream_shas[index]}.\n',
+                {f'nrf/revert_{index}.c': f'/* revert {index} */\n'})
+               for index in reverted]
+    if reverts:
+        _import_with_marks(work, 'downstream', reverts,
+                           downstream_start_time + spec.downstream_commits * 60)
+
+    urls = []
+    for name, branch in (('upstream.git', 'upstream'), ('downstream.git', 'downstream')):
+        bare = directory / name
+        _git(directory, 'init', '--quiet', '--bare', str(bare))
+        # Allows partial clones
+        _git(bare, 'config', 'uploadpack.allowFilter', 'true')
+        _git(work, 'push', '--quiet', str(bare), f'{branch}:refs/heads/main')
+        urls.append(bare.resolve().as_uri())
+
+    return SyntheticFork(*urls)
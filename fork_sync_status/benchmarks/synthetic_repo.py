@@ -0,0 +1,87 @@
+"""Generate synthetic git repositories for benchmarks
+
+The repositories are written with git fast-import, which makes it
+possible to create tens of thousands of commits in seconds.
+"""
+
+import pathlib
+import subprocess
+import typing
+import git
+
+AUTHORS = [
+    ('Jane Doe', 'jane.doe@example.com'),
+    ('John Smith', 'john.smith@example.com'),
+    ('Kari Nordmann', 'kari.nordmann@example.com'),
+    ('Ola Nordmann', 'ola.nordmann@example.com'),
+]
+
+SUBSYSTEMS = ['Bluetooth', 'drivers', 'kernel', 'net', 'boards', 'tests']
+
+def _data(text: str) -> bytes:
+    payload = text.encode()
+    return b'data %d\n' % len(payload) + payload + b'\n'
+
+def fast_import_commits(repo_dir: pathlib.Path,
+                        branch: str,
+                        commits: typing.Iterable[typing.Tuple[str, typing.Dict[str, str]]],
+                        start_time: int = 1700000000,
+                        from_ref: typing.Optional[str] = None):
+    """Append commits to a branch using git fast-import
+
+    Args:
+        repo_dir: The repository
+        branch (str): The branch the commits are added to
+        commits: Tuples of (commit message, {path: new file content})
+        start_time (int): Timestamp of the first commit. Each following
+            commit is one minute younger.
+        from_ref (str): Commit to start the branch from, if it does not
+            exist yet
+    """
+    process = subprocess.Popen(['git', 'fast-import', '--quiet'],
+                               cwd=repo_dir, stdin=subprocess.PIPE)
+    stream = process.stdin
+    for index, (message, files) in enumerate(commits):
+        name, email = AUTHORS[index % len(AUTHORS)]
+        timestamp = start_time + index * 60
+        stream.write(f'commit refs/heads/{branch}\n'.encode())
+        stream.write(f'author {name} <{email}> {timestamp} +0000\n'.encode())
+        stream.write(f'committer {name} <{email}> {timestamp} +0000\n'.encode())
+        stream.write(_data(message))
+        if index == 0 and from_ref:
+            stream.write(f'from {from_ref}\n'.encode())
+        for path, content in files.items():
+            stream.write(f'M 100644 inline {path}\n'.encode())
+            stream.write(_data(content))
+        stream.write(b'\n')
+    stream.close()
+    if process.wait() != 0:
+        raise RuntimeError('git fast-import failed')
+
+def create_linear_repo(repo_dir: pathlib.Path,
+                       commit_count: int,
+                       file_count: int = 256) -> git.Repo:
+    """Create a repository with a linear history on the main branch
+
+    Args:
+        repo_dir: Where to create the repository
+        commit_count (int): The number of commits
+        file_count (int): The number of files touched by the commits
+
+    Returns:
+        git.Repo: The repository
+    """
+    repo = git.Repo.init(repo_dir, initial_branch='main')
+
+    def commits():
+        for index in range(commit_count):
+            subsystem = SUBSYSTEMS[index % len(SUBSYSTEMS)]
+            message = (f'{subsystem}: change number {index}\n\n'
+                       f'Some longer description of change {index}.\n\n'
+                       f'Signed-off-by: {AUTHORS[index % len(AUTHORS)][0]}\n')
+            path = f'{subsystem.lower()}/file_{index % file_count}.c'
+            yield message, {path: f'/* revision {index} */\n'}
+
+    fast_import_commits(repo_dir, 'main', commits())
+
+    return repo
@@ -1,16 +1,38 @@
 """Cherry-pick commits from upstream to downstream
+
+The picked commits are created without a worktree: the changes of each
+commit are merged with git merge-tree (see merge_tree.CherryPicker) and
+the commit is written with git commit-tree, with its final message. The
+branch is only created, and checked out, once all the commits were
+picked, so a conflict never leaves a half-applied branch behind.
+
+Merge commits and root commits cannot be picked, as there is no single
+parent to take their changes from.
 """
 
 import os
 import argparse
 import pathlib
 import logging
+import sys
 import typing
 import datetime
 import git
 
+import merge_tree
+
 USER_REMOTE = 'user_remote'
 
+class PickResult(typing.NamedTuple):
+    """The outcome of cherry-picking a single commit"""
+
+    sha: str
+    # The picked commit, None if there were conflicts or it was empty
+    new_sha: typing.Optional[str] = None
+    conflicting_paths: typing.Tuple[str, ...] = ()
+    # The changes are there already, so no commit was created
+    empty: bool = False
+
 def clone_repo_with_remote(local_dir: pathlib.Path,
                            repo_url: str,
                            remote_name: str) -> git.Repo:
@@ -104,12 +126,106 @@ def get_commits_from_input(repo: git.Repo,
         logging.error("Invalid commit provided: %s", e)
         raise e
 
+def picked_commit_message(commit: git.Commit, title_prefix: str) -> str:
+    """The message of a picked commit
+
+    Like git cherry-pick -x, a line referring to the original commit is
+    appended, unless the message has it already.
+
+    Args:
+        commit (git.Commit): The commit to be cherry-picked
+        title_prefix (str): Prefix of the title, e.g. '[nrf fromtree] '
+
+    Returns:
+        str: The message
+    """
+    message = commit.message
+    if not message.endswith('\n'):
+        message += '\n'
+
+    trailer = f'(cherry picked from commit {commit})'
+    if trailer not in message:
+        message += f'{trailer}\n'
+
+    return title_prefix + message
+
+def _author_env(commit: git.Commit) -> typing.Dict[str, str]:
+    """Environment preserving the author of a commit in git commit-tree"""
+    return {
+        'GIT_AUTHOR_NAME': commit.author.name,
+        'GIT_AUTHOR_EMAIL': commit.author.email,
+        'GIT_AUTHOR_DATE': f'{commit.authored_date} '
+                           f'{git.objects.util.altz_to_utctz_str(commit.author_tz_offset)}',
+    }
+
+def pick_commits(repo: git.Repo,
+                 onto: git.Commit,
+                 commits: typing.List[git.Commit],
+                 title_prefix: str = '',
+                 backend: str = 'auto') -> typing.List[PickResult]:
+    """Cherry-pick commits one after another, without a worktree
+
+    No ref is updated: the picked commits are only reachable from the
+    returned results. Commits whose changes are there already are
+    dropped. A commit that conflicts is skipped, and the next
+    commits are picked on top of the last clean one, so that all the
+    conflicts are reported at once. Conflicts after the first one may
+    be caused by the skipped commits.
+
+    Args:
+        repo (git.Repo): The git repo
+        onto (git.Commit): The commit to pick the commits onto
+        commits: The commits to be cherry-picked, in order
+        title_prefix (str): Prefix of the titles of the picked commits
+        backend (str): One of merge_tree.MERGE_TREE_BACKENDS
+
+    Returns:
+        list: The outcome for each commit
+
+    Raises:
+        ValueError: If one of the commits is a merge or a root commit
+    """
+    for commit in commits:
+        if len(commit.parents) != 1:
+            raise ValueError(f"Cannot cherry-pick {commit}, it is a "
+                             f"{'merge' if commit.parents else 'root'} commit")
+
+    backend = merge_tree.resolve_backend(repo, backend)
+    head = str(onto)
+    head_tree = str(onto.tree)
+
+    results = []
+    with merge_tree.CherryPicker(repo.git_dir, backend) as picker:
+        for commit in commits:
+            merge = picker.cherry_pick(head, str(commit), str(commit.parents[0]))
+            if not merge.clean:
+                logging.warning("Cherry-picking %s conflicts in %s", commit,
+                                ', '.join(merge.conflicting_paths) or 'unknown paths')
+                results.append(PickResult(str(commit), None, merge.conflicting_paths))
+                continue
+            if merge.tree == head_tree:
+                logging.warning("Dropping %s, its changes were applied already", commit)
+                results.append(PickResult(str(commit), empty=True))
+                continue
+
+            head_tree = merge.tree
+            head = repo.git.commit_tree(merge.tree, '-p', head,
+                                        '-m', picked_commit_message(commit, title_prefix),
+                                        env=_author_env(commit))
+            results.append(PickResult(str(commit), head))
+
+    return results
+
 def main():
     """Main function of this script"""
     logging.getLogger().setLevel('INFO')
 
     parser = argparse.ArgumentParser(
         prog="Cherry-pick commits from upstream",
+        description="The commits are picked onto the main branch of the downstream "
+                    "remote. If all of them apply, they are put on a new branch named "
+                    "cherry_pick_<date>, which is checked out. Otherwise, the conflicts "
+                    "are listed and no branch is created.",
     )
     parser.add_argument('--user', required=True)
     parser.add_argument('--upstream', required=True)
@@ -126,6 +242,10 @@ def main():
     parser.add_argument('--refetch-remote',
                         default=False,
                         action='store_true')
+    parser.add_argument('--merge-tree-backend',
+                        choices=merge_tree.MERGE_TREE_BACKENDS,
+                        default='auto',
+                        help='How the commits are merged, see merge_tree.py')
     args = parser.parse_args()
     
     cherry_pick_branch = 'cherry_pick_' + str(datetime.datetime.now().strftime("%Y_%m_%d__%H_%M"))
@@ -138,18 +258,26 @@ def main():
 
     first_commit = repo.remotes[args.downstream_remote].refs['main'].commit
 
-    repo.head.reference = repo.create_head(path=cherry_pick_branch, commit=first_commit, force=True)
+    try:
+        results = pick_commits(repo, first_commit, commits, args.new_commit_title_prefix,
+                               args.merge_tree_backend)
+    except ValueError as e:
+        logging.error("%s", e)
+        sys.exit(1)
+
+    conflicts = [result for result in results if not result.new_sha and not result.empty]
+    if conflicts:
+        logging.error("%d of %d commits could not be cherry-picked, %s was not created",
+                      len(conflicts), len(results), cherry_pick_branch)
+        for result in conflicts:
+            print(f"{result.sha}: {' '.join(result.conflicting_paths)}")
+        sys.exit(1)
+
+    picked = [result.new_sha for result in results if result.new_sha]
+    new_head = picked[-1] if picked else str(first_commit)
+    repo.head.reference = repo.create_head(path=cherry_pick_branch, commit=new_head, force=True)
     repo.head.reset(index=True, working_tree=True)
-    
-    for commit in commits:
-        # May fail in case of conflicts
-        repo.git.cherry_pick(commit, '-x')
-        
-        # Replace commit title
-        new_commit_message = ''.join([args.new_commit_title_prefix,
-                                      commit.message,
-                                      f'(cherry picked from commit {commit})'])
-        repo.git.commit('--amend', '-m', new_commit_message)
+    logging.info("Created and checked out %s with %d commits", cherry_pick_branch, len(picked))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,391 @@
+"""Simulate cherry-picking a series of commits
+
+Checking every upstream commit on its own against the merge base does
+not tell if the commits still apply when picked one after another. Here,
+each commit is applied on top of the result of the previous ones, in
+memory, to find the longest prefix of the series that applies cleanly
+and the first commit that conflicts.
+
+No worktree is used: with git 2.40 or newer, the merges are done by a
+git merge-tree --write-tree --stdin process, and the intermediate
+results are turned into throwaway commits with git commit-tree. With
+older versions, the trees are merged in a private index.
+
+Commits that touch disjoint sets of paths do not affect each other, so
+the series can be split in independent groups which are simulated in
+parallel.
+
+Example:
+    python cherry_pick_series.py --clone-dir repo --input-file data/data.json
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+import subprocess
+import typing
+import git
+
+import merge_tree
+import sync_data_io
+
+# Identity of the intermediate commits, which are never referenced
+SIMULATION_ENV = {
+    'GIT_AUTHOR_NAME': 'cherry-pick simulation',
+    'GIT_AUTHOR_EMAIL': 'simulation@localhost',
+    'GIT_COMMITTER_NAME': 'cherry-pick simulation',
+    'GIT_COMMITTER_EMAIL': 'simulation@localhost',
+}
+
+class SeriesResult(typing.NamedTuple):
+    """The outcome of applying a series of commits in order"""
+
+    # Length of the longest prefix of the series that applies cleanly
+    clean_count: int
+    commit_count: int
+    first_conflict_sha: typing.Optional[str] = None
+    conflicting_paths: typing.Tuple[str, ...] = ()
+    # The tree resulting from the clean prefix
+    tree: typing.Optional[str] = None
+
+    def to_dict(self) -> dict:
+        """Returns a dictionary representation, without the tree"""
+        representation = {
+            'clean_count': self.clean_count,
+            'commit_count': self.commit_count,
+        }
+        if self.first_conflict_sha:
+            representation['first_conflict_sha'] = self.first_conflict_sha
+            representation['conflicting_paths'] = list(self.conflicting_paths)
+        return representation
+
+class SeriesSimulator:
+    """Applies series of commits without a worktree
+
+    Use it as a context manager, or call close().
+    """
+
+    def __init__(self, git_dir: str, backend: str):
+        """
+        Args:
+            git_dir (str): The git directory of the repo
+            backend (str): Either 'batch' or 'legacy', see merge_tree.resolve_backend()
+        """
+        self._repo = git.Repo(git_dir)
+        self._picker = merge_tree.CherryPicker(git_dir, backend)
+        self._backend = backend
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Terminate the git process or remove the index file"""
+        self._picker.close()
+
+    def simulate(self,
+                 base_sha: str,
+                 commit_and_parent_shas: typing.List[typing.Tuple[str, str]]) -> SeriesResult:
+        """Apply commits one after another until one of them conflicts
+
+        With the batch backend, the result of every step is written as a
+        commit, since git merge-tree only merges commits. These commits
+        are not referenced and stay loose in the object database until
+        git gc prunes them.
+
+        Args:
+            base_sha (str): The commit to apply the series to
+            commit_and_parent_shas: The commits, in the order they are
+                applied, along with their first parent
+
+        Returns:
+            SeriesResult: The outcome
+        """
+        onto = base_sha
+        tree = None
+        for index, (sha, parent_sha) in enumerate(commit_and_parent_shas):
+            result = self._picker.cherry_pick(onto, sha, parent_sha)
+            if not result.clean:
+                return SeriesResult(index, len(commit_and_parent_shas), sha,
+                                    result.conflicting_paths, tree)
+
+            tree = result.tree
+            if self._backend == 'batch':
+                # git merge-tree only merges commits
+                onto = self._repo.git.commit_tree(tree, '-p', onto, '-m', f'Pick {sha}',
+                                                  env=SIMULATION_ENV)
+            else:
+                onto = tree
+
+        return SeriesResult(len(commit_and_parent_shas), len(commit_and_parent_shas),
+                            tree=tree)
+
+def changed_paths(repo: git.Repo,
+                  commit_and_parent_shas: typing.List[typing.Tuple[str, str]]) \
+                      -> typing.List[typing.Tuple[str, ...]]:
+    """The paths changed by each commit compared to the given parent
+
+    A single git diff-tree process is used for all commits.
+
+    Args:
+        repo (git.Repo): The git repo
+        commit_and_parent_shas: The commits along with their first parent
+
+    Returns:
+        list: The changed paths of each commit, in the same order
+    """
+    if not commit_and_parent_shas:
+        return []
+
+    output = _git_stdin(repo, ['diff-tree', '--stdin', '-r', '--name-only', '-z', '--always'],
+                        [f'{sha} {parent_sha}' for sha, parent_sha in commit_and_parent_shas])
+    tokens = output.split('\0')
+
+    # Every commit is introduced by its SHA, followed by its paths
+    paths = []
+    for token in tokens:
+        if len(paths) < len(commit_and_parent_shas) and \
+                token == commit_and_parent_shas[len(paths)][0]:
+            paths.append([])
+        elif token:
+            paths[-1].append(token)
+
+    return [tuple(commit_paths) for commit_paths in paths]
+
+def with_first_parents(repo: git.Repo,
+                       shas: typing.List[str]) -> typing.List[typing.Tuple[str, str]]:
+    """Look up the first parent of commits with a single git process
+
+    Args:
+        repo (git.Repo): The git repo
+        shas: The commits
+
+    Returns:
+        list: The commits along with their first parent, in the same order
+    """
+    if not shas:
+        return []
+
+    output = _git_stdin(repo, ['rev-list', '--no-walk=unsorted', '--parents', '--stdin'], shas)
+    return [tuple(line.split()[:2]) for line in output.splitlines()]
+
+def _git_stdin(repo: git.Repo, args: typing.List[str], lines: typing.List[str]) -> str:
+    return subprocess.run(['git', '--git-dir', repo.git_dir, *args],
+                          input=''.join(f'{line}\n' for line in lines),
+                          capture_output=True, check=True, text=True,
+                          errors='surrogateescape').stdout
+
+def group_independent(paths_per_commit: typing.List[typing.Tuple[str, ...]]) \
+        -> typing.List[typing.List[int]]:
+    """Group commits which touch overlapping sets of paths
+
+    Commits are in the same group if they change a common path, or if a
+    path changed by one is a directory containing a path changed by the
+    other, as when a file is replaced by a directory, directly or through
+    other commits of the group. Commits of different groups can be
+    applied in any order relative to each other, apart from renames,
+    which are not detected by the merges anyway.
+
+    Args:
+        paths_per_commit: The changed paths of each commit
+
+    Returns:
+        list: The indices of the commits of each group, in ascending
+        order. The groups are ordered by their first commit.
+    """
+    parents = list(range(len(paths_per_commit)))
+
+    def find(index):
+        while parents[index] != index:
+            parents[index] = parents[parents[index]]
+            index = parents[index]
+        return index
+
+    def union(index, other):
+        root, other_root = find(index), find(other)
+        if root != other_root:
+            # The group is represented by its first commit
+            parents[max(root, other_root)] = min(root, other_root)
+
+    first_commit_by_path = {}
+    # The commits changing paths below each directory. Once they are
+    # grouped with a commit changing the directory itself, only that
+    # commit is kept.
+    commits_by_directory = {}
+    for index, paths in enumerate(paths_per_commit):
+        for path in paths:
+            union(index, first_commit_by_path.setdefault(path, index))
+            if path in commits_by_directory:
+                for other in commits_by_directory[path]:
+                    union(index, other)
+                commits_by_directory[path] = [index]
+
+            directory = path.rpartition('/')[0]
+            while directory:
+                if directory in first_commit_by_path:
+                    union(index, first_commit_by_path[directory])
+                commits = commits_by_directory.setdefault(directory, [])
+                if not commits or commits[-1] != index:
+                    commits.append(index)
+                directory = directory.rpartition('/')[0]
+
+    groups = {}
+    for index in range(len(paths_per_commit)):
+        groups.setdefault(find(index), []).append(index)
+
+    return list(groups.values())
+
+def _simulate_group(git_dir: str,
+                    base_sha: str,
+                    commit_and_parent_shas: typing.List[typing.Tuple[str, str]],
+                    backend: str) -> SeriesResult:
+    """Simulate a series in a worker
+
+    Only plain strings are passed in so that the job can be sent to
+    a worker process.
+    """
+    with SeriesSimulator(git_dir, backend) as simulator:
+        return simulator.simulate(base_sha, commit_and_parent_shas)
+
+def simulate_series(repo: git.Repo,
+                    base_commit: str,
+                    commit_and_parent_shas: typing.List[typing.Tuple[str, str]],
+                    executor: typing.Optional[concurrent.futures.Executor] = None,
+                    backend: str = 'auto') \
+                        -> typing.Tuple[SeriesResult, typing.List[SeriesResult]]:
+    """Simulate cherry-picking commits in order onto a base commit
+
+    The commits are split in independent groups, each simulated on its
+    own. The clean prefix of the whole series ends with the first commit
+    that conflicts in any of the groups, as the groups do not affect
+    each other. Commits after it may still apply, which the results of
+    the groups tell.
+
+    Args:
+        repo (git.Repo): The git repo
+        base_commit: The commit to apply the series to
+        commit_and_parent_shas: The commits, oldest first, along with their first parent
+        executor: The executor to run the groups on. They run serially if None.
+        backend (str): One of merge_tree.MERGE_TREE_BACKENDS
+
+    Returns:
+        tuple: The result of the whole series, without a tree unless there
+        is only one group, and the result of each group
+    """
+    backend = merge_tree.resolve_backend(repo, backend)
+    jobs = list(commit_and_parent_shas)
+    groups = group_independent(changed_paths(repo, jobs))
+    group_jobs = [[jobs[index] for index in group] for group in groups]
+
+    map_function = executor.map if executor else map
+    group_results = list(map_function(_simulate_group,
+                                      [repo.git_dir] * len(groups),
+                                      [str(base_commit)] * len(groups),
+                                      group_jobs,
+                                      [backend] * len(groups)))
+
+    if len(group_results) == 1:
+        return group_results[0], group_results
+
+    first_conflict = None
+    for group, result in zip(groups, group_results):
+        if result.first_conflict_sha:
+            index = group[result.clean_count]
+            if first_conflict is None or index < first_conflict[0]:
+                first_conflict = (index, result)
+
+    if first_conflict is None:
+        return SeriesResult(len(jobs), len(jobs)), group_results
+
+    index, result = first_conflict
+    return SeriesResult(index, len(jobs), result.first_conflict_sha,
+                        result.conflicting_paths), group_results
+
+def upstream_only_commits(fork_sync_data: dict) -> typing.List[str]:
+    """The upstream commits missing downstream, oldest first
+
+    Args:
+        fork_sync_data (dict): The fork sync data of one downstream revision
+
+    Returns:
+        list: The SHAs of the commits
+    """
+    return [item['sha'] for item in reversed(fork_sync_data['upstream_commits'])
+            if not item.get('downstream_sha') and not item.get('downstream_sha_guess')]
+
+def main():
+    """Main function of this script"""
+    logging.getLogger().setLevel('INFO')
+
+    parser = argparse.ArgumentParser(
+        prog="Simulate cherry-picking a series of commits",
+    )
+    parser.add_argument('--clone-dir',
+                        type=pathlib.Path,
+                        default='repo',
+                        help='The repo created by fork_sync_data.py')
+    parser.add_argument('--input-file',
+                        type=pathlib.Path,
+                        help='Fork sync data. Its upstream-only commits are applied '
+                             'onto its merge base.')
+    parser.add_argument('--downstream-rev',
+                        help='The downstream revision to use when --input-file has '
+                             'several. Defaults to the first one.')
+    parser.add_argument('--commits',
+                        help='Commits to apply, oldest first, separated by ";". '
+                             'Used instead of the commits of --input-file.')
+    parser.add_argument('--base',
+                        help='The commit to apply the commits to. Defaults to the merge '
+                             'base of --input-file.')
+    parser.add_argument('--merge-tree-backend',
+                        choices=merge_tree.MERGE_TREE_BACKENDS,
+                        default='auto')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='Number of groups of commits simulated in parallel')
+    args = parser.parse_args()
+
+    repo = git.Repo(args.clone_dir)
+
+    base = args.base
+    if args.commits:
+        shas = [repo.git.rev_parse('--verify', f'{ref.strip()}^{{commit}}')
+                for ref in args.commits.split(';')]
+    elif args.input_file:
+        data = sync_data_io.load_sync_data(args.input_file)
+        if sync_data_io.BRANCHES_KEY in data:
+            branches = data[sync_data_io.BRANCHES_KEY]
+            data = branches[args.downstream_rev or next(iter(branches))]
+        shas = upstream_only_commits(data)
+        base = base or data['merge_base']['sha']
+    else:
+        parser.error('--input-file or --commits is required')
+    if not base:
+        parser.error('--base is required with --commits')
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) \
+        if args.jobs > 1 else None
+    try:
+        result, group_results = simulate_series(repo, repo.commit(base),
+                                                with_first_parents(repo, shas), executor,
+                                                args.merge_tree_backend)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    logging.info("%d of %d commits apply cleanly in order, in %d independent groups",
+                 result.clean_count, result.commit_count, len(group_results))
+    print(json.dumps({
+        **result.to_dict(),
+        'groups': [group_result.to_dict() for group_result in group_results],
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Read commits in bulk with git log
+
+A single git log process is used for a whole revision range. Its output
+is parsed while it is being produced, into lightweight commit records
+that provide the subset of the git.Commit interface used by CommitRepr.
+"""
+
+import subprocess
+import typing
+import git
+
+# Fields are separated by NUL. With -z, every commit is terminated by NUL
+# as well, which is safe as NUL cannot be part of a commit message.
+LOG_FORMAT = '%H%x00%P%x00%an%x00%ae%x00%at%x00%ct%x00%B'
+LOG_FIELD_COUNT = 7
+
+class LogActor(typing.NamedTuple):
+    """Author of a commit"""
+
+    name: str
+    email: str
+
+class LogCommit:
+    """A commit as read from git log"""
+
+    __slots__ = ('hexsha', 'parents', 'author', 'authored_date',
+                 'committed_date', 'message')
+
+    def __init__(self,
+                 hexsha: str,
+                 parents: typing.Tuple[str, ...],
+                 author: LogActor,
+                 authored_date: int,
+                 committed_date: int,
+                 message: str):
+        self.hexsha = hexsha
+        self.parents = parents
+        self.author = author
+        self.authored_date = authored_date
+        self.committed_date = committed_date
+        self.message = message
+
+    def __str__(self) -> str:
+        return self.hexsha
+
+    def __repr__(self) -> str:
+        return f'<LogCommit "{self.hexsha}">'
+
+    def __eq__(self, other) -> bool:
+        return str(self) == str(other)
+
+    def __hash__(self) -> int:
+        return hash(self.hexsha)
+
+    @property
+    def summary(self) -> str:
+        """The first line of the commit message"""
+        return self.message.split('\n', 1)[0]
+
+def iter_nul_terminated(stream: typing.BinaryIO,
+                         chunk_size: int = 1 << 16) -> typing.Iterator[bytes]:
+    """Split a stream in NUL terminated tokens while it is being read"""
+    remainder = b''
+    while True:
+        chunk = stream.read1(chunk_size)
+        if not chunk:
+            break
+
+        tokens = (remainder + chunk).split(b'\0')
+        remainder = tokens.pop()
+        yield from tokens
+
+    if remainder:
+        yield remainder
+
+def log_commit_from_fields(fields: typing.List[str]) -> LogCommit:
+    """Create a commit record from the LOG_FIELD_COUNT fields of LOG_FORMAT"""
+    sha, parents, author_name, author_email, authored_date, committed_date, message = fields
+    return LogCommit(sha,
+                     tuple(parents.split()),
+                     LogActor(author_name, author_email),
+                     int(authored_date),
+                     int(committed_date),
+                     message)
+
+def parse_log_stream(stream: typing.BinaryIO) -> typing.Iterator[LogCommit]:
+    """Parse the output of git log --format=LOG_FORMAT -z
+
+    Args:
+        stream: The output of git log
+
+    Yields:
+        LogCommit: The commits, in the order they were printed
+    """
+    fields = []
+    for token in iter_nul_terminated(stream):
+        fields.append(token.decode('utf-8', errors='replace'))
+        if len(fields) < LOG_FIELD_COUNT:
+            continue
+
+        yield log_commit_from_fields(fields)
+        fields = []
+
+def iter_log_commits(repo: git.Repo,
+                     rev: typing.Union[str, typing.List[str]]) -> typing.Iterator[LogCommit]:
+    """Iterate over the commits of a revision range with a single git log
+
+    The commits are listed in the same order as git.Repo.iter_commits()
+    lists them.
+
+    Args:
+        repo (git.Repo): The git repo
+        rev: The revision range, e.g. 'base..tip', or a list of revisions
+
+    Yields:
+        LogCommit: The commits
+    """
+    revs = [rev] if isinstance(rev, str) else list(rev)
+    process = subprocess.Popen(
+        ['git', '--git-dir', repo.git_dir, 'log', '-z', f'--format={LOG_FORMAT}',
+         *revs, '--'],
+        stdout=subprocess.PIPE)
+    try:
+        yield from parse_log_stream(process.stdout)
+    finally:
+        process.stdout.close()
+        if process.wait() not in (0, -13):
+            raise git.GitCommandError(['git', 'log', *revs], process.returncode)
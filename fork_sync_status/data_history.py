@@ -0,0 +1,125 @@
+"""Read the historical versions of the fork sync data from git
+
+Every version of data/data.json is read straight from the object
+database. The commits are listed by a single git log and the file
+contents are streamed by a single git cat-file --batch process, so no
+commit has to be checked out.
+"""
+
+import subprocess
+import threading
+import typing
+
+DEFAULT_DATA_PATH = 'fork_sync_status/data/data.json'
+
+# Title prefix of the commits made by the update_zephyr_fork_state workflow
+AUTO_COMMIT_PREFIX = '(auto'
+
+class DataVersion(typing.NamedTuple):
+    """A version of the data file"""
+
+    commit_sha: str
+    title: str
+    content: bytes
+
+def list_commits(repo_dir: str,
+                 rev_range: str,
+                 title_prefix: typing.Optional[str] = AUTO_COMMIT_PREFIX) \
+                     -> typing.List[typing.Tuple[str, str]]:
+    """List the commits of a range, oldest first
+
+    Args:
+        repo_dir (str): The directory of the git repo
+        rev_range (str): The revision range, e.g. 'abc123..HEAD'
+        title_prefix (str): Only list the commits whose title starts with
+            this prefix. All commits are listed if None.
+
+    Returns:
+        list: (SHA, title) of each commit
+    """
+    output = subprocess.run(
+        ['git', '-C', repo_dir, 'log', '--reverse', '-z', '--format=%H %s', rev_range, '--'],
+        check=True, capture_output=True, text=True).stdout
+
+    commits = []
+    for line in output.split('\0'):
+        if not line:
+            continue
+        sha, _, title = line.partition(' ')
+        if title_prefix is None or title.startswith(title_prefix):
+            commits.append((sha, title))
+
+    return commits
+
+def _read_exactly(stream: typing.BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise EOFError('git cat-file terminated unexpectedly')
+    return data
+
+def iter_file_versions(repo_dir: str,
+                       commits: typing.List[typing.Tuple[str, str]],
+                       path: str = DEFAULT_DATA_PATH) -> typing.Iterator[DataVersion]:
+    """Read a file as it was in each of the commits
+
+    The requests are written from a separate thread so that neither side
+    of the pipe can fill up and block the other one. Commits in which the
+    file does not exist are skipped.
+
+    Args:
+        repo_dir (str): The directory of the git repo
+        commits: (SHA, title) of the commits, as returned by list_commits()
+        path (str): The path of the file, relative to the root of the repo
+
+    Yields:
+        DataVersion: The content of the file in each commit, in input order
+    """
+    process = subprocess.Popen(['git', '-C', repo_dir, 'cat-file', '--batch'],
+                               stdin=subprocess.PIPE,
+                               stdout=subprocess.PIPE)
+
+    def feed():
+        try:
+            for sha, _ in commits:
+                process.stdin.write(f'{sha}:{path}\n'.encode())
+            process.stdin.close()
+        except BrokenPipeError:
+            # The reader stopped early
+            pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        for sha, title in commits:
+            header = process.stdout.readline().split()
+            if not header:
+                raise EOFError('git cat-file terminated unexpectedly')
+            if header[-1] == b'missing':
+                continue
+
+            size = int(header[2])
+            content = _read_exactly(process.stdout, size)
+            _read_exactly(process.stdout, 1) # Trailing newline
+            yield DataVersion(sha, title, content)
+    finally:
+        process.stdout.close()
+        feeder.join()
+        process.wait()
+
+def iter_data_versions(repo_dir: str,
+                       rev_range: str,
+                       path: str = DEFAULT_DATA_PATH,
+                       title_prefix: typing.Optional[str] = AUTO_COMMIT_PREFIX) \
+                           -> typing.Iterator[DataVersion]:
+    """Read every version of the data file committed in a range
+
+    Args:
+        repo_dir (str): The directory of the git repo
+        rev_range (str): The revision range, e.g. 'abc123..HEAD'
+        path (str): The path of the data file, relative to the root of the repo
+        title_prefix (str): Only read the commits whose title starts with this prefix
+
+    Yields:
+        DataVersion: The versions of the file, oldest first
+    """
+    return iter_file_versions(repo_dir, list_commits(repo_dir, rev_range, title_prefix), path)
@@ -0,0 +1,225 @@
+"""Cloning and fetching the repositories to analyze
+
+Only the branches being analyzed are fetched, without tags. Optionally,
+a partial clone without blobs is made, as the analysis mostly needs
+commits and trees. The blobs needed by the cherry-pick checks are then
+fetched in bulk with prefetch_blobs(), or on demand by git. A
+commit-graph is written after fetching, which speeds up merge-base,
+ancestry checks and revision walks.
+
+An existing clone directory is reused, so that it can be cached between
+runs and only new objects have to be fetched.
+"""
+
+import logging
+import pathlib
+import subprocess
+import typing
+import git
+
+PARTIAL_CLONE_FILTER = 'blob:none'
+
+class FetchStrategy(typing.NamedTuple):
+    """How the repositories are fetched"""
+
+    partial: bool = False
+    all_refs: bool = False
+    commit_graph: bool = True
+
+def _refspecs(remote_name: str,
+              branches: typing.Optional[typing.List[str]],
+              strategy: FetchStrategy) -> typing.List[str]:
+    if strategy.all_refs or not branches:
+        return [f'+refs/heads/*:refs/remotes/{remote_name}/*']
+    return [f'+refs/heads/{branch}:refs/remotes/{remote_name}/{branch}' for branch in branches]
+
+def configure_remote(repo: git.Repo,
+                     remote_name: str,
+                     repo_url: str,
+                     branches: typing.Optional[typing.List[str]],
+                     strategy: FetchStrategy):
+    """Create or update a remote to fetch the given branches
+
+    Refspecs configured earlier are kept, so that a cached clone keeps
+    working when branches are added.
+
+    Args:
+        repo (git.Repo): The git repo
+        remote_name (str): The local remote name
+        repo_url (str): The repo URL
+        branches: The branches to fetch. All branches are fetched if None.
+        strategy (FetchStrategy): How to fetch
+    """
+    if remote_name in repo.remotes:
+        # We do not handle the case where the remote is pointing to
+        # a different url.
+        assert repo.remotes[remote_name].url == repo_url
+    else:
+        logging.info("Adding remote named %s pointing to %s...", remote_name, repo_url)
+        repo.git.remote('add', '--no-tags', remote_name, repo_url)
+        # Replaced by the refspecs of the branches
+        repo.git.config('--unset-all', f'remote.{remote_name}.fetch')
+
+    try:
+        configured = repo.git.config('--get-all', f'remote.{remote_name}.fetch').splitlines()
+    except git.GitCommandError:
+        configured = []
+    for refspec in _refspecs(remote_name, branches, strategy):
+        if refspec not in configured:
+            repo.git.config('--add', f'remote.{remote_name}.fetch', refspec)
+
+    if strategy.partial:
+        repo.git.config(f'remote.{remote_name}.promisor', 'true')
+        repo.git.config(f'remote.{remote_name}.partialclonefilter', PARTIAL_CLONE_FILTER)
+
+def missing_branches(repo: git.Repo,
+                     remote_name: str,
+                     branches: typing.Optional[typing.List[str]]) -> typing.List[str]:
+    """The branches that were not fetched yet, e.g. into a cached clone
+
+    Args:
+        repo (git.Repo): The git repo
+        remote_name (str): The local remote name
+        branches: The branches to check
+
+    Returns:
+        list: The branches without a remote-tracking ref
+    """
+    if not branches:
+        return []
+
+    fetched = set(repo.git.for_each_ref('--format=%(refname)',
+                                        f'refs/remotes/{remote_name}/').splitlines())
+    return [branch for branch in branches
+            if f'refs/remotes/{remote_name}/{branch}' not in fetched]
+
+def fetch(repo: git.Repo,
+          remote_name: str,
+          branches: typing.Optional[typing.List[str]],
+          strategy: FetchStrategy):
+    """Fetch the given branches of a remote
+
+    Args:
+        repo (git.Repo): The git repo
+        remote_name (str): The local remote name
+        branches: The branches to fetch. All branches are fetched if None.
+        strategy (FetchStrategy): How to fetch
+    """
+    logging.info("Fetching %s from %s", ', '.join(branches or ['all branches']), remote_name)
+    repo.git.fetch(*fetch_arguments(remote_name, branches, strategy))
+
+    if strategy.commit_graph:
+        write_commit_graph(repo)
+
+def fetch_arguments(remote_name: str,
+                    branches: typing.Optional[typing.List[str]],
+                    strategy: FetchStrategy) -> typing.List[str]:
+    """The arguments of git fetch fetching the given branches of a remote"""
+    options = ['--no-tags', '--prune']
+    if strategy.partial:
+        options.append(f'--filter={PARTIAL_CLONE_FILTER}')
+    return [*options, remote_name, *_refspecs(remote_name, branches, strategy)]
+
+def write_commit_graph(repo: git.Repo):
+    """Write a commit-graph covering all the fetched commits
+
+    The graph is written incrementally, and includes changed-path
+    Bloom filters which speed up walks limited to paths.
+
+    Args:
+        repo (git.Repo): The git repo
+    """
+    repo.git.commit_graph('write', '--reachable', '--changed-paths', '--split')
+
+def clone(local_dir: pathlib.Path,
+          repo_url: str,
+          remote_name: str,
+          branches: typing.Optional[typing.List[str]],
+          strategy: FetchStrategy) -> git.Repo:
+    """Clone a repo, or reuse an existing clone
+
+    Nothing is checked out, as the analysis does not need a working tree.
+    An existing clone is only fetched if some of the branches are missing.
+
+    Args:
+        local_dir (pathlib.Path): The dir where to clone the repo
+        repo_url (str): Repo URL
+        remote_name (str): Local remote name
+        branches: The branches to fetch. All branches are fetched if None.
+        strategy (FetchStrategy): How to fetch
+
+    Returns:
+        git.Repo: The repo object
+    """
+    if pathlib.Path(local_dir).exists():
+        # Initialize repo from folder.
+        # If this fails, the folder is used by something else.
+        # We do not handle that case.
+        repo = git.Repo(local_dir)
+        configure_remote(repo, remote_name, repo_url, branches, strategy)
+        if missing_branches(repo, remote_name, branches):
+            fetch(repo, remote_name, branches, strategy)
+        return repo
+
+    logging.info("Cloning repository into %s...", local_dir)
+    repo = git.Repo.init(local_dir)
+    configure_remote(repo, remote_name, repo_url, branches, strategy)
+    fetch(repo, remote_name, branches, strategy)
+
+    return repo
+
+def _missing_objects(repo: git.Repo, *args: str) -> typing.List[str]:
+    """The objects listed by git rev-list --objects which are not in the repo"""
+    return [line[1:] for line in
+            repo.git.rev_list('--objects', '--missing=print', *args, '--').splitlines()
+            if line.startswith('?')]
+
+def prefetch_blobs(repo: git.Repo,
+                   remote_name: str,
+                   revs: typing.List[str],
+                   bases: typing.Iterable[str] = ()) -> int:
+    """Fetch the blobs of a revision range missing from a partial clone
+
+    All blobs introduced by the range are requested at once, instead of
+    git fetching them one commit at a time when they are first needed.
+    A three-way merge onto a base also needs the versions of the changed
+    paths in the base, which the range leaves out when it excludes the
+    base. Those are requested along with them.
+
+    Args:
+        repo (git.Repo): The git repo
+        remote_name (str): The remote the commits were fetched from
+        revs: The revisions to pass to git rev-list, e.g. ['tip', '^base']
+        bases: Commits whose versions of the paths changed by the range are needed
+
+    Returns:
+        int: The number of blobs that were fetched
+    """
+    missing = dict.fromkeys(_missing_objects(repo, *revs))
+
+    bases = list(bases)
+    if bases:
+        changed_paths = set(repo.git.log('-z', '--format=', '--name-only', '--no-renames',
+                                         *revs, '--').split('\0'))
+        changed_paths.discard('')
+        for base in bases:
+            base_missing = set(_missing_objects(repo, '--no-walk', base))
+            for entry in repo.git.ls_tree('-r', '-z', base).split('\0'):
+                info, _, path = entry.partition('\t')
+                if path in changed_paths:
+                    sha = info.split()[2]
+                    if sha in base_missing:
+                        missing[sha] = None
+
+    if not missing:
+        return 0
+
+    # What git does when it fetches missing objects on demand
+    subprocess.run(['git', '--git-dir', repo.git_dir,
+                    '-c', 'fetch.negotiationAlgorithm=noop',
+                    'fetch', remote_name, '--no-tags', '--no-write-fetch-head',
+                    '--recurse-submodules=no', f'--filter={PARTIAL_CLONE_FILTER}', '--stdin'],
+                   input=''.join(f'{sha}\n' for sha in missing), text=True, check=True,
+                   stdout=subprocess.DEVNULL)
+
+    return len(missing)
@@ -5,19 +5,54 @@ This script stores fork synchronization data in a json format.
 
 import os
 import sys
+import asyncio
 import time
 import argparse
-import json
+import cProfile
 import re
+import signal
+import threading
 import typing
 import pathlib
 import logging
+import concurrent.futures
 import git
 
+import async_pipeline
+import cherry_pick_series
+import commit_log
+import fetch_strategy
+import fuzzy_match
+import merge_tree
+import page_views
+import path_index
+import patch_ids
+import perf
+import revert_graph
+import sync_daemon
+import sync_data_io
+import verdict_cache
+
+CHERRY_PICK_EXECUTORS = ('serial', 'thread', 'process')
+
+CHERRY_PICK_CACHE_FILE_NAME = 'fork_sync_cherry_pick_cache.sqlite'
+
 class CommitRepr:
     """Local representation of a commit
+
+    Only the fields that are stored are kept, in slots, so that large
+    ranges of commits can be held in memory. Repeated strings such as
+    author names are interned.
     """
 
+    __slots__ = ('_sha', '_parent_sha', '_authored_seconds_since_epoch',
+                 '_committed_seconds_since_epoch', '_author', '_author_email',
+                 '_title', '_upstream_sha', '_upstream_pr', '_downstream_sha',
+                 '_downstream_sha_guess', '_upstream_sha_guess', '_reverts_sha',
+                 '_reverted_by_sha', '_effectively_reverted', '_supports_clean_cherry_pick',
+                 '_cherry_pick_conflicts', '_patch_id_match',
+                 '_upstream_sha_guess_candidates')
+
     RE_UPSTREAM_PR = \
         r'^Upstream PR(| #): (?P<upstream_pr>.+)'
     RE_UPSTREAM_SHA = \
@@ -34,8 +69,18 @@ class CommitRepr:
                  parse_message_for_upstream_info=False,
                  downstream_sha = None,
                  downstream_sha_guess = None,
-                 supports_clean_cherry_pick = None):
-        self._commit = commit
+                 supports_clean_cherry_pick = None,
+                 cherry_pick_conflicts = None):
+        message = commit.message
+        # Interned so that the SHA of a commit and the parent SHA of its
+        # child share the same string.
+        self._sha = sys.intern(str(commit))
+        self._parent_sha = sys.intern(str(commit.parents[0])) if commit.parents else None
+        self._authored_seconds_since_epoch = commit.authored_date
+        self._committed_seconds_since_epoch = commit.committed_date
+        self._author = sys.intern(commit.author.name)
+        self._author_email = sys.intern(commit.author.email)
+        self._title = commit.summary
         self._upstream_sha = None
         self._upstream_pr = None
         self._downstream_sha = downstream_sha
@@ -43,24 +88,83 @@ class CommitRepr:
         self._upstream_sha_guess = None
         self._reverts_sha = None
         self._reverted_by_sha = None
+        self._effectively_reverted = None
         self._supports_clean_cherry_pick = supports_clean_cherry_pick
+        self._cherry_pick_conflicts = cherry_pick_conflicts
+        self._patch_id_match = None
+        self._upstream_sha_guess_candidates = None
 
         if parse_message_for_upstream_info:
-            self._set_upstream_pr_or_sha()
+            self._set_upstream_pr_or_sha(message)
 
-        if self._commit.summary.startswith("Revert"):
-            search_result = self.RE_REVERT.search(self._commit.message)
+        # Whatever the title, but a picked upstream revert, e.g.
+        # "[nrf fromtree] Revert ...", stays a fromtree commit: the
+        # upstream revert itself reverts the upstream commit
+        search_result = None if self._upstream_sha else self.RE_REVERT.search(message)
+        if search_result:
+            self._reverts_sha = search_result.group('sha')
 
-            if search_result:
-                search_result_dict = search_result.groupdict()
-                self._reverts_sha = search_result_dict.get('sha', None)
+    @classmethod
+    def from_dict(cls, representation: dict, keep_cherry_pick_result=False):
+        """Restore a commit from its dictionary representation
 
-            return
+        Only the information obtained from the commit itself is restored.
+        References to other commits have to be resolved again.
+
+        Args:
+            representation (dict): The representation returned by to_dict()
+            keep_cherry_pick_result (bool): Restore the result of the cherry-pick
+                check for commits that were checked.
+
+        Returns:
+            CommitRepr: The commit
+        """
+        item = cls.__new__(cls)
+        item._sha = representation['sha']
+        item._parent_sha = None
+        item._authored_seconds_since_epoch = representation['authored_seconds_since_epoch']
+        item._committed_seconds_since_epoch = representation['committed_seconds_since_epoch']
+        item._author = sys.intern(representation['author'])
+        item._author_email = sys.intern(representation['author_email'])
+        item._title = representation['title']
+        item._upstream_sha = representation.get('upstream_sha', None)
+        item._upstream_pr = representation.get('upstream_pr', None)
+        item._downstream_sha = None
+        item._downstream_sha_guess = None
+        item._upstream_sha_guess = None
+        item._reverts_sha = None if item._upstream_sha else \
+            representation.get('reverts_sha', None)
+        item._reverted_by_sha = None
+        item._effectively_reverted = None
+        item._supports_clean_cherry_pick = None
+        item._cherry_pick_conflicts = None
+        item._patch_id_match = None
+        item._upstream_sha_guess_candidates = None
+
+        was_checked = not (representation.get('downstream_sha', None) or
+                           representation.get('downstream_sha_guess', None))
+        if keep_cherry_pick_result and was_checked:
+            item._supports_clean_cherry_pick = \
+                representation.get('supports_clean_cherry_pick', False)
+            item._cherry_pick_conflicts = \
+                tuple(representation.get('cherry_pick_conflicts', ()))
+
+        return item
+
+    @property
+    def parent_sha(self) -> str:
+        """The SHA of the first parent, None if restored from a dictionary"""
+        return self._parent_sha
 
     @property
     def sha(self) -> str:
         """Get the SHA of the commit"""
-        return str(self._commit)
+        return self._sha
+
+    @property
+    def title(self) -> str:
+        """Get the title of the commit"""
+        return self._title
 
     @property
     def reverts_sha(self) -> str:
@@ -77,6 +181,18 @@ class CommitRepr:
         """Sets the SHA of the commit that reverts this commit"""
         self._reverted_by_sha = sha
 
+    @property
+    def effectively_reverted(self) -> bool:
+        """Whether the commit is reverted, once reverts of reverts are resolved.
+        None if the commit is not reverted at all.
+        """
+        return self._effectively_reverted
+
+    @effectively_reverted.setter
+    def effectively_reverted(self, reverted):
+        """Sets whether the commit is reverted"""
+        self._effectively_reverted = reverted
+
     @property
     def upstream_sha(self) -> str:
         """Returns the upstream SHA"""
@@ -92,6 +208,11 @@ class CommitRepr:
         """Returns the downstream SHA"""
         return self._downstream_sha
 
+    @downstream_sha.setter
+    def downstream_sha(self, sha):
+        """Sets the downstream SHA"""
+        self._downstream_sha = sha
+
     @property
     def downstream_sha_guess(self) -> str:
         """Returns the downstream SHA for a commit that was
@@ -101,6 +222,11 @@ class CommitRepr:
         """
         return self._downstream_sha_guess
 
+    @downstream_sha_guess.setter
+    def downstream_sha_guess(self, sha):
+        """Sets the downstream SHA guess"""
+        self._downstream_sha_guess = sha
+
     @property
     def upstream_sha_guess(self):
         """A guess of the corresponding upstream SHA based
@@ -114,6 +240,51 @@ class CommitRepr:
         """
         self._upstream_sha_guess = sha
 
+    @property
+    def patch_id_match(self) -> str:
+        """The SHA of a commit on the other side with the same patch ID"""
+        return self._patch_id_match
+
+    @patch_id_match.setter
+    def patch_id_match(self, sha):
+        """Sets the SHA of the commit with the same patch ID"""
+        self._patch_id_match = sha
+
+    @property
+    def upstream_sha_guess_candidates(self) -> typing.List[dict]:
+        """Upstream commits similar to this commit, with their similarity score"""
+        return self._upstream_sha_guess_candidates
+
+    @upstream_sha_guess_candidates.setter
+    def upstream_sha_guess_candidates(self, candidates):
+        """Sets the similar upstream commits"""
+        self._upstream_sha_guess_candidates = candidates
+
+    @property
+    def supports_clean_cherry_pick(self) -> bool:
+        """Whether the commit can be cherry-picked without conflicts.
+        None if that was not checked.
+        """
+        return self._supports_clean_cherry_pick
+
+    @property
+    def cherry_pick_conflicts(self) -> typing.Tuple[str, ...]:
+        """The paths conflicting when cherry-picking the commit"""
+        return self._cherry_pick_conflicts
+
+    def set_cherry_pick_result(self, result: typing.Optional[merge_tree.MergeTreeResult]):
+        """Sets the outcome of the cherry-pick check
+
+        Args:
+            result: The merge-tree result, None if the commit is not checked
+        """
+        if result is None:
+            self._supports_clean_cherry_pick = None
+            self._cherry_pick_conflicts = None
+        else:
+            self._supports_clean_cherry_pick = result.clean
+            self._cherry_pick_conflicts = result.conflicting_paths
+
     def to_dict(self) -> dict:
         """Convert commit to dictionary representation
 
@@ -123,12 +294,12 @@ class CommitRepr:
             dict: The dictionary representation
         """
         representation = {
-                'sha': str(self._commit),
-                'authored_seconds_since_epoch': self._commit.authored_date,
-                'committed_seconds_since_epoch': self._commit.committed_date,
-                'author': self._commit.author.name,
-                'author_email': self._commit.author.email,
-                'title': self._commit.summary
+                'sha': self._sha,
+                'authored_seconds_since_epoch': self._authored_seconds_since_epoch,
+                'committed_seconds_since_epoch': self._committed_seconds_since_epoch,
+                'author': self._author,
+                'author_email': self._author_email,
+                'title': self._title
             }
         if self._upstream_pr:
             representation['upstream_pr'] = self._upstream_pr
@@ -144,19 +315,26 @@ class CommitRepr:
             representation['reverts_sha'] = self._reverts_sha
         if self._reverted_by_sha:
             representation['reverted_by_sha'] = self._reverted_by_sha
+            representation['effectively_reverted'] = bool(self._effectively_reverted)
         if self._supports_clean_cherry_pick:
             representation['supports_clean_cherry_pick'] = self._supports_clean_cherry_pick
+        if self._cherry_pick_conflicts:
+            representation['cherry_pick_conflicts'] = list(self._cherry_pick_conflicts)
+        if self._patch_id_match:
+            representation['patch_id_match'] = self._patch_id_match
+        if self._upstream_sha_guess_candidates:
+            representation['upstream_sha_guess_candidates'] = self._upstream_sha_guess_candidates
 
         return representation
 
-    def _set_upstream_pr_or_sha(self):
+    def _set_upstream_pr_or_sha(self, message: str):
         """Obtains upstream references based upon the commit message"""
 
-        if self._commit.summary.startswith("Revert") or \
-            self._commit.summary.startswith("[nrf noup]"):
+        if self._title.startswith("Revert") or \
+            self._title.startswith("[nrf noup]"):
             return
         search_result = \
-            self.RE_OBJ_UPSTREAM_PR_OR_SHA.search(self._commit.message)
+            self.RE_OBJ_UPSTREAM_PR_OR_SHA.search(message)
 
         if search_result:
             search_result_dict = search_result.groupdict()
@@ -171,49 +349,45 @@ class CommitRepr:
 
 def clone_repo_with_remote(local_dir: pathlib.Path,
                            repo_url: str,
-                           remote_name: str) -> git.Repo:
+                           remote_name: str,
+                           branches: typing.Optional[typing.List[str]] = None,
+                           strategy: fetch_strategy.FetchStrategy = fetch_strategy.FetchStrategy()) \
+                               -> git.Repo:
     """Clone repo with corresponding remote
 
     Args:
         local_dir (pathlib.Path): The dir where to clone the repo
         repo_url (str): Repo URL
         remote_name (str): Local remote name
+        branches: The branches to fetch. All branches are fetched if None.
+        strategy (FetchStrategy): How to fetch
 
     Returns:
         git.Repo: The repo object
     """
-    if not os.path.exists(local_dir):
-        logging.info("Cloning repository into %s...", local_dir)
-        repo = git.Repo.clone_from(repo_url, local_dir)
-    else:
-        # Initialize repo from folder.
-        # If this fails, the folder is used by something else.
-        # We do not handle that case.
-        repo = git.Repo(local_dir)
-
-        repo_add_remote(repo, repo_url, remote_name)
-
-    return repo
+    return fetch_strategy.clone(local_dir, repo_url, remote_name, branches, strategy)
 
 def repo_add_remote(repo: git.Repo,
                     repo_url: str,
-                    remote_name: str):
+                    remote_name: str,
+                    branches: typing.Optional[typing.List[str]] = None,
+                    strategy: fetch_strategy.FetchStrategy = fetch_strategy.FetchStrategy()):
     """Adds a remote to an existing repo
 
+    The remote is only fetched if it did not exist yet, or if some of the
+    branches were not fetched yet.
+
     Args:
         repo (git.Repo): The repo object
         repo_url (str): The repo url
         remote_name (str): The local remote name
+        branches: The branches to fetch. All branches are fetched if None.
+        strategy (FetchStrategy): How to fetch
     """
-    if remote_name in repo.remotes:
-        # We do not handle the case where the remote is pointing to
-        # a different url.
-        assert repo.remotes[remote_name].url == repo_url
-    else:
-        logging.info("Adding remote named %s pointing to %s...",
-                     remote_name, repo_url)
-        repo.create_remote(remote_name, repo_url)
-        repo.remotes[remote_name].fetch()
+    is_new = remote_name not in repo.remotes
+    fetch_strategy.configure_remote(repo, remote_name, repo_url, branches, strategy)
+    if is_new or fetch_strategy.missing_branches(repo, remote_name, branches):
+        fetch_strategy.fetch(repo, remote_name, branches, strategy)
 
     return repo
 
@@ -228,96 +402,736 @@ def test_cherry_pickable(repo : git.Repo, base_commit : git.Commit, commit : git
     Returns:
         bool: True if the commit can be cherry-picked without conflicts
     """
-    status = repo.git.merge_tree(base_commit, commit, commit.parents[0])
-
-    # TODO: Use a newer git version reports the status on the first line
-    if status.startswith('changed in') or \
-        status.startswith('added in') or \
-        status.startswith('removed in') or \
-        status.startswith('merged'):
-        return False
-    elif status == '':
-        return True
-    else:
-        assert False, status
+    return merge_tree.legacy_cherry_pick(
+        repo, str(base_commit), str(commit), str(commit.parents[0])).clean
 
-def get_fork_sync_data(repo : git.Repo,
-                       base_commit : git.Commit,
-                       upstream_commits: typing.Iterator[git.Commit],
-                       downstream_commits: typing.Iterator[git.Commit]) -> dict:
-    """Obtain synchronization info for upstream and downstream commits
+def _test_cherry_pickable_chunk(git_dir: str,
+                                base_sha: str,
+                                commit_and_parent_shas: typing.List[typing.Tuple[str, str]],
+                                backend: str) -> typing.List[merge_tree.MergeTreeResult]:
+    """Checks a chunk of commits in a worker
 
-    The returned synchronization info is represented as a dictionary
-    containing the CommitRepr.do_dict() representation of all the
-    upstream and downstream commits. These commits have been annotated
-    with their <optional> upstream/downstream shas or PRs.
+    Only plain strings are passed in so that the job can be sent to
+    a worker process.
 
     Args:
-        repo: The git repository
-        base_commit: The base commit of the downstream repo,
-        upstream_commits: Upstream commits
-        downstream_commits Downstream commits
+        git_dir (str): The git directory of the repo
+        base_sha (str): The SHA of the base commit
+        commit_and_parent_shas: The commits to check along with their first parent
+        backend (str): Either 'batch' or 'legacy'
 
     Returns:
-        dict: The synchronization data
+        list: The merge-tree result for each commit
     """
-    data = {}
+    if backend == 'batch':
+        with merge_tree.MergeTreeBatch(git_dir) as batch:
+            return list(batch.cherry_pick(base_sha, commit_and_parent_shas))
 
+    repo = git.Repo(git_dir)
+    return [merge_tree.legacy_cherry_pick(repo, base_sha, sha, parent_sha)
+            for sha, parent_sha in commit_and_parent_shas]
+
+def create_cherry_pick_executor(kind: str,
+                                jobs: int) -> typing.Optional[concurrent.futures.Executor]:
+    """Create the executor used to run the cherry-pick checks
+
+    Args:
+        kind (str): One of CHERRY_PICK_EXECUTORS
+        jobs (int): The number of workers
+
+    Returns:
+        The executor, or None if the checks shall run serially
+    """
+    if kind == 'serial' or jobs <= 1:
+        return None
+    if kind == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    if kind == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+
+    raise ValueError(f'Unknown cherry-pick executor: {kind}')
+
+def check_cherry_pickable(repo: git.Repo,
+                          base_commit: git.Commit,
+                          commit_and_parent_shas: typing.List[typing.Tuple[str, str]],
+                          executor: typing.Optional[concurrent.futures.Executor] = None,
+                          backend: str = 'auto',
+                          cache: typing.Optional[verdict_cache.CherryPickCache] = None) \
+                              -> typing.List[merge_tree.MergeTreeResult]:
+    """Checks which commits can be cherry-picked on top of the base commit
+
+    The commits are split in chunks that are distributed over the
+    executor. The results are returned in the same order as the commits,
+    so the outcome does not depend on the executor being used.
+    With the batch backend, every chunk is streamed through a single
+    git merge-tree process.
+
+    Args:
+        repo (git.Repo): The git repo
+        base_commit (git.Commit): The base commit
+        commit_and_parent_shas: The commits to be cherry-picked along with their first parent
+        executor: The executor to use. The checks are run serially if None.
+        backend (str): One of merge_tree.MERGE_TREE_BACKENDS
+        cache: Cache of verdicts from earlier runs. Only misses are checked.
+
+    Returns:
+        list: The merge-tree result for each commit
+    """
+    jobs = list(commit_and_parent_shas)
+    if not jobs:
+        # Also when the asynchronous pipeline did the checks already
+        return []
+
+    backend = merge_tree.resolve_backend(repo, backend)
+
+    if cache is None:
+        with perf.phase('cherry_pick_checks', commits=len(jobs)):
+            return _check_cherry_pickable_jobs(repo, str(base_commit), jobs, executor, backend)
+
+    base_tree = repo.git.rev_parse(f'{base_commit}^{{tree}}')
+    results = cache.get_many(base_tree, backend, jobs)
+    missing = [index for index, result in enumerate(results) if result is None]
+    missing_jobs = [jobs[index] for index in missing]
+
+    with perf.phase('cherry_pick_checks', commits=len(missing_jobs)):
+        missing_results = _check_cherry_pickable_jobs(
+            repo, str(base_commit), missing_jobs, executor, backend)
+    cache.put_many(base_tree, backend, missing_jobs, missing_results)
+
+    for index, result in zip(missing, missing_results):
+        results[index] = result
+
+    return results
+
+def _check_cherry_pickable_jobs(repo: git.Repo,
+                                base_sha: str,
+                                jobs: typing.List[typing.Tuple[str, str]],
+                                executor: typing.Optional[concurrent.futures.Executor],
+                                backend: str) -> typing.List[merge_tree.MergeTreeResult]:
+    """Run the cherry-pick checks, distributed over the executor if any"""
+    if executor is None or not jobs:
+        return _test_cherry_pickable_chunk(repo.git_dir, base_sha, jobs, backend)
+
+    workers = getattr(executor, '_max_workers', 1)
+    chunk_size = max(1, -(-len(jobs) // (workers * 4)))
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+
+    results = []
+    for chunk_result in executor.map(_test_cherry_pickable_chunk,
+                                     [repo.git_dir] * len(chunks),
+                                     [base_sha] * len(chunks),
+                                     chunks,
+                                     [backend] * len(chunks)):
+        results.extend(chunk_result)
+
+    return results
+
+def index_downstream_items(downstream_items: typing.List[CommitRepr]) \
+        -> typing.Tuple[typing.Dict[str, str], typing.Dict[str, CommitRepr]]:
+    """Index the downstream commits by the upstream commits they refer to
+
+    Args:
+        downstream_items: The downstream commits
+
+    Returns:
+        tuple: The SHA of the downstream commit picking each upstream
+        commit, by upstream SHA, and the commits picked from an upstream
+        PR, by the title the upstream commit is expected to have
+    """
     # Create dictionary mapping downstream to upstream commits.
     # This will be used when mapping upstream to downstream commits.
     upstream_commits_with_downstream = {}
     downstream_commit_titles_with_possible_upstream = {}
-    revert_sha_to_reverted_by_sha = {}
-    temp_downstream_item_list = []
 
-    data['downstream_commits'] = []
-    for commit in downstream_commits:
-        item = CommitRepr(commit, parse_message_for_upstream_info=True)
-        temp_downstream_item_list.append(item)
+    for item in downstream_items:
         if item.upstream_sha:
             upstream_commits_with_downstream[item.upstream_sha] = item.sha
         elif item.upstream_pr:
-            if commit.summary.startswith('[nrf fromlist] '):
-                upstream_commit_title = commit.summary[len('[nrf fromlist] '):]
+            if item.title.startswith('[nrf fromlist] '):
+                upstream_commit_title = item.title[len('[nrf fromlist] '):]
             else:
-                upstream_commit_title = commit.summary
+                upstream_commit_title = item.title
 
             downstream_commit_titles_with_possible_upstream[upstream_commit_title] = item
 
-        if item.reverts_sha:
-            revert_sha_to_reverted_by_sha[item.reverts_sha] = item.sha
+    return upstream_commits_with_downstream, downstream_commit_titles_with_possible_upstream
+
+def needs_cherry_pick_check(downstream_items: typing.List[CommitRepr]) \
+        -> typing.Callable[[CommitRepr], bool]:
+    """Which upstream commits get_fork_sync_items() checks
+
+    Args:
+        downstream_items: All the downstream commits
+
+    Returns:
+        A predicate telling if an upstream commit has no downstream
+        counterpart, and no cherry-pick result yet
+    """
+    upstream_commits_with_downstream, downstream_commit_titles_with_possible_upstream = \
+        index_downstream_items(downstream_items)
+
+    def predicate(item):
+        return not upstream_commits_with_downstream.get(item.sha) and \
+            item.title not in downstream_commit_titles_with_possible_upstream and \
+            item.supports_clean_cherry_pick is None
+
+    return predicate
 
-        item.reverted_by_sha = revert_sha_to_reverted_by_sha.get(item.sha)
+def get_fork_sync_items(repo : git.Repo,
+                       base_commit : git.Commit,
+                       upstream_commits: typing.Iterator[git.Commit],
+                       downstream_commits: typing.Iterator[git.Commit],
+                       executor: typing.Optional[concurrent.futures.Executor] = None,
+                       merge_tree_backend: str = 'auto',
+                       cherry_pick_cache: typing.Optional[verdict_cache.CherryPickCache] = None) \
+                           -> dict:
+    """Obtain synchronization info for upstream and downstream commits
 
-    data['upstream_commits'] = []
+    The returned synchronization info is represented as a dictionary
+    containing the CommitRepr objects of all the upstream and downstream
+    commits. These commits have been annotated with their <optional>
+    upstream/downstream shas or PRs.
+
+    The commits can be git.Commit objects, commit_log.LogCommit records
+    or CommitRepr objects restored from an earlier run.
+
+    Args:
+        repo: The git repository
+        base_commit: The base commit of the downstream repo,
+        upstream_commits: Upstream commits
+        downstream_commits Downstream commits
+        executor: Executor used to run the cherry-pick checks
+        merge_tree_backend: The backend used for the cherry-pick checks
+        cherry_pick_cache: Cache of cherry-pick verdicts from earlier runs
+
+    Returns:
+        dict: The synchronization data, with lists of CommitRepr objects
+    """
+    data = {}
+
+    temp_downstream_item_list = [
+        commit if isinstance(commit, CommitRepr)
+        else CommitRepr(commit, parse_message_for_upstream_info=True)
+        for commit in downstream_commits]
+    upstream_commits_with_downstream, downstream_commit_titles_with_possible_upstream = \
+        index_downstream_items(temp_downstream_item_list)
+
+    upstream_items = []
+    cherry_pick_candidates = []
     for commit in upstream_commits:
-        downstream_sha = upstream_commits_with_downstream.get(str(commit), None)
+        item = commit if isinstance(commit, CommitRepr) else CommitRepr(commit)
+        item.downstream_sha = upstream_commits_with_downstream.get(item.sha, None)
 
         # Check if the commit is a fromlist commit that has been merged to upstream
-        downstream_sha_picked_from_pr = None
         downstream_picked_from_pr = \
-            downstream_commit_titles_with_possible_upstream.get(commit.summary, None)
+            downstream_commit_titles_with_possible_upstream.get(item.title, None)
         if downstream_picked_from_pr:
-            downstream_picked_from_pr.upstream_sha_guess = str(commit)
-            downstream_sha_picked_from_pr = downstream_picked_from_pr.sha
+            downstream_picked_from_pr.upstream_sha_guess = item.sha
+            item.downstream_sha_guess = downstream_picked_from_pr.sha
+
+        if item.downstream_sha or item.downstream_sha_guess:
+            item.set_cherry_pick_result(None)
+        elif item.supports_clean_cherry_pick is None:
+            cherry_pick_candidates.append(item)
 
-        clean_cherry_pick = None
-        if not (downstream_sha_picked_from_pr or downstream_sha):
-            clean_cherry_pick = test_cherry_pickable(repo, base_commit, commit)
+        upstream_items.append(item)
 
-        item = CommitRepr(commit,
-                          downstream_sha=downstream_sha,
-                          downstream_sha_guess=downstream_sha_picked_from_pr,
-                          supports_clean_cherry_pick=clean_cherry_pick)
-        item_as_dict = item.to_dict()
+    revert_graph.resolve_reverts(temp_downstream_item_list + upstream_items)
 
-        data['upstream_commits'].append(item_as_dict)
+    cherry_pick_results = check_cherry_pickable(
+        repo, base_commit,
+        [(item.sha, item.parent_sha or str(repo.commit(item.sha).parents[0]))
+         for item in cherry_pick_candidates],
+        executor, merge_tree_backend, cherry_pick_cache)
 
-    for item in temp_downstream_item_list:
-        data['downstream_commits'].append(item.to_dict())
+    for item, cherry_pick_result in zip(cherry_pick_candidates, cherry_pick_results):
+        item.set_cherry_pick_result(cherry_pick_result)
+
+    data['downstream_commits'] = temp_downstream_item_list
+    data['upstream_commits'] = upstream_items
 
     return data
 
+def get_fork_sync_data(repo : git.Repo,
+                       base_commit : git.Commit,
+                       upstream_commits: typing.Iterator[git.Commit],
+                       downstream_commits: typing.Iterator[git.Commit],
+                       executor: typing.Optional[concurrent.futures.Executor] = None,
+                       merge_tree_backend: str = 'auto',
+                       cherry_pick_cache: typing.Optional[verdict_cache.CherryPickCache] = None) \
+                           -> dict:
+    """Obtain synchronization info for upstream and downstream commits
+
+    The returned synchronization info is represented as a dictionary
+    containing the CommitRepr.do_dict() representation of all the
+    upstream and downstream commits. These commits have been annotated
+    with their <optional> upstream/downstream shas or PRs.
+
+    See get_fork_sync_items() for a description of the arguments.
+
+    Returns:
+        dict: The synchronization data
+    """
+    items = get_fork_sync_items(repo=repo,
+                                base_commit=base_commit,
+                                upstream_commits=upstream_commits,
+                                downstream_commits=downstream_commits,
+                                executor=executor,
+                                merge_tree_backend=merge_tree_backend,
+                                cherry_pick_cache=cherry_pick_cache)
+
+    return {key: [item.to_dict() for item in value] for key, value in items.items()}
+
+def get_incremental_commits(repo: git.Repo,
+                            previous_data: dict,
+                            merge_base: git.Commit,
+                            upstream_tip: git.Commit,
+                            downstream_tip: git.Commit):
+    """Obtain the commits to analyze, reusing the results of an earlier run
+
+    The earlier results can only be reused if the history was extended
+    since then. That is, the old merge base and tips have to be ancestors
+    of the new ones.
+
+    Args:
+        repo (git.Repo): The git repo
+        previous_data (dict): The output of an earlier run
+        merge_base (git.Commit): The new merge base
+        upstream_tip (git.Commit): The new upstream tip
+        downstream_tip (git.Commit): The new downstream tip
+
+    Returns:
+        The upstream and downstream commits to pass to get_fork_sync_data().
+        Reused commits are represented by CommitRepr objects.
+        None if the history was rewritten and everything has to be rebuilt.
+    """
+    old_merge_base = previous_data['merge_base']['sha']
+    old_upstream_tip = previous_data['meta'].get('upstream_head_sha')
+    old_downstream_tip = previous_data['meta'].get('downstream_head_sha')
+
+    # Older data does not store the tips, but the tip is always listed first
+    if not old_upstream_tip:
+        old_upstream_tip = previous_data['upstream_commits'][0]['sha'] \
+            if previous_data['upstream_commits'] else old_merge_base
+    if not old_downstream_tip:
+        old_downstream_tip = previous_data['downstream_commits'][0]['sha'] \
+            if previous_data['downstream_commits'] else old_merge_base
+
+    try:
+        history_extended = \
+            repo.is_ancestor(old_merge_base, merge_base) and \
+            repo.is_ancestor(old_upstream_tip, upstream_tip) and \
+            repo.is_ancestor(old_downstream_tip, downstream_tip)
+    except git.GitCommandError:
+        # The old commits are not known at all
+        history_extended = False
+
+    if not history_extended:
+        return None
+
+    merge_base_moved = old_merge_base != str(merge_base)
+    no_longer_in_range = set()
+    if merge_base_moved:
+        no_longer_in_range = set(repo.git.rev_list(f'{old_merge_base}..{merge_base}').split())
+
+    new_upstream_commits = list(commit_log.iter_log_commits(
+        repo, [str(upstream_tip), f'^{old_upstream_tip}', f'^{merge_base}']))
+    new_downstream_commits = list(commit_log.iter_log_commits(
+        repo, [str(downstream_tip), f'^{old_downstream_tip}', f'^{merge_base}']))
+
+    logging.info("Processing %d new upstream and %d new downstream commits",
+                 len(new_upstream_commits), len(new_downstream_commits))
+
+    upstream_commits = new_upstream_commits + [
+        CommitRepr.from_dict(item, keep_cherry_pick_result=not merge_base_moved)
+        for item in previous_data['upstream_commits']
+        if item['sha'] not in no_longer_in_range]
+    downstream_commits = new_downstream_commits + [
+        CommitRepr.from_dict(item) for item in previous_data['downstream_commits']]
+
+    return upstream_commits, downstream_commits
+
+def get_upstream_commits_by_merge_base(repo: git.Repo,
+                                       upstream_tip: git.Commit,
+                                       merge_bases: typing.List[git.Commit]) -> dict:
+    """Walk the upstream commits after several merge bases at once
+
+    The commits after the oldest merge base are read by a single git log.
+    The range of every other merge base is obtained by leaving out the
+    commits it already contains, which only requires listing SHAs.
+
+    Args:
+        repo (git.Repo): The git repo
+        upstream_tip (git.Commit): The upstream tip
+        merge_bases: The merge bases, all of which are ancestors of the tip
+
+    Returns:
+        dict: The commits after each merge base, by the SHA of the merge base,
+        in the order git log lists them
+    """
+    merge_base_shas = list(dict.fromkeys(str(merge_base) for merge_base in merge_bases))
+    if len(merge_base_shas) == 1:
+        oldest = merge_base_shas[0]
+    else:
+        oldest = repo.git.merge_base('--octopus', *merge_base_shas)
+
+    commits = list(commit_log.iter_log_commits(repo, f'{oldest}..{upstream_tip}'))
+
+    ranges = {}
+    for merge_base in merge_base_shas:
+        if merge_base == oldest:
+            ranges[merge_base] = commits
+            continue
+        contained = set(repo.git.rev_list(f'{oldest}..{merge_base}').split())
+        ranges[merge_base] = [commit for commit in commits if commit.hexsha not in contained]
+
+    return ranges
+
+def previous_branch_data(previous_data: typing.Optional[dict],
+                         downstream_rev: str) -> typing.Optional[dict]:
+    """The data of a downstream revision in the output of an earlier run
+
+    Args:
+        previous_data (dict): The output of an earlier run, for one or
+            several downstream revisions
+        downstream_rev (str): The downstream revision
+
+    Returns:
+        dict: The data of the revision, or None if it was not analyzed
+    """
+    if not previous_data:
+        return None
+    if sync_data_io.BRANCHES_KEY in previous_data:
+        return previous_data[sync_data_io.BRANCHES_KEY].get(downstream_rev)
+    if previous_data['meta'].get('downstream_rev', downstream_rev) == downstream_rev:
+        return previous_data
+    return None
+
+def get_branch_sync_data(repo: git.Repo,
+                         args: argparse.Namespace,
+                         downstream_rev: str,
+                         upstream_tip: git.Commit,
+                         downstream_tip: git.Commit,
+                         merge_base: git.Commit,
+                         upstream_walks: dict,
+                         previous_data: typing.Optional[dict],
+                         executor: typing.Optional[concurrent.futures.Executor],
+                         cherry_pick_cache: typing.Optional[verdict_cache.CherryPickCache]) \
+                             -> dict:
+    """Obtain the fork sync data of one downstream revision
+
+    Args:
+        repo (git.Repo): The git repo
+        args: The command line arguments
+        downstream_rev (str): The downstream revision
+        upstream_tip (git.Commit): The upstream tip
+        downstream_tip (git.Commit): The downstream tip
+        merge_base (git.Commit): The merge base of both tips
+        upstream_walks (dict): Upstream commits by merge base, see
+            get_upstream_commits_by_merge_base()
+        previous_data (dict): The output of an earlier run for this revision
+        executor: Executor used to run the cherry-pick checks
+        cherry_pick_cache: Cache of cherry-pick verdicts, shared by all revisions
+
+    Returns:
+        dict: The fork sync data in the single document format
+    """
+    output_data = {
+        'meta': {
+            'upstream_url': args.upstream_url,
+            'upstream_rev': args.upstream_rev,
+            'downstream_url': args.downstream_url,
+            'downstream_rev': downstream_rev,
+            'authored_seconds_since_epoch': int(time.time()),
+            'upstream_head_sha': str(upstream_tip),
+            'downstream_head_sha': str(downstream_tip),
+        },
+        'merge_base': CommitRepr(merge_base).to_dict()
+    }
+
+    incremental_commits = None
+    if previous_data:
+        with perf.phase('incremental_commits'):
+            incremental_commits = get_incremental_commits(
+                repo, previous_data, merge_base, upstream_tip, downstream_tip)
+        if incremental_commits is None:
+            logging.info("History was rewritten, doing a full rebuild")
+
+    if incremental_commits:
+        upstream_commits, downstream_commits = incremental_commits
+    elif args.async_pipeline:
+        with perf.phase('async_walk_and_check') as counters:
+            walk = asyncio.run(async_pipeline.walk_and_check(
+                repo, str(merge_base), str(upstream_tip), str(downstream_tip),
+                make_upstream_item=CommitRepr,
+                make_downstream_item=lambda commit: CommitRepr(
+                    commit, parse_message_for_upstream_info=True),
+                needs_check=needs_cherry_pick_check,
+                backend=args.merge_tree_backend,
+                jobs=args.jobs,
+                cache=cherry_pick_cache,
+                upstream_commits=upstream_walks.get(str(merge_base))))
+            counters['commits'] = len(walk.upstream_items) + len(walk.downstream_items)
+        # Only the checks already done are skipped by get_fork_sync_items()
+        for item in walk.upstream_items:
+            if item.sha in walk.cherry_pick_results:
+                item.set_cherry_pick_result(walk.cherry_pick_results[item.sha])
+        upstream_commits, downstream_commits = walk.upstream_items, walk.downstream_items
+    else:
+        upstream_commits = upstream_walks.get(str(merge_base))
+        if upstream_commits is None:
+            # The previous data could not be used after all
+            with perf.phase('walk_upstream') as counters:
+                upstream_commits = get_upstream_commits_by_merge_base(
+                    repo, upstream_tip, [merge_base])[str(merge_base)]
+                counters['commits'] = len(upstream_commits)
+        # The walk is materialized so that it can be measured separately
+        with perf.phase('walk_downstream') as counters:
+            downstream_commits = list(commit_log.iter_log_commits(
+                repo, f'{merge_base}..{downstream_tip}'))
+            counters['commits'] = len(downstream_commits)
+    output_data['meta']['incremental'] = incremental_commits is not None
+
+    with perf.phase('fork_sync_items',
+                    commits=len(upstream_commits) + len(downstream_commits)):
+        output_data.update(
+            get_fork_sync_items(repo=repo,
+                                base_commit=merge_base,
+                                upstream_commits=upstream_commits,
+                                downstream_commits=downstream_commits,
+                                executor=executor,
+                                merge_tree_backend=args.merge_tree_backend,
+                                cherry_pick_cache=cherry_pick_cache))
+    if args.patch_id_matching:
+        logging.info("Matching commits by patch ID")
+        with perf.phase('patch_id_matching'):
+            patch_ids.match_patch_ids(repo,
+                                      str(merge_base),
+                                      str(upstream_tip),
+                                      str(downstream_tip),
+                                      output_data['upstream_commits'],
+                                      output_data['downstream_commits'])
+    if args.fuzzy_fromlist_matching:
+        logging.info("Matching fromlist commits by similarity")
+        with perf.phase('fuzzy_fromlist_matching'):
+            fuzzy_match.find_fromlist_candidates(repo,
+                                                 str(merge_base),
+                                                 str(upstream_tip),
+                                                 str(downstream_tip),
+                                                 output_data['upstream_commits'],
+                                                 output_data['downstream_commits'])
+    if args.cherry_pick_series:
+        logging.info("Simulating cherry-picking the upstream-only commits in order")
+        with perf.phase('cherry_pick_series') as counters:
+            shas = [item.sha for item in reversed(output_data['upstream_commits'])
+                    if not item.downstream_sha and not item.downstream_sha_guess]
+            counters['commits'] = len(shas)
+            result, group_results = cherry_pick_series.simulate_series(
+                repo, merge_base, cherry_pick_series.with_first_parents(repo, shas),
+                executor, args.merge_tree_backend)
+        output_data['meta']['cherry_pick_series'] = {
+            **result.to_dict(),
+            'independent_groups': len(group_results),
+        }
+
+    return output_data
+
+def fetch_remotes(repo: git.Repo, args: argparse.Namespace, strategy: fetch_strategy.FetchStrategy):
+    """Fetch the analyzed branches of both remotes
+
+    Args:
+        repo (git.Repo): The git repo
+        args: The command line arguments
+        strategy (FetchStrategy): How to fetch
+    """
+    if args.async_pipeline:
+        asyncio.run(async_pipeline.fetch_concurrently(
+            repo, [(args.upstream_remote, [args.upstream_rev]),
+                   (args.downstream_remote, args.downstream_rev)], strategy))
+        return
+
+    logging.info("Fetching changes upstream")
+    fetch_strategy.fetch(repo, args.upstream_remote, [args.upstream_rev], strategy)
+    logging.info("Fetch changes downstream")
+    fetch_strategy.fetch(repo, args.downstream_remote, args.downstream_rev, strategy)
+
+def analyze(repo: git.Repo,
+            args: argparse.Namespace,
+            previous_data: typing.Optional[dict],
+            executor: typing.Optional[concurrent.futures.Executor],
+            cherry_pick_cache: typing.Optional[verdict_cache.CherryPickCache]) \
+                -> typing.Tuple[dict, typing.Optional[path_index.PathIndex]]:
+    """Obtain the fork sync data of the fetched branches
+
+    Args:
+        repo (git.Repo): The git repo
+        args: The command line arguments
+        previous_data (dict): The output of an earlier run
+        executor: Executor used to run the cherry-pick checks
+        cherry_pick_cache: Cache of cherry-pick verdicts
+
+    Returns:
+        tuple: The fork sync data, and the path index if requested
+    """
+    # The cache outlives a run in watch mode
+    if cherry_pick_cache:
+        cherry_pick_cache.reset_stats()
+
+    with perf.phase('merge_base'):
+        upstream_tip = repo.commit(f'{args.upstream_remote}/{args.upstream_rev}')
+        downstream_tips = {
+            rev: repo.commit(f'{args.downstream_remote}/{rev}')
+            for rev in args.downstream_rev
+        }
+        merge_bases = {
+            rev: repo.merge_base(upstream_tip, downstream_tip)[0]
+            for rev, downstream_tip in downstream_tips.items()
+        }
+
+    repo.index.reset(f'{args.downstream_remote}/{args.downstream_rev[0]}')
+
+    if args.partial_clone:
+        with perf.phase('prefetch_blobs'):
+            # The cherry-pick checks merge onto the merge bases
+            bases = [str(merge_base) for merge_base in set(merge_bases.values())]
+            fetched = fetch_strategy.prefetch_blobs(
+                repo, args.upstream_remote,
+                [str(upstream_tip), *(f'^{merge_base}' for merge_base in bases)], bases)
+            fetched += fetch_strategy.prefetch_blobs(
+                repo, args.downstream_remote,
+                [*map(str, downstream_tips.values()), f'^{upstream_tip}'], bases)
+            if args.cherry_pick_series and \
+                    merge_tree.resolve_backend(repo, args.merge_tree_backend) == 'legacy':
+                # The series is then merged in an index, which reads every
+                # blob of the merge bases
+                fetched += fetch_strategy.prefetch_blobs(
+                    repo, args.upstream_remote, ['--no-walk', *bases])
+        logging.info("Fetched %d blobs", fetched)
+
+    # Upstream commits are only walked for the branches that are rebuilt.
+    # The asynchronous pipeline of a single branch walks them itself, while
+    # checking them, but several branches share a single walk.
+    rebuilt_merge_bases = [merge_base for rev, merge_base in merge_bases.items()
+                           if not previous_branch_data(previous_data, rev)]
+    upstream_walks = {}
+    if len(rebuilt_merge_bases) > (1 if args.async_pipeline else 0):
+        with perf.phase('walk_upstream') as counters:
+            upstream_walks = get_upstream_commits_by_merge_base(
+                repo, upstream_tip, rebuilt_merge_bases)
+            counters['commits'] = len(set().union(*upstream_walks.values()))
+
+    branches = {}
+    for rev, downstream_tip in downstream_tips.items():
+        logging.info("Analyzing downstream revision %s", rev)
+        branches[rev] = get_branch_sync_data(
+            repo, args, rev, upstream_tip, downstream_tip, merge_bases[rev],
+            upstream_walks, previous_branch_data(previous_data, rev),
+            executor, cherry_pick_cache)
+
+    if len(branches) == 1:
+        output_data = branches[args.downstream_rev[0]]
+    else:
+        output_data = {
+            'meta': {
+                'upstream_url': args.upstream_url,
+                'upstream_rev': args.upstream_rev,
+                'downstream_url': args.downstream_url,
+                'downstream_revs': args.downstream_rev,
+                'authored_seconds_since_epoch': int(time.time()),
+                'upstream_head_sha': str(upstream_tip),
+            },
+            sync_data_io.BRANCHES_KEY: branches,
+        }
+    if cherry_pick_cache:
+        output_data['meta']['cherry_pick_cache'] = cherry_pick_cache.stats()
+
+    changed_paths = None
+    if args.path_index:
+        with perf.phase('path_index') as counters:
+            changed_paths = path_index.build_path_index(
+                repo, path_index.sync_data_revs(repo, output_data))
+            counters['commits'] = len(changed_paths.commits)
+
+    return output_data, changed_paths
+
+def write_output(args: argparse.Namespace,
+                 output_data: dict,
+                 changed_paths: typing.Optional[path_index.PathIndex]):
+    """Write the fork sync data, the path index and the page views in the requested format
+
+    A single JSON document replaces the output file atomically.
+    """
+    with perf.phase('serialize'):
+        if args.output_format == 'sharded':
+            sync_data_io.write_sharded_sync_data(args.output_file, output_data)
+        elif args.output_file:
+            sync_data_io.write_sync_data_file(args.output_file, output_data)
+        else:
+            sync_data_io.write_sync_data(sys.stdout, output_data)
+        if changed_paths:
+            path_index.write_path_index(args.output_file, changed_paths)
+        if args.page_views:
+            page_views.write_page_views(args.output_file, output_data)
+
+def watch(repo: git.Repo,
+          args: argparse.Namespace,
+          strategy: fetch_strategy.FetchStrategy,
+          previous_data: typing.Optional[dict],
+          executor: typing.Optional[concurrent.futures.Executor],
+          cherry_pick_cache: typing.Optional[verdict_cache.CherryPickCache]):
+    """Keep the output up to date until SIGTERM or SIGINT is received
+
+    Every update is incremental, based on the output of the previous
+    update, which is kept in memory. See sync_daemon.
+
+    Args:
+        repo (git.Repo): The git repo
+        args: The command line arguments
+        strategy (FetchStrategy): How to fetch
+        previous_data (dict): The output of an earlier run
+        executor: Executor used to run the cherry-pick checks
+        cherry_pick_cache: Cache of cherry-pick verdicts
+    """
+    status = sync_daemon.DaemonStatus(args.watch)
+    stop = threading.Event()
+    for signal_number in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signal_number, lambda *_: stop.set())
+
+    def poll():
+        return {
+            **sync_daemon.remote_tips(repo, args.upstream_remote, [args.upstream_rev]),
+            **sync_daemon.remote_tips(repo, args.downstream_remote, args.downstream_rev),
+        }
+
+    def update():
+        nonlocal previous_data
+        recorder = perf.start()
+        try:
+            with perf.phase('fetch'):
+                fetch_remotes(repo, args, strategy)
+            output_data, changed_paths = analyze(repo, args, previous_data,
+                                                 executor, cherry_pick_cache)
+            output_data['meta']['perf'] = recorder.to_dict()
+            write_output(args, output_data, changed_paths)
+        finally:
+            perf.stop()
+        if cherry_pick_cache:
+            cherry_pick_cache.evict()
+
+        previous_data = sync_data_io.as_plain_data(output_data)
+        logging.info("Updated %s in %.2fs", args.output_file,
+                     recorder.to_dict()['total']['wall_seconds'])
+
+    server = None
+    if args.health_port is not None:
+        server = sync_daemon.serve_health(status, args.health_host, args.health_port)
+    try:
+        sync_daemon.watch(status, poll, update, stop)
+    finally:
+        if server:
+            server.shutdown()
+    logging.info("Stopped watching")
+
 def main():
     """Main function of this script"""
     logging.getLogger().setLevel('INFO')
@@ -328,8 +1142,8 @@ def main():
     )
     parser.add_argument('-o',
                         '--output-file',
-                        type=argparse.FileType('w'),
-                        default=sys.stdout)
+                        type=pathlib.Path,
+                        help='Output file. Defaults to stdout.')
     parser.add_argument('--upstream-url',
                         default="https://github.com/zephyrproject-rtos/zephyr")
     parser.add_argument('--upstream-rev',
@@ -339,7 +1153,10 @@ def main():
     parser.add_argument('--downstream-url',
                         default="https://github.com/nrfconnect/sdk-zephyr")
     parser.add_argument('--downstream-rev',
-                        default='main')
+                        nargs='+',
+                        default=['main'],
+                        help='One or more downstream revisions. With several, the '
+                             'output holds the data of each one, by revision.')
     parser.add_argument('--downstream-remote',
                         default='downstream')
     parser.add_argument('--clone-dir',
@@ -348,53 +1165,175 @@ def main():
     parser.add_argument('--refetch-remote',
                         default=False,
                         action='store_true')
+    parser.add_argument('--partial-clone',
+                        default=False,
+                        action='store_true',
+                        help='Clone and fetch without blobs. The blobs needed by the '
+                             'cherry-pick checks are fetched afterwards.')
+    parser.add_argument('--fetch-all-refs',
+                        default=False,
+                        action='store_true',
+                        help='Fetch all branches instead of only the analyzed ones')
+    parser.add_argument('--no-commit-graph',
+                        default=False,
+                        action='store_true',
+                        help='Do not write a commit-graph after fetching')
+    parser.add_argument('--cherry-pick-executor',
+                        choices=CHERRY_PICK_EXECUTORS,
+                        default='serial',
+                        help='How to run the cherry-pick checks')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='Number of workers used for the cherry-pick checks')
+    parser.add_argument('--merge-tree-backend',
+                        choices=merge_tree.MERGE_TREE_BACKENDS,
+                        default='auto',
+                        help='Use a single git merge-tree --stdin process (batch, '
+                             'git >= 2.40) or one process per commit (legacy)')
+    parser.add_argument('--async-pipeline',
+                        default=False,
+                        action='store_true',
+                        help='Fetch both remotes concurrently, walk both ranges side by '
+                             'side and run the cherry-pick checks with up to --jobs git '
+                             'processes while the upstream commits are being walked')
+    parser.add_argument('--no-cherry-pick-cache',
+                        default=False,
+                        action='store_true',
+                        help='Do not use the cherry-pick verdicts stored by earlier runs')
+    parser.add_argument('--cherry-pick-cache-size',
+                        type=int,
+                        default=verdict_cache.DEFAULT_MAX_ENTRIES,
+                        help='Maximum number of verdicts kept in the cache')
+    parser.add_argument('--patch-id-matching',
+                        default=False,
+                        action='store_true',
+                        help='Match upstream and downstream commits by their patch ID')
+    parser.add_argument('--fuzzy-fromlist-matching',
+                        default=False,
+                        action='store_true',
+                        help='Find upstream commits similar to unmatched fromlist commits')
+    parser.add_argument('--cherry-pick-series',
+                        default=False,
+                        action='store_true',
+                        help='Apply the upstream-only commits one after another onto the '
+                             'merge base, and record how many apply cleanly in order')
+    parser.add_argument('--path-index',
+                        default=False,
+                        action='store_true',
+                        help=f'Write the paths changed by every analyzed commit to '
+                             f'{path_index.INDEX_FILE_NAME} next to the output file')
+    parser.add_argument('--page-views',
+                        default=False,
+                        action='store_true',
+                        help='Write the commits of each tab of the web page, with a trigram '
+                             'index of their titles and authors, as compressed files to the '
+                             f'{page_views.VIEWS_DIRECTORY_NAME} directory next to the output file')
+    parser.add_argument('--output-format',
+                        choices=sync_data_io.OUTPUT_FORMATS,
+                        default='json',
+                        help='A single JSON document, or a manifest and one file per '
+                             'category written to the --output-file directory')
+    parser.add_argument('--incremental-from',
+                        type=pathlib.Path,
+                        help='Output of an earlier run. Only commits added since then '
+                             'are processed, unless the history was rewritten.')
+    parser.add_argument('--profile',
+                        type=pathlib.Path,
+                        help='Profile the run and dump the pstats data to this file')
+    parser.add_argument('--watch',
+                        type=float,
+                        metavar='SECONDS',
+                        help='Keep running, poll the remotes at this interval and update '
+                             'the output whenever a tip moved. Requires --output-file.')
+    parser.add_argument('--health-host',
+                        default='localhost')
+    parser.add_argument('--health-port',
+                        type=int,
+                        help='With --watch, serve the health of the updates on '
+                             'http://<health-host>:<port>/health')
     args = parser.parse_args()
+    if args.path_index and not args.output_file:
+        parser.error('--path-index requires --output-file')
+    if args.page_views and not args.output_file:
+        parser.error('--page-views requires --output-file')
+    if args.output_format == 'sharded' and not args.output_file:
+        parser.error('--output-format sharded requires --output-file')
+    if args.watch is not None and not args.output_file:
+        parser.error('--watch requires --output-file')
+
+    profiler = None
+    if args.profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    recorder = perf.start()
+
+    previous_data = None
+    if args.incremental_from and args.incremental_from.exists():
+        with perf.phase('load_previous'):
+            previous_data = sync_data_io.load_sync_data(args.incremental_from)
+
+    strategy = fetch_strategy.FetchStrategy(partial=args.partial_clone,
+                                            all_refs=args.fetch_all_refs,
+                                            commit_graph=not args.no_commit_graph)
+    with perf.phase('fetch'):
+        repo = clone_repo_with_remote(
+            local_dir=args.clone_dir,
+            repo_url=args.upstream_url,
+            remote_name=args.upstream_remote,
+            branches=[args.upstream_rev],
+            strategy=strategy)
+
+        repo_add_remote(
+            repo=repo,
+            repo_url=args.downstream_url,
+            remote_name=args.downstream_remote,
+            branches=args.downstream_rev,
+            strategy=strategy)
+
+        if args.refetch_remote:
+            fetch_remotes(repo, args, strategy)
+
+    executor = create_cherry_pick_executor(args.cherry_pick_executor, args.jobs)
+    cherry_pick_cache = None
+    if not args.no_cherry_pick_cache:
+        cherry_pick_cache = verdict_cache.CherryPickCache(
+            os.path.join(repo.git_dir, CHERRY_PICK_CACHE_FILE_NAME),
+            max_entries=args.cherry_pick_cache_size)
+    elif args.watch is not None:
+        # The verdicts are still kept between the updates
+        cherry_pick_cache = verdict_cache.CherryPickCache(
+            ':memory:', max_entries=args.cherry_pick_cache_size)
+
+    try:
+        if args.watch is not None:
+            perf.stop()
+            watch(repo, args, strategy, previous_data, executor, cherry_pick_cache)
+            return
 
-    repo = clone_repo_with_remote(
-        local_dir=args.clone_dir,
-        repo_url=args.upstream_url,
-        remote_name=args.upstream_remote)
-
-    repo_add_remote(
-        repo=repo,
-        repo_url=args.downstream_url,
-        remote_name=args.downstream_remote)
-
-    if args.refetch_remote:
-        logging.info("Fetching changes upstream")
-        repo.remotes[args.upstream_remote].fetch()
-        logging.info("Fetch changes downstream")
-        repo.remotes[args.downstream_remote].fetch()
-
-    merge_base = repo.merge_base(
-        f'{args.upstream_remote}/{args.upstream_rev}',
-        f'{args.downstream_remote}/{args.downstream_rev}')[0]
-
-    output_data = {
-        'meta': {
-            'upstream_url': args.upstream_url,
-            'upstream_rev': args.upstream_rev,
-            'downstream_url': args.downstream_url,
-            'downstream_rev': args.downstream_rev,
-            'authored_seconds_since_epoch': int(time.time()),
-        },
-        'merge_base': CommitRepr(merge_base).to_dict()
-    }
-
-    upstream_commits = repo.iter_commits(
-        f'{merge_base}..{args.upstream_remote}/{args.upstream_rev}')
-    downstream_commits = repo.iter_commits(
-        f'{merge_base}..{args.downstream_remote}/{args.downstream_rev}')
-
-    repo.index.reset(f'{args.downstream_remote}/{args.downstream_rev}')
-
-    output_data.update(
-        get_fork_sync_data(repo=repo,
-                           base_commit=merge_base,
-                           upstream_commits=upstream_commits,
-                           downstream_commits=downstream_commits))
-
-    args.output_file.write(json.dumps(output_data))
+        output_data, changed_paths = analyze(repo, args, previous_data,
+                                             executor, cherry_pick_cache)
+    finally:
+        if executor:
+            executor.shutdown()
+        if cherry_pick_cache:
+            cherry_pick_cache.close()
+
+    # The meta data is written first, so serialization is only logged
+    output_data['meta']['perf'] = recorder.to_dict()
+    write_output(args, output_data, changed_paths)
+    perf.stop()
+
+    logging.info("Serialization took %.2fs, the whole run %.2fs",
+                 recorder.phases['serialize']['wall_seconds'],
+                 recorder.to_dict()['total']['wall_seconds'])
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        logging.info("Profile written to %s, view it with python -m pstats %s",
+                     args.profile, args.profile)
 
 if __name__ == '__main__':
     main()
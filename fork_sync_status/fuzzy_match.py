@@ -0,0 +1,209 @@
+"""Find upstream commits similar to downstream fromlist commits
+
+A [nrf fromlist] commit is picked from an upstream PR that is often
+modified before it is merged. Neither the title nor the patch ID then
+matches the upstream commit. Instead, the commits are compared by the
+Jaccard similarity of their normalized changed lines and title words,
+estimated with MinHash signatures. Locality sensitive hashing over bands
+of the signatures finds the candidates without comparing every pair.
+"""
+
+import hashlib
+import random
+import subprocess
+import typing
+import git
+
+FROMLIST_PREFIX = '[nrf fromlist] '
+
+DEFAULT_THRESHOLD = 0.5
+DEFAULT_CANDIDATE_LIMIT = 3
+
+def _hash_token(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), 'little')
+
+def commit_tokens(title: str, diff_lines: typing.Iterable[str]) -> typing.Set[str]:
+    """The set of tokens that is compared between commits
+
+    Args:
+        title (str): The commit title. A fromlist prefix is ignored.
+        diff_lines: The lines of the diff
+
+    Returns:
+        set: Title words and changed lines with all whitespace removed
+    """
+    if title.startswith(FROMLIST_PREFIX):
+        title = title[len(FROMLIST_PREFIX):]
+
+    tokens = {'title:' + word for word in title.lower().split()}
+    for line in diff_lines:
+        if line[:1] not in ('+', '-') or line.startswith(('+++', '---')):
+            continue
+        normalized = ''.join(line[1:].split())
+        if normalized:
+            tokens.add(line[0] + normalized)
+
+    return tokens
+
+class MinHashLSH:
+    """MinHash signatures indexed by locality sensitive hashing
+
+    Two sets with Jaccard similarity s share at least one band with
+    probability 1 - (1 - s^rows)^bands.
+    """
+
+    def __init__(self, bands: int = 16, rows: int = 4, seed: int = 0x5eed):
+        self._bands = bands
+        self._rows = rows
+        generator = random.Random(seed)
+        self._masks = [generator.getrandbits(64) for _ in range(bands * rows)]
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def signature(self, tokens: typing.Iterable[str]) -> typing.Tuple[int, ...]:
+        """Compute the MinHash signature of a set of tokens"""
+        hashes = [_hash_token(token) for token in tokens]
+        if not hashes:
+            return ()
+        return tuple(min(map(mask.__xor__, hashes)) for mask in self._masks)
+
+    def _band_keys(self, signature):
+        for band in range(self._bands):
+            yield band, signature[band * self._rows:(band + 1) * self._rows]
+
+    def add(self, key: str, signature: typing.Tuple[int, ...]):
+        """Add a signature to the index"""
+        if not signature:
+            return
+        self._signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, []).append(key)
+
+    def query(self,
+              signature: typing.Tuple[int, ...],
+              threshold: float = DEFAULT_THRESHOLD,
+              limit: int = DEFAULT_CANDIDATE_LIMIT) -> typing.List[typing.Tuple[str, float]]:
+        """Find the indexed signatures most similar to a signature
+
+        Args:
+            signature: The signature to look up
+            threshold (float): The minimum estimated similarity
+            limit (int): The maximum number of results
+
+        Returns:
+            list: (key, estimated similarity), most similar first
+        """
+        if not signature:
+            return []
+
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self._buckets[band].get(band_key, ()))
+
+        scored = []
+        for key in candidates:
+            other = self._signatures[key]
+            score = sum(a == b for a, b in zip(signature, other)) / len(signature)
+            if score >= threshold:
+                scored.append((key, score))
+
+        scored.sort(key=lambda result: (-result[1], result[0]))
+        return scored[:limit]
+
+def iter_commit_diffs(repo: git.Repo,
+                      revs: typing.List[str]) -> typing.Iterator[typing.Tuple[str, typing.List[str]]]:
+    """Stream the diffs of the commits of a revision range
+
+    Args:
+        repo (git.Repo): The git repo
+        revs: The revisions to pass to git log
+
+    Yields:
+        tuple: (commit SHA, diff lines without context)
+    """
+    process = subprocess.Popen(
+        ['git', '--git-dir', repo.git_dir, 'log', '-p', '-U0', '--no-merges',
+         '--no-color', '--no-ext-diff', '--format=commit %H', *revs, '--'],
+        stdout=subprocess.PIPE,
+        encoding='utf-8',
+        errors='replace')
+
+    try:
+        sha = None
+        lines = []
+        for line in process.stdout:
+            if line.startswith('commit '):
+                if sha:
+                    yield sha, lines
+                sha = line[len('commit '):].strip()
+                lines = []
+            else:
+                lines.append(line.rstrip('\n'))
+        if sha:
+            yield sha, lines
+    finally:
+        process.stdout.close()
+        if process.wait() not in (0, -13):
+            raise git.GitCommandError(['git', 'log', '-p', *revs], process.returncode)
+
+def find_fromlist_candidates(repo: git.Repo,
+                             merge_base: str,
+                             upstream_tip: str,
+                             downstream_tip: str,
+                             upstream_items: list,
+                             downstream_items: list,
+                             threshold: float = DEFAULT_THRESHOLD,
+                             limit: int = DEFAULT_CANDIDATE_LIMIT) -> int:
+    """Annotate fromlist commits with similar upstream commits
+
+    Only upstream commits without a known downstream counterpart and
+    fromlist commits without a guessed upstream commit are considered.
+    The candidates are stored in upstream_sha_guess_candidates.
+
+    Args:
+        repo (git.Repo): The git repo
+        merge_base (str): The merge base
+        upstream_tip (str): The upstream tip
+        downstream_tip (str): The downstream tip
+        upstream_items: The upstream CommitRepr objects
+        downstream_items: The downstream CommitRepr objects
+        threshold (float): The minimum estimated similarity
+        limit (int): The maximum number of candidates per commit
+
+    Returns:
+        int: The number of fromlist commits with candidates
+    """
+    upstream_by_sha = {
+        item.sha: item for item in upstream_items
+        if not (item.downstream_sha or item.downstream_sha_guess)}
+    fromlist_by_sha = {
+        item.sha: item for item in downstream_items
+        if item.title.startswith(FROMLIST_PREFIX) and not item.upstream_sha_guess
+        and not item.effectively_reverted}
+
+    if not upstream_by_sha or not fromlist_by_sha:
+        return 0
+
+    index = MinHashLSH()
+    fromlist_signatures = []
+    for sha, diff_lines in iter_commit_diffs(
+            repo, [upstream_tip, downstream_tip, f'^{merge_base}']):
+        if sha in upstream_by_sha:
+            index.add(sha, index.signature(commit_tokens(upstream_by_sha[sha].title, diff_lines)))
+        elif sha in fromlist_by_sha:
+            fromlist_signatures.append(
+                (fromlist_by_sha[sha],
+                 index.signature(commit_tokens(fromlist_by_sha[sha].title, diff_lines))))
+
+    match_count = 0
+    for item, signature in fromlist_signatures:
+        candidates = index.query(signature, threshold, limit)
+        if candidates:
+            item.upstream_sha_guess_candidates = \
+                [{'sha': sha, 'score': round(score, 3)} for sha, score in candidates]
+            match_count += 1
+
+    return match_count
@@ -0,0 +1,350 @@
+"""Reconstruct the fork metrics over time from the git history
+
+The metrics of push_to_influx.py only exist for the days on which a
+data.json was committed. Here, they are computed for any sample times
+from the upstream and downstream histories alone, without running the
+pipeline once per sample.
+
+Both histories are read once. The commits are loaded into NumPy arrays:
+when each one landed, its category, the upstream commit it picks and
+when it was reverted. Every metric is then computed for all samples at
+once, with sorted searches and cumulative sums over those arrays.
+
+The state of the fork at a sample time is modelled as follows:
+
+* Every upstream commit after the merge base is counted, as
+  fork_sync_data.py does. A commit on the first-parent history is in the
+  upstream branch once it was committed, and a commit merged from a side
+  branch once the merge was committed.
+* A downstream commit is in the fork once it was committed. The merge
+  base moves forward when a downstream commit with an upstream parent
+  is committed, by an upmerge or by rebasing onto upstream.
+* A commit is effectively reverted, as resolved for the tips, from the
+  time its revert was committed.
+
+Only the history reachable from the tips can be reconstructed. After a
+rebase of the downstream branch, its commits count from the time they
+were rebased.
+
+Example:
+    python history_metrics.py --clone-dir repo --since 2024-01-01 --dry-run
+"""
+
+import argparse
+import datetime
+import logging
+import pathlib
+import time
+import typing
+
+import git
+import numpy as np
+
+import commit_log
+import fork_sync_data
+import push_to_influx
+import revert_graph
+
+# Used for the times of events that never happen
+NEVER = np.iinfo(np.int64).max
+
+FROMLIST_PREFIX = '[nrf fromlist] '
+
+class UpstreamHistory(typing.NamedTuple):
+    """The upstream commits after the oldest merge base, oldest first
+
+    The commits are ordered by the commit of the first-parent history they
+    landed with, which comes right after the commits it merges. The
+    commits after a merge base on the first-parent history are then at
+    consecutive positions.
+    """
+
+    shas: typing.List[str]
+    # When each commit had landed, never decreasing along the history
+    landed: np.ndarray
+    titles: typing.List[str]
+
+class DownstreamHistory(typing.NamedTuple):
+    """The downstream commits after the oldest merge base"""
+
+    committed: np.ndarray
+    # When the commit was effectively reverted, NEVER if it was not
+    reverted: np.ndarray
+    titles: typing.List[str]
+    # Upstream commits picked or likely merged, as (downstream index, upstream position)
+    links: np.ndarray
+    # Merge base changes, as (time, upstream position of the new merge base)
+    merge_base_moves: np.ndarray
+
+def _iter_commits(repo: git.Repo, revs: typing.List[str]) \
+        -> typing.Iterator[typing.Tuple[fork_sync_data.CommitRepr, commit_log.LogCommit]]:
+    for commit in commit_log.iter_log_commits(repo, revs):
+        item = fork_sync_data.CommitRepr(commit, parse_message_for_upstream_info=True)
+        yield item, commit
+
+def read_histories(repo: git.Repo,
+                   upstream_rev: str,
+                   downstream_rev: str,
+                   since: int) -> typing.Tuple[UpstreamHistory, DownstreamHistory]:
+    """Read both histories with one git log each
+
+    Args:
+        repo (git.Repo): The git repo
+        upstream_rev (str): The upstream branch, e.g. 'origin/main'
+        downstream_rev (str): The downstream branch, e.g. 'downstream/main'
+        since (int): The first sample time. The histories are read from
+            the merge base the downstream branch had at that time.
+
+    Returns:
+        tuple: The upstream and the downstream history
+    """
+    downstream_then = repo.git.rev_list('-1', '--first-parent', f'--before={since}',
+                                        downstream_rev) or downstream_rev
+    oldest_merge_base = repo.git.merge_base(upstream_rev, downstream_then)
+
+    upstream_commits = {item.sha: (item, commit) for item, commit in
+                        _iter_commits(repo, [f'{oldest_merge_base}..{upstream_rev}'])}
+    first_parent_history = []
+    sha = repo.git.rev_parse(upstream_rev)
+    while sha in upstream_commits:
+        first_parent_history.append(sha)
+        parents = upstream_commits[sha][1].parents
+        sha = parents[0] if parents else None
+
+    # Each commit of the first-parent history is placed after the commits
+    # it merges, parents before children, without recursion
+    order = []
+    upstream_times = []
+    placed = set()
+    for sha in reversed(first_parent_history):
+        placed.add(sha)
+        stack = [(sha, iter(upstream_commits[sha][1].parents))]
+        while stack:
+            current, parents = stack[-1]
+            parent = next(parents, None)
+            if parent is None:
+                stack.pop()
+                order.append(current)
+            elif parent in upstream_commits and parent not in placed:
+                placed.add(parent)
+                stack.append((parent, iter(upstream_commits[parent][1].parents)))
+        upstream_times.extend([upstream_commits[sha][1].committed_date] *
+                              (len(order) - len(upstream_times)))
+
+    upstream_items = [upstream_commits[sha][0] for sha in order]
+    positions = {item.sha: position for position, item in enumerate(upstream_items)}
+    positions[oldest_merge_base] = -1
+    landed = np.maximum.accumulate(np.array(upstream_times, dtype=np.int64)) \
+        if upstream_times else np.zeros(0, dtype=np.int64)
+
+    downstream_items = []
+    committed = []
+    merge_base_moves = []
+    for item, commit in _iter_commits(repo, [downstream_rev, f'^{upstream_rev}',
+                                             f'^{oldest_merge_base}']):
+        downstream_items.append(item)
+        committed.append(commit.committed_date)
+        upstream_parents = [positions[parent] for parent in commit.parents
+                            if parent in positions]
+        if upstream_parents:
+            merge_base_moves.append((commit.committed_date, max(upstream_parents)))
+    committed = np.array(committed, dtype=np.int64)
+
+    # Reverts are resolved for the tips, and take effect when committed
+    revert_graph.resolve_reverts(downstream_items + upstream_items)
+    times = {item.sha: int(when) for item, when in zip(downstream_items, committed)}
+    times.update({item.sha: int(when) for item, when in zip(upstream_items, landed)})
+    reverted = np.array([times.get(item.reverted_by_sha, NEVER)
+                         if item.effectively_reverted else NEVER
+                         for item in downstream_items], dtype=np.int64)
+
+    # Upstream commits are linked to the downstream commits picking them
+    # by SHA, and to the commits picked from a PR by title
+    titles = {}
+    for position, item in enumerate(upstream_items):
+        titles.setdefault(item.title, position)
+    links = []
+    for index, item in enumerate(downstream_items):
+        if item.upstream_sha in positions:
+            links.append((index, positions[item.upstream_sha]))
+        elif item.upstream_pr:
+            title = item.title[len(FROMLIST_PREFIX):] \
+                if item.title.startswith(FROMLIST_PREFIX) else item.title
+            if title in titles:
+                links.append((index, titles[title]))
+
+    return (
+        UpstreamHistory([item.sha for item in upstream_items], landed,
+                        [item.title for item in upstream_items]),
+        DownstreamHistory(committed, reverted, [item.title for item in downstream_items],
+                          np.array(links, dtype=np.int64).reshape(-1, 2),
+                          np.array(sorted(merge_base_moves), dtype=np.int64).reshape(-1, 2)),
+    )
+
+def _count_at(times: np.ndarray, samples: np.ndarray) -> np.ndarray:
+    """The number of times at or before each sample"""
+    return np.searchsorted(np.sort(times), samples, side='right')
+
+def _count_active(start: np.ndarray, end: np.ndarray, samples: np.ndarray) -> np.ndarray:
+    """The number of intervals [start, end) containing each sample"""
+    return _count_at(start, samples) - _count_at(np.maximum(start, end), samples)
+
+def merge_base_positions(downstream: DownstreamHistory, samples: np.ndarray) -> np.ndarray:
+    """The upstream position of the merge base at each sample, -1 for the oldest one"""
+    moves = downstream.merge_base_moves
+    if not len(moves):
+        return np.full(len(samples), -1, dtype=np.int64)
+
+    # Prepended, so that samples before the first move map to the oldest merge base
+    positions = np.concatenate(([-1], np.maximum.accumulate(moves[:, 1])))
+    return positions[np.searchsorted(moves[:, 0], samples, side='right')]
+
+def compute_metrics(upstream: UpstreamHistory,
+                    downstream: DownstreamHistory,
+                    samples: np.ndarray) -> typing.Dict[str, np.ndarray]:
+    """Compute the metrics of push_to_influx.METRICS at every sample
+
+    Args:
+        upstream (UpstreamHistory): The upstream history
+        downstream (DownstreamHistory): The downstream history
+        samples: The sample times, in seconds since the epoch
+
+    Returns:
+        dict: The value of each metric at each sample, by field name
+    """
+    samples = np.asarray(samples, dtype=np.int64)
+    # The upstream commits after the merge base are those at the
+    # positions in ]merge_base, landed[
+    merge_base = merge_base_positions(downstream, samples)
+    landed = _count_at(upstream.landed, samples)
+    first = np.minimum(merge_base + 1, landed)
+
+    def upstream_in_range(mask: np.ndarray) -> np.ndarray:
+        prefix_sums = np.concatenate(([0], np.cumsum(mask, dtype=np.int64)))
+        return prefix_sums[landed] - prefix_sums[first]
+
+    # An upstream commit is no longer upstream-only once its first
+    # downstream commit was committed
+    links = downstream.links
+    covered = np.full(len(upstream.shas), NEVER, dtype=np.int64)
+    np.minimum.at(covered, links[:, 1], downstream.committed[links[:, 0]])
+    covered_positions = np.flatnonzero(covered != NEVER)
+    is_covered = (covered[covered_positions, None] <= samples) & \
+        (covered_positions[:, None] >= first) & (covered_positions[:, None] < landed)
+
+    def upstream_only(mask: np.ndarray) -> np.ndarray:
+        return upstream_in_range(mask) - \
+            (is_covered & mask[covered_positions, None]).sum(axis=0)
+
+    def downstream_prefix(prefix: str) -> np.ndarray:
+        return np.array([title.startswith(prefix) for title in downstream.titles], dtype=bool)
+
+    def non_reverted(mask: np.ndarray) -> np.ndarray:
+        return _count_active(downstream.committed[mask], downstream.reverted[mask], samples)
+
+    all_upstream = np.ones(len(upstream.shas), dtype=bool)
+    metrics = {
+        'Commits upstream after upmerge': upstream_in_range(all_upstream),
+        'Commits downstream after upmerge': _count_at(downstream.committed, samples),
+        'Downstream noup commits': non_reverted(downstream_prefix('[nrf noup]')),
+        push_to_influx.FROMTREE_FIELD: non_reverted(downstream_prefix('[nrf fromtree]')),
+        'Downstream fromlist commits': non_reverted(downstream_prefix('[nrf fromlist]')),
+    }
+
+    # Fromlist commits whose upstream counterpart is after the merge base
+    fromlist = downstream_prefix('[nrf fromlist]')
+    merged = links[fromlist[links[:, 0]]]
+    index, position = merged[:, 0, None], merged[:, 1, None]
+    metrics['Downstream fromlist commits likely merged'] = (
+        (downstream.committed[index] <= samples) & (downstream.reverted[index] > samples) &
+        (position >= first) & (position < landed)).sum(axis=0)
+
+    reverted = downstream.reverted != NEVER
+    metrics['Downstream reverted commits'] = \
+        _count_at(np.maximum(downstream.committed[reverted], downstream.reverted[reverted]),
+                  samples)
+    metrics['Commits upstream only'] = upstream_only(all_upstream)
+    for subsystem, prefixes in push_to_influx.SUBSYSTEM_TITLE_PREFIXES.items():
+        mask = np.array([title.startswith(prefixes) for title in upstream.titles], dtype=bool)
+        metrics[f'{subsystem} commits upstream only'] = upstream_only(mask)
+
+    return metrics
+
+def get_entries(metrics: typing.Dict[str, np.ndarray], samples: np.ndarray) -> typing.List[dict]:
+    """The InfluxDB entries of the reconstructed metrics, one per sample
+
+    The entries are tagged with the 'reconstructed' mode, so that they
+    are not mixed with the measured ones.
+    """
+    columns = {field: values.tolist() for field, values in metrics.items()}
+    return [{
+        'measurement': 'zephyr',
+        'tags': {
+            'mode': 'reconstructed',
+        },
+        'time': str(datetime.datetime.fromtimestamp(int(sample), tz=datetime.timezone.utc)),
+        'fields': {field: values[index] for field, values in columns.items()},
+    } for index, sample in enumerate(samples)]
+
+def sample_times(since: int, until: int, interval: int) -> np.ndarray:
+    """Evenly spaced sample times, including both ends when they fall on the interval"""
+    return np.arange(since, until + 1, interval, dtype=np.int64)
+
+def _parse_date(value: str) -> int:
+    date = datetime.datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return int(date.timestamp())
+
+def main():
+    """Main function of this script"""
+    logging.getLogger().setLevel('INFO')
+
+    parser = argparse.ArgumentParser(
+        prog="Reconstruct the fork metrics over time from the git history",
+    )
+    parser.add_argument('--clone-dir',
+                        type=pathlib.Path,
+                        default='repo',
+                        help='The repo created by fork_sync_data.py')
+    parser.add_argument('--upstream-rev',
+                        default='origin/main')
+    parser.add_argument('--downstream-rev',
+                        default='downstream/main')
+    parser.add_argument('--since',
+                        required=True,
+                        help='The first sample, e.g. 2024-01-01')
+    parser.add_argument('--until',
+                        help='The last sample. Defaults to now.')
+    parser.add_argument('--interval',
+                        type=float,
+                        default=24,
+                        help='Hours between two samples')
+    parser.add_argument('--dry-run', default=False, action='store_true')
+    push_to_influx.add_writer_arguments(parser)
+    args = parser.parse_args()
+
+    repo = git.Repo(args.clone_dir)
+    since = _parse_date(args.since)
+    until = _parse_date(args.until) if args.until else int(time.time())
+    samples = sample_times(since, until, int(args.interval * 3600))
+
+    start = time.perf_counter()
+    upstream, downstream = read_histories(repo, args.upstream_rev, args.downstream_rev, since)
+    read_seconds = time.perf_counter() - start
+    metrics = compute_metrics(upstream, downstream, samples)
+    entries = get_entries(metrics, samples)
+    logging.info("Read %d upstream and %d downstream commits in %.2fs, "
+                 "computed %d samples in %.2fs",
+                 len(upstream.shas), len(downstream.titles), read_seconds,
+                 len(samples), time.perf_counter() - start - read_seconds)
+
+    if args.dry_run:
+        for entry in entries:
+            print(entry)
+        return
+
+    push_to_influx.push_entries_to_influx(entries, push_to_influx.writer_settings(args))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Batched, retrying InfluxDB writes with an on-disk spool
+
+A single client and write API are used for all the points. The points
+are written asynchronously in batches, and failed batches are retried
+with an exponential backoff. Batches that still cannot be sent are
+appended to a spool file instead of being lost, and are sent again the
+next time a writer is opened with the same spool directory.
+"""
+
+import json
+import logging
+import os
+import pathlib
+import threading
+import typing
+
+import influxdb_client
+from influxdb_client.client.write_api import WriteOptions
+
+SPOOL_FILE_NAME = 'influx_spool.jsonl'
+
+class WriterSettings(typing.NamedTuple):
+    """Where and how points are written"""
+
+    url: str
+    org: str
+    bucket: str
+    token: typing.Optional[str] = None
+    batch_size: int = 1000
+    flush_interval_ms: int = 1000
+    max_retries: int = 5
+    retry_interval_ms: int = 1000
+    max_retry_time_ms: int = 60000
+    spool_dir: typing.Optional[pathlib.Path] = None
+
+class InfluxWriter:
+    """Writes points to InfluxDB through a single client
+
+    Use it as a context manager, all the points are flushed on exit.
+    """
+
+    def __init__(self, settings: WriterSettings):
+        self._settings = settings
+        self._lock = threading.Lock()
+        self.written = 0
+        self.spooled = 0
+
+        self._spool_path = None
+        self._resent_path = None
+        if settings.spool_dir:
+            pathlib.Path(settings.spool_dir).mkdir(parents=True, exist_ok=True)
+            self._spool_path = pathlib.Path(settings.spool_dir) / SPOOL_FILE_NAME
+
+        self._client = influxdb_client.InfluxDBClient(
+            url=settings.url, token=settings.token, org=settings.org)
+        self._write_api = self._client.write_api(
+            write_options=WriteOptions(batch_size=settings.batch_size,
+                                       flush_interval=settings.flush_interval_ms,
+                                       retry_interval=settings.retry_interval_ms,
+                                       max_retries=settings.max_retries,
+                                       max_retry_time=settings.max_retry_time_ms,
+                                       exponential_base=2),
+            success_callback=self._on_success,
+            error_callback=self._on_error,
+            retry_callback=self._on_retry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _on_success(self, conf, data):
+        with self._lock:
+            self.written += _count_lines(data)
+
+    def _on_retry(self, conf, data, exception):
+        logging.warning("Retrying a write of %d points: %s", _count_lines(data), exception)
+
+    def _on_error(self, conf, data, exception):
+        bucket, org, precision = conf
+        if not self._spool_path:
+            logging.error("Dropping %d points that could not be written: %s",
+                          _count_lines(data), exception)
+            return
+
+        logging.warning("Spooling %d points that could not be written: %s",
+                        _count_lines(data), exception)
+        with self._lock:
+            with open(self._spool_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({
+                    'bucket': bucket,
+                    'org': org,
+                    'precision': precision,
+                    'data': data.decode() if isinstance(data, bytes) else data,
+                }) + '\n')
+            self.spooled += _count_lines(data)
+
+    def write(self, records):
+        """Queue points for writing
+
+        Args:
+            records: A point or a list of points, in any format accepted
+                by the InfluxDB client, e.g. dictionaries
+        """
+        self._write_api.write(bucket=self._settings.bucket, org=self._settings.org,
+                              record=records)
+
+    def resend_spool(self) -> int:
+        """Queue the points of the spool for writing
+
+        Points that fail again are spooled again.
+
+        Returns:
+            int: The number of spooled points
+        """
+        if not self._spool_path:
+            return 0
+
+        # Moved away first, as failing batches are appended to the spool.
+        # It is only removed once the points were flushed, so a file left
+        # behind by an interrupted run is sent again as well.
+        sending_path = self._spool_path.with_suffix('.sending')
+        if self._spool_path.exists():
+            if sending_path.exists():
+                with open(sending_path, 'a', encoding='utf-8') as f:
+                    f.write(self._spool_path.read_text(encoding='utf-8'))
+                self._spool_path.unlink()
+            else:
+                os.replace(self._spool_path, sending_path)
+        if not sending_path.exists():
+            return 0
+
+        count = 0
+        with open(sending_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                batch = json.loads(line)
+                self._write_api.write(bucket=batch['bucket'], org=batch['org'],
+                                      write_precision=batch['precision'],
+                                      record=batch['data'])
+                count += _count_lines(batch['data'])
+        self._resent_path = sending_path
+
+        logging.info("Resending %d spooled points", count)
+        return count
+
+    def close(self):
+        """Flush the queued points and close the client
+
+        Points that could not be written are in the spool at this point.
+        """
+        self._write_api.close()
+        self._client.close()
+        if self._resent_path:
+            self._resent_path.unlink()
+            self._resent_path = None
+
+def _count_lines(data) -> int:
+    if isinstance(data, bytes):
+        data = data.decode()
+    return sum(1 for line in data.split('\n') if line)
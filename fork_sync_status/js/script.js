@@ -1,9 +1,21 @@
 var currentTab;
 
+/* The data of an uploaded file, shown again when another branch is selected */
+var uploadedData = null;
+
 function show_reverts_selected() {
     return document.getElementById('checkbox_show_reverted').checked;
 }
 
+/* Whether a commit is reverted, once reverts of reverts are resolved.
+ * Older data only has the SHA of the revert. */
+function isReverted(item) {
+    if ('effectively_reverted' in item) {
+        return item.effectively_reverted;
+    }
+    return Boolean(item.reverted_by_sha);
+}
+
 function shaToLink(repo_name, sha) {
     const short_sha = sha.substring(0, 10);
     return `<a href="${repo_name}/commit/${sha}">${short_sha}</a>`;
@@ -20,14 +32,130 @@ function utcSecondsToDate(utcSeconds) {
     return timestamp.toISOString().slice(0, 10);
 }
 
+/* The commits shown in each tab, by the id of its table.
+ * page_views.py selects the same commits when it precomputes the views. */
+const VIEW_FILTERS = {
+    commits_only_downstream: data => data.downstream_commits.filter(entry => !(entry.upstream_sha || entry.upstream_sha_guess)),
+    commits_not_downstream: data => data.upstream_commits.filter(entry => !(entry.downstream_sha || entry.downstream_sha_guess)),
+    commits_fromlist: data => data.downstream_commits.filter(entry => entry.upstream_pr),
+    commits_fromtree: data => data.downstream_commits.filter(entry => entry.upstream_sha),
+    commits_noup: data => data.downstream_commits.filter(entry => entry.title.startsWith("[nrf noup]")),
+    commits_reverted_downstream: data => data.downstream_commits.filter(isReverted),
+};
+
+const VIEW_TABLES = {
+    commits_only_downstream: updateDownstreamOnlyTable,
+    commits_not_downstream: updateUpstreamOnlyTable,
+    commits_fromlist: updateFromListTable,
+    commits_fromtree: updateFromTreeTable,
+    commits_noup: updateNoUpTable,
+    commits_reverted_downstream: updateRevertedDownstreamTable,
+};
+
+/* The columns which can be looked up in the trigram index of a view, by header */
+const INDEXED_COLUMNS = {
+    'Title': 'title',
+    'Author': 'author',
+};
+
+/* The view shown in each table, and the position in the view of the commit in each row */
+var tableViews = {};
+
+function isCategory(item, tag) {
+    return !isReverted(item) && item.title.startsWith(tag);
+}
+
+function summaryCounts(data) {
+    const fromlist = data.downstream_commits.filter(item => isCategory(item, "[nrf fromlist]"));
+    return {
+        upstream_commits: data.upstream_commits.length,
+        downstream_commits: data.downstream_commits.length,
+        reverted: data.downstream_commits.filter(isReverted).length,
+        noup: data.downstream_commits.filter(item => isCategory(item, "[nrf noup]")).length,
+        fromtree: data.downstream_commits.filter(item => isCategory(item, "[nrf fromtree]")).length,
+        fromlist: fromlist.length,
+        fromlist_likely_merged: fromlist.filter(item => item.upstream_sha_guess).length,
+        fromlist_not_merged: fromlist.filter(item => !item.upstream_sha_guess).length,
+        upstream_only: VIEW_FILTERS.commits_not_downstream(data).length,
+        clean_cherry_pick: data.upstream_commits.filter(entry => entry.supports_clean_cherry_pick).length,
+    };
+}
+
+/* Offer the downstream revisions of multi-branch data, and return the selected one.
+ * The selection is kept while the same revision is available. */
+function selectBranch(revs) {
+    const selector = document.getElementById('select_branch');
+    const selected = selector.value;
+
+    selector.innerHTML = "";
+    for (const rev of revs) {
+        selector.add(new Option(rev, rev));
+    }
+    if (revs.includes(selected)) {
+        selector.value = selected;
+    }
+    document.getElementById('branch_selection').style.display = revs.length ? "block" : "none";
+
+    return selector.value;
+}
+
+/* The data of the selected downstream revision */
+function branchData(data) {
+    if (!data.branches) {
+        selectBranch([]);
+        return data;
+    }
+    return data.branches[selectBranch(Object.keys(data.branches))];
+}
+
 function displayData(data) {
-    updateDataSourceTable(data);
-    updateDownstreamOnlyTable(data);
-    updateUpstreamOnlyTable(data);
-    updateFromListTable(data);
-    updateFromTreeTable(data);
-    updateNoUpTable(data);
-    updateRevertedDownstreamTable(data);
+    data = branchData(data);
+    updateDataSourceTable(data.meta, data.merge_base, summaryCounts(data));
+    for (const [view, updateViewTable] of Object.entries(VIEW_TABLES)) {
+        updateViewTable(data.meta, { commits: VIEW_FILTERS[view](data) });
+    }
+}
+
+/* Fetch a JSON document, compressed with gzip or not */
+async function fetchJson(url) {
+    const response = await fetch(url);
+    if (!response.ok) {
+        throw new Error(`Failed to fetch ${url}: ${response.status}`);
+    }
+
+    const content = new Uint8Array(await response.arrayBuffer());
+    if (content[0] != 0x1f || content[1] != 0x8b) {
+        /* Already decompressed by the browser */
+        return JSON.parse(new TextDecoder().decode(content));
+    }
+    const stream = new Blob([content]).stream().pipeThrough(new DecompressionStream('gzip'));
+    return await new Response(stream).json();
+}
+
+/* Display the views precomputed by page_views.py.
+ * The table of the open tab is rendered first, the others once loaded. */
+async function displayViews(directory) {
+    var index = await fetchJson(directory + 'index.json.gz');
+    if (index.branches) {
+        /* Several downstream revisions were analyzed, show the selected one */
+        directory += index.branches[selectBranch(Object.keys(index.branches))].directory + '/';
+        index = await fetchJson(directory + 'index.json.gz');
+    } else {
+        selectBranch([]);
+    }
+
+    updateDataSourceTable(index.meta, index.merge_base, index.summary);
+
+    const url_params = new URLSearchParams(window.location.search);
+    const firstView = currentTab || url_params.get('tab') || 'commits_not_downstream';
+    const views = Object.keys(VIEW_TABLES).sort((a, b) => (b == firstView) - (a == firstView));
+
+    for (const view of views) {
+        document.getElementById(`lbl_${view}_count`).innerHTML = "Loading...";
+    }
+    for (const view of views) {
+        VIEW_TABLES[view](index.meta, await fetchJson(directory + index.views[view].file));
+    }
 }
 
 function updateUrl(currentTab, table) {
@@ -45,6 +173,77 @@ function updateUrl(currentTab, table) {
     window.history.pushState({ path: newUrl }, '', newUrl);
 }
 
+/* The literal text a filter requires in a cell, if it is a plain substring.
+ * Text with HTML special characters is displayed differently than it is indexed. */
+function filterLiteral(filter) {
+    const literal = filter.replace(/^(\.\*)+/, '').replace(/(\.\*)+$/, '');
+    if (/[\\^$.|?*+()[\]{}&<>]/.test(literal)) {
+        return null;
+    }
+    return literal;
+}
+
+/* Split by code point, like page_views.py does */
+function trigrams(text) {
+    const characters = Array.from(text.toLowerCase());
+    const result = new Set();
+    for (let i = 0; i + 3 <= characters.length; i++) {
+        result.add(characters.slice(i, i + 3).join(''));
+    }
+    return result;
+}
+
+/* The positions in the view of the commits containing a trigram in a field */
+function trigramPositions(tableView, field, trigram) {
+    const key = field + '\0' + trigram;
+    if (!(key in tableView.postings)) {
+        /* The positions are delta-encoded */
+        const deltas = tableView.view.trigrams[field][trigram] || [];
+        const positions = new Set();
+        let position = 0;
+        deltas.forEach(delta => {
+            position += delta;
+            positions.add(position);
+        });
+        tableView.postings[key] = positions;
+    }
+    return tableView.postings[key];
+}
+
+/* The rows which may match the filters, looked up in the trigram index of the view.
+ * Returns null when no filter can be looked up. */
+function candidateRows(tableView, headerCells, filters) {
+    if (!tableView.view.trigrams) {
+        return null;
+    }
+
+    let positions = null;
+    for (let j = 0; j < filters.length; j++) {
+        const field = INDEXED_COLUMNS[headerCells[j].innerText];
+        const literal = filterLiteral(filters[j]);
+        if (!field || !literal || Array.from(literal).length < 3) {
+            continue;
+        }
+
+        for (const trigram of trigrams(literal)) {
+            const matching = trigramPositions(tableView, field, trigram);
+            positions = new Set(positions ? [...positions].filter(position => matching.has(position)) : matching);
+        }
+    }
+
+    if (!positions) {
+        return null;
+    }
+
+    const rows = new Set();
+    tableView.positions.forEach((position, row) => {
+        if (positions.has(position)) {
+            rows.add(row);
+        }
+    });
+    return rows;
+}
+
 function filterColumn(table_id, input, column, summary_lbl) {
     var regex;
 
@@ -62,20 +261,28 @@ function filterColumn(table_id, input, column, summary_lbl) {
      * This is way much faster for larger tables. */
     var newTable = table.cloneNode(true)
 
+    const filters = [];
+    for (let j = 0; j < newTable.rows[0].cells.length; j++) {
+        filters.push(table.rows[1].cells[j].children[0].value);
+    }
+    const regexes = filters.map(filter => new RegExp('^' + filter + '$'));
+
+    const tableView = tableViews[table_id];
+    const candidates = tableView ? candidateRows(tableView, newTable.rows[0].cells, filters) : null;
+
     let totalCount = 0;
     let visibleCount = 0;
     for (let i = 2; i < newTable.rows.length; i++) {
         const row = newTable.rows[i]; // Access each row
 
-        let viewItem = true;
+        /* Rows ruled out by the trigram index are not matched */
+        let viewItem = !candidates || candidates.has(i - 2);
 
-        for (let j = 0; j < newTable.rows[0].cells.length; j++) {
-            regex = new RegExp('^' + table.rows[1].cells[j].children[0].value + '$');
+        for (let j = 0; viewItem && j < regexes.length; j++) {
             const cell_value = row.cells[j].innerText;
 
-            if (!cell_value.match(regex)) {
+            if (!cell_value.match(regexes[j])) {
                 viewItem = false;
-                break;
             }
         }
 
@@ -102,6 +309,9 @@ function filterColumn(table_id, input, column, summary_lbl) {
 
     /* Replace the old table, and make sure the new input box gets focus */
     table.parentNode.replaceChild(newTable, table);
+    if (tableView) {
+        tableViews[newTable.id] = tableView;
+    }
 
     let old_selection_start = table.rows[1].cells[column].children[0].selectionStart;
     let old_selection_end = table.rows[1].cells[column].children[0].selectionEnd;
@@ -118,7 +328,7 @@ function filterColumn(table_id, input, column, summary_lbl) {
     updateUrl(currentTab, table);
 }
 
-function updateTable(table, headerRow, template, commits, summary_lbl) {
+function updateTable(table, headerRow, template, view, summary_lbl) {
     row = table.insertRow();
     row.style.backgroundColor = "#333f67";
     row.style.color = "white";
@@ -152,10 +362,10 @@ function updateTable(table, headerRow, template, commits, summary_lbl) {
 
     const show_reverts = show_reverts_selected();
 
-    let commitCount = 0;
-    commits.forEach(item => {
-        if ((!item.reverted_by_sha && !item.reverts_sha) || show_reverts) {
-            commitCount++;
+    let positions = [];
+    view.commits.forEach((item, position) => {
+        if ((!isReverted(item) && !item.reverts_sha) || show_reverts) {
+            positions.push(position);
             row = table.insertRow()
             template.forEach(entry => {
                 const cell = document.createElement("td");
@@ -171,6 +381,9 @@ function updateTable(table, headerRow, template, commits, summary_lbl) {
         }
     });
 
+    tableViews[table.id] = { view: view, positions: positions, postings: {} };
+
+    const commitCount = positions.length;
     const label = document.getElementById(summary_lbl);
     label.innerHTML = "Showing " + commitCount + " out of " + commitCount + " elements.";
 
@@ -185,56 +398,32 @@ function updateTable(table, headerRow, template, commits, summary_lbl) {
     }
 }
 
-function updateDataSourceTable(data) {
+function updateDataSourceTable(meta, merge_base, counts) {
     var table = document.getElementById('tbl_data_config');
     table.innerHTML = "";
 
     const entries = [
         { title: "<b>Name</b>", val: "<b>Value</b>" },
-        { title: "Upstream URL", val: data.meta.upstream_url },
-        { title: "Upstream revision", val: data.meta.upstream_rev },
-        { title: "Downstream URL", val: data.meta.downstream_url },
-        { title: "Downstream revision", val: data.meta.downstream_rev },
-        { title: "Data was obtained at", val: utcSecondsToDate(data.meta.authored_seconds_since_epoch) },
-        { title: "Last rebase/Merge base SHA", val: shaToLink(data.meta.downstream_url, data.merge_base.sha) },
-        { title: "Last rebase/Merge base timestamp", val: utcSecondsToDate(data.merge_base.authored_seconds_since_epoch) },
+        { title: "Upstream URL", val: meta.upstream_url },
+        { title: "Upstream revision", val: meta.upstream_rev },
+        { title: "Downstream URL", val: meta.downstream_url },
+        { title: "Downstream revision", val: meta.downstream_rev },
+        { title: "Data was obtained at", val: utcSecondsToDate(meta.authored_seconds_since_epoch) },
+        { title: "Last rebase/Merge base SHA", val: shaToLink(meta.downstream_url, merge_base.sha) },
+        { title: "Last rebase/Merge base timestamp", val: utcSecondsToDate(merge_base.authored_seconds_since_epoch) },
         { title: "", val: "" },
-        { title: "Number of commits upstream after last rebase/Merge base", val: data.upstream_commits.length },
-        { title: "Number of downstream commits after last rebase/Merge base", val: data.downstream_commits.length },
-        {
-            title: "Number of reverted downstream commits after last rebase/Merge base",
-            val: data.downstream_commits.filter(entry => entry.reverted_by_sha).length
-        },
+        { title: "Number of commits upstream after last rebase/Merge base", val: counts.upstream_commits },
+        { title: "Number of downstream commits after last rebase/Merge base", val: counts.downstream_commits },
+        { title: "Number of reverted downstream commits after last rebase/Merge base", val: counts.reverted },
         { title: "", val: "" },
-        {
-            title: "Number of downstream noup commits",
-            val: data.downstream_commits.filter(item => !item.reverted_by_sha && item.title.startsWith("[nrf noup]")).length
-        },
-        {
-            title: "Number of downstream fromtree commits",
-            val: data.downstream_commits.filter(item => !item.reverted_by_sha && item.title.startsWith("[nrf fromtree]")).length
-        },
-        {
-            title: "Number of downstream fromlist commits",
-            val: data.downstream_commits.filter(item => !item.reverted_by_sha && item.title.startsWith("[nrf fromlist]")).length
-        },
-        {
-            title: "Number of downstream fromlist commits likely merged",
-            val: data.downstream_commits.filter(item => !item.reverted_by_sha && item.title.startsWith("[nrf fromlist]")).filter(item => item.upstream_sha_guess).length
-        },
-        {
-            title: "Number of downstream fromlist commits likely not yet merged",
-            val: data.downstream_commits.filter(item => !item.reverted_by_sha && item.title.startsWith("[nrf fromlist]")).filter(item => !item.upstream_sha_guess).length
-        },
+        { title: "Number of downstream noup commits", val: counts.noup },
+        { title: "Number of downstream fromtree commits", val: counts.fromtree },
+        { title: "Number of downstream fromlist commits", val: counts.fromlist },
+        { title: "Number of downstream fromlist commits likely merged", val: counts.fromlist_likely_merged },
+        { title: "Number of downstream fromlist commits likely not yet merged", val: counts.fromlist_not_merged },
         { title: "", val: "" },
-        {
-            title: "Number of commits upstream only",
-            val: data.upstream_commits.filter(entry => !(entry.downstream_sha || entry.downstream_sha_guess)).length
-        },
-        {
-            title: "Number of commits which can be cherry-picked cleanly",
-            val: data.upstream_commits.filter(entry => entry.supports_clean_cherry_pick).length
-        }
+        { title: "Number of commits upstream only", val: counts.upstream_only },
+        { title: "Number of commits which can be cherry-picked cleanly", val: counts.clean_cherry_pick }
     ];
 
     entries.forEach(item => {
@@ -248,7 +437,7 @@ function updateDataSourceTable(data) {
     });
 }
 
-function updateDownstreamOnlyTable(data) {
+function updateDownstreamOnlyTable(meta, view) {
     var table = document.getElementById('tbl_commits_only_downstream');
     table.innerHTML = "";
 
@@ -262,25 +451,24 @@ function updateDownstreamOnlyTable(data) {
         'Author Email'];
     let template = [
         (item) => item.title,
-        (item) => shaToLink(data.meta.downstream_url, item.sha),
+        (item) => shaToLink(meta.downstream_url, item.sha),
         (item) => utcSecondsToDate(item.authored_seconds_since_epoch),
         (item) => utcSecondsToDate(item.committed_seconds_since_epoch),
-        (item) => item['upstream_pr'] ? prToLink(data.meta.upstream_url, item.upstream_pr) : "",
+        (item) => item['upstream_pr'] ? prToLink(meta.upstream_url, item.upstream_pr) : "",
         (item) => item.author,
         (item) => item.author_email,
     ];
 
     if (show_reverts_selected()) {
         headerRow.push('Reverted by');
-        template.push((item) => item.reverted_by_sha ? shaToLink(data.meta.downstream_url, item.reverted_by_sha) : "");
+        template.push((item) => item.reverted_by_sha ? shaToLink(meta.downstream_url, item.reverted_by_sha) : "");
     }
 
-    updateTable(table, headerRow, template,
-        data.downstream_commits.filter(entry => !(entry.upstream_sha || entry.upstream_sha_guess)),
+    updateTable(table, headerRow, template, view,
         'lbl_commits_only_downstream_count');
 }
 
-function updateUpstreamOnlyTable(data) {
+function updateUpstreamOnlyTable(meta, view) {
     var table = document.getElementById('tbl_commits_not_downstream');
     table.innerHTML = "";
 
@@ -294,7 +482,7 @@ function updateUpstreamOnlyTable(data) {
         'Author Email',];
     const template = [
         (item) => item.title,
-        (item) => shaToLink(data.meta.upstream_url, item.sha),
+        (item) => shaToLink(meta.upstream_url, item.sha),
         (item) => utcSecondsToDate(item.authored_seconds_since_epoch),
         (item) => utcSecondsToDate(item.committed_seconds_since_epoch),
         (item) => item.supports_clean_cherry_pick ? '<b style="color:green">Yes</b' : '<b style="color:red">No</b',
@@ -302,12 +490,11 @@ function updateUpstreamOnlyTable(data) {
         (item) => item.author_email,
     ];
 
-    updateTable(table, headerRow, template,
-        data.upstream_commits.filter(entry => !(entry.downstream_sha || entry.downstream_sha_guess)),
+    updateTable(table, headerRow, template, view,
         'lbl_commits_not_downstream_count');
 }
 
-function updateFromListTable(data) {
+function updateFromListTable(meta, view) {
     var table = document.getElementById('tbl_commits_fromlist');
     table.innerHTML = "";
 
@@ -321,12 +508,12 @@ function updateFromListTable(data) {
         'Author Email'];
     const template = [
         (item) => item.title,
-        (item) => shaToLink(data.meta.downstream_url, item.sha),
+        (item) => shaToLink(meta.downstream_url, item.sha),
         (item) => utcSecondsToDate(item.authored_seconds_since_epoch),
         (item) => utcSecondsToDate(item.committed_seconds_since_epoch),
         (item) => {
-            const pr_link = item['upstream_pr'] ? prToLink(data.meta.upstream_url, item.upstream_pr) : "";
-            const upstream_sha_guess = item['upstream_sha_guess'] ? shaToLink(data.meta.upstream_url, item.upstream_sha_guess) : "";
+            const pr_link = item['upstream_pr'] ? prToLink(meta.upstream_url, item.upstream_pr) : "";
+            const upstream_sha_guess = item['upstream_sha_guess'] ? shaToLink(meta.upstream_url, item.upstream_sha_guess) : "";
             if (pr_link && upstream_sha_guess) {
                 return pr_link + ' / ' + upstream_sha_guess;
             } else if (pr_link) {
@@ -341,15 +528,14 @@ function updateFromListTable(data) {
 
     if (show_reverts_selected()) {
         headerRow.push('Reverted by');
-        template.push((item) => item.reverted_by_sha ? shaToLink(data.meta.downstream_url, item.reverted_by_sha) : "");
+        template.push((item) => item.reverted_by_sha ? shaToLink(meta.downstream_url, item.reverted_by_sha) : "");
     }
 
-    updateTable(table, headerRow, template,
-        data.downstream_commits.filter(entry => entry.upstream_pr),
+    updateTable(table, headerRow, template, view,
         'lbl_commits_fromlist_count');
 }
 
-function updateFromTreeTable(data) {
+function updateFromTreeTable(meta, view) {
     var table = document.getElementById('tbl_commits_fromtree');
     table.innerHTML = "";
 
@@ -363,8 +549,8 @@ function updateFromTreeTable(data) {
         'Author Email'];
     const template = [
         (item) => item.title,
-        (item) => shaToLink(data.meta.downstream_url, item.sha),
-        (item) => item['upstream_sha'] ? shaToLink(data.meta.upstream_url, item.upstream_sha) : "",
+        (item) => shaToLink(meta.downstream_url, item.sha),
+        (item) => item['upstream_sha'] ? shaToLink(meta.upstream_url, item.upstream_sha) : "",
         (item) => utcSecondsToDate(item.authored_seconds_since_epoch),
         (item) => utcSecondsToDate(item.committed_seconds_since_epoch),
         (item) => item.author,
@@ -373,15 +559,14 @@ function updateFromTreeTable(data) {
 
     if (show_reverts_selected()) {
         headerRow.push('Reverted by');
-        template.push((item) => item.reverted_by_sha ? shaToLink(data.meta.downstream_url, item.reverted_by_sha) : "");
+        template.push((item) => item.reverted_by_sha ? shaToLink(meta.downstream_url, item.reverted_by_sha) : "");
     }
 
-    updateTable(table, headerRow, template,
-        data.downstream_commits.filter(entry => entry.upstream_sha),
+    updateTable(table, headerRow, template, view,
         'lbl_commits_fromtree_count');
 }
 
-function updateNoUpTable(data) {
+function updateNoUpTable(meta, view) {
     var table = document.getElementById('tbl_commits_noup');
     table.innerHTML = "";
 
@@ -394,7 +579,7 @@ function updateNoUpTable(data) {
         'Author Email'];
     const template = [
         (item) => item.title,
-        (item) => shaToLink(data.meta.downstream_url, item.sha),
+        (item) => shaToLink(meta.downstream_url, item.sha),
         (item) => utcSecondsToDate(item.authored_seconds_since_epoch),
         (item) => utcSecondsToDate(item.committed_seconds_since_epoch),
         (item) => item.author,
@@ -403,15 +588,14 @@ function updateNoUpTable(data) {
 
     if (show_reverts_selected()) {
         headerRow.push('Reverted by');
-        template.push((item) => item.reverted_by_sha ? shaToLink(data.meta.downstream_url, item.reverted_by_sha) : "");
+        template.push((item) => item.reverted_by_sha ? shaToLink(meta.downstream_url, item.reverted_by_sha) : "");
     }
 
-    updateTable(table, headerRow, template,
-        data.downstream_commits.filter(entry => entry.title.startsWith("[nrf noup]")),
+    updateTable(table, headerRow, template, view,
         'lbl_commits_noup_count');
 }
 
-function updateRevertedDownstreamTable(data) {
+function updateRevertedDownstreamTable(meta, view) {
     var table = document.getElementById('tbl_commits_reverted_downstream');
     table.innerHTML = "";
 
@@ -425,16 +609,15 @@ function updateRevertedDownstreamTable(data) {
         'Author Email'];
     const template = [
         (item) => item.title,
-        (item) => shaToLink(data.meta.downstream_url, item.sha),
-        (item) => shaToLink(data.meta.downstream_url, item.reverted_by_sha),
+        (item) => shaToLink(meta.downstream_url, item.sha),
+        (item) => shaToLink(meta.downstream_url, item.reverted_by_sha),
         (item) => utcSecondsToDate(item.authored_seconds_since_epoch),
         (item) => utcSecondsToDate(item.committed_seconds_since_epoch),
         (item) => item.author,
         (item) => item.author_email,
     ];
 
-    updateTable(table, headerRow, template,
-        data.downstream_commits.filter(entry => entry.reverted_by_sha),
+    updateTable(table, headerRow, template, view,
         'lbl_commits_reverted_downstream_count');
 }
 
@@ -470,9 +653,12 @@ function openTab(evt, tabName) {
 }
 
 function loadFromCache() {
-    fetch('data/data.json')
-        .then(data => data.json())
-        .then(data => displayData(data));
+    uploadedData = null;
+    /* Older data has no precomputed views */
+    displayViews('data/views/')
+        .catch(() => fetch('data/data.json')
+            .then(data => data.json())
+            .then(data => displayData(data)));
 }
 
 function loadFromFile() {
@@ -484,7 +670,8 @@ function loadFromFile() {
         if (file) {
             const reader = new FileReader();
             reader.onload = event => {
-                displayData(JSON.parse(event.target.result));
+                uploadedData = JSON.parse(event.target.result);
+                displayData(uploadedData);
             };
             reader.readAsText(file);
         }
@@ -492,6 +679,14 @@ function loadFromFile() {
     input.click()
 }
 
+function onBranchChange() {
+    if (uploadedData) {
+        displayData(uploadedData);
+    } else {
+        loadFromCache();
+    }
+}
+
 function onPageLoad() {
     let input_data_src = document.querySelectorAll('input[name="radio_data_src"]');
 
@@ -0,0 +1,388 @@
+"""Conflict checks based upon git merge-tree
+
+Two backends are supported:
+
+* batch: A single long-lived ``git merge-tree --write-tree --stdin``
+  process which performs real merges and reports the conflicting paths.
+  This requires git 2.40 or newer.
+* legacy: One trivial ``git merge-tree`` invocation per commit.
+
+Merges that have to produce a tree, e.g. to apply commits one after
+another, go through CherryPicker, which uses MergeTreeBatch where
+possible and IndexMerge otherwise.
+"""
+
+import os
+import subprocess
+import tempfile
+import threading
+import typing
+import git
+
+MERGE_TREE_BACKENDS = ('auto', 'batch', 'legacy')
+
+MIN_BATCH_GIT_VERSION = (2, 40)
+
+class MergeTreeResult(typing.NamedTuple):
+    """The outcome of a single conflict check"""
+
+    clean: bool
+    conflicting_paths: typing.Tuple[str, ...] = ()
+    # The merged tree, if the merge was clean and the backend wrote it
+    tree: typing.Optional[str] = None
+
+def supports_batch(repo: git.Repo) -> bool:
+    """Checks if the installed git supports merge-tree --stdin
+
+    Args:
+        repo (git.Repo): The git repo
+
+    Returns:
+        bool: True if the batch backend can be used
+    """
+    return repo.git.version_info[:2] >= MIN_BATCH_GIT_VERSION
+
+def resolve_backend(repo: git.Repo, backend: str) -> str:
+    """Resolve the backend to use
+
+    Args:
+        repo (git.Repo): The git repo
+        backend (str): One of MERGE_TREE_BACKENDS
+
+    Returns:
+        str: Either 'batch' or 'legacy'
+    """
+    if backend not in MERGE_TREE_BACKENDS:
+        raise ValueError(f'Unknown merge-tree backend: {backend}')
+
+    if backend == 'auto':
+        return 'batch' if supports_batch(repo) else 'legacy'
+
+    if backend == 'batch' and not supports_batch(repo):
+        raise RuntimeError(
+            f'git merge-tree --stdin requires git '
+            f'{".".join(map(str, MIN_BATCH_GIT_VERSION))} or newer')
+
+    return backend
+
+def parse_legacy_status(status: str) -> bool:
+    """Interpret the output of the legacy (trivial) git merge-tree
+
+    Args:
+        status (str): The output of git merge-tree
+
+    Returns:
+        bool: True if the merge is free of conflicts
+
+    Raises:
+        ValueError: The output is not understood
+    """
+    if status.startswith('changed in') or \
+        status.startswith('added in') or \
+        status.startswith('removed in') or \
+        status.startswith('merged'):
+        return False
+    elif status == '':
+        return True
+    else:
+        raise ValueError(f'Unexpected git merge-tree output: {status!r}')
+
+def legacy_cherry_pick(repo: git.Repo,
+                       base_sha: str,
+                       commit_sha: str,
+                       parent_sha: str) -> MergeTreeResult:
+    """Check a commit with one invocation of the legacy git merge-tree
+
+    Args:
+        repo (git.Repo): The git repo
+        base_sha (str): The commit to cherry-pick onto
+        commit_sha (str): The commit to be cherry-picked
+        parent_sha (str): The parent of the commit to be cherry-picked
+
+    Returns:
+        MergeTreeResult: The outcome. Conflicting paths are not reported.
+    """
+    status = repo.git.merge_tree(base_sha, commit_sha, parent_sha)
+
+    return MergeTreeResult(parse_legacy_status(status))
+
+class _NulTokenReader:
+    """Reads NUL terminated tokens from a binary stream"""
+
+    def __init__(self, stream: typing.BinaryIO):
+        self._stream = stream
+        self._buffer = b''
+
+    def read_token(self) -> str:
+        """Read the next token
+
+        Raises:
+            EOFError: The stream ended before the token was terminated
+        """
+        while True:
+            end = self._buffer.find(b'\0')
+            if end >= 0:
+                token = self._buffer[:end]
+                self._buffer = self._buffer[end + 1:]
+                return token.decode('utf-8', errors='surrogateescape')
+
+            chunk = self._stream.read1(65536)
+            if not chunk:
+                raise EOFError('git merge-tree terminated unexpectedly')
+            self._buffer += chunk
+
+class MergeTreeBatch:
+    """A long-lived git merge-tree --write-tree --stdin process
+
+    Each input line describes one merge. The process answers with the
+    merge status, the resulting tree and the conflicting paths, all NUL
+    terminated, and an empty token after each merge.
+    """
+
+    def __init__(self, git_dir: str):
+        self._process = subprocess.Popen(
+            ['git', '--git-dir', git_dir, 'merge-tree', '--write-tree',
+             '--stdin', '--name-only', '--no-messages'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+        self._reader = _NulTokenReader(self._process.stdout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Terminate the git process"""
+        if self._process.stdin and not self._process.stdin.closed:
+            self._process.stdin.close()
+        self._process.stdout.close()
+        self._process.wait()
+
+    def _read_result(self) -> MergeTreeResult:
+        status = self._reader.read_token()
+        if status not in ('0', '1'):
+            raise RuntimeError(f'git merge-tree failed with status {status}')
+
+        tree = self._reader.read_token()
+
+        conflicting_paths = []
+        while True:
+            path = self._reader.read_token()
+            if not path:
+                break
+            conflicting_paths.append(path)
+
+        clean = status == '1'
+        return MergeTreeResult(clean, tuple(conflicting_paths), tree if clean else None)
+
+    def merge(self,
+              merges: typing.Iterable[typing.Tuple[str, str, str]]) \
+                  -> typing.Iterator[MergeTreeResult]:
+        """Stream merges through the process
+
+        The input is written from a separate thread so that neither
+        side of the pipe can fill up and block the other one.
+
+        Args:
+            merges: Tuples of (merge base, branch1, branch2)
+
+        Yields:
+            MergeTreeResult: The outcome of each merge, in input order
+        """
+        merges = list(merges)
+
+        def feed():
+            for merge_base, branch1, branch2 in merges:
+                self._process.stdin.write(
+                    f'{merge_base} -- {branch1} {branch2}\n'.encode())
+            self._process.stdin.flush()
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        try:
+            for _ in merges:
+                yield self._read_result()
+        finally:
+            feeder.join()
+
+    def cherry_pick(self,
+                    base_sha: str,
+                    commit_and_parent_shas: typing.Iterable[typing.Tuple[str, str]]) \
+                        -> typing.Iterator[MergeTreeResult]:
+        """Check if commits can be cherry-picked on top of a base commit
+
+        Each commit is merged into the base commit using the parent of
+        the commit as merge base, which is what git cherry-pick does.
+
+        Args:
+            base_sha (str): The commit to cherry-pick onto
+            commit_and_parent_shas: The commits along with their first parent
+
+        Yields:
+            MergeTreeResult: The outcome for each commit, in input order
+        """
+        return self.merge((parent_sha, base_sha, sha)
+                          for sha, parent_sha in commit_and_parent_shas)
+
+
+class IndexMerge:
+    """Three-way merges of trees in a private index file
+
+    This is used to write merge results where git merge-tree --stdin is
+    not available. The trees are merged with git read-tree, and the
+    files changed on both sides with git merge-file, which is what git
+    cherry-pick does, apart from the detection of renames. Neither the
+    index nor the working tree of the repo are touched.
+    """
+
+    def __init__(self, git_dir: str):
+        self._repo = git.Repo(git_dir)
+        self._directory = tempfile.TemporaryDirectory()
+        self._env = {'GIT_INDEX_FILE': os.path.join(self._directory.name, 'index')}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Remove the index file"""
+        self._directory.cleanup()
+
+    def merge(self, merge_base: str, branch1: str, branch2: str) -> MergeTreeResult:
+        """Merge two trees
+
+        Args:
+            merge_base (str): The tree-ish both sides are compared to
+            branch1 (str): Our side
+            branch2 (str): Their side
+
+        Returns:
+            MergeTreeResult: The outcome, with the merged tree if it was clean
+        """
+        repo_git = self._repo.git
+        # Otherwise the entries left by the previous merge get in the way
+        if os.path.exists(self._env['GIT_INDEX_FILE']):
+            os.unlink(self._env['GIT_INDEX_FILE'])
+        repo_git.read_tree('-m', '-i', '--aggressive', merge_base, branch1, branch2,
+                           env=self._env)
+
+        try:
+            return MergeTreeResult(True, (), repo_git.write_tree(env=self._env))
+        except git.GitCommandError:
+            # There are unmerged entries
+            pass
+
+        conflicting_paths = tuple(path for path, stages in self._unmerged_entries().items()
+                                  if not self._merge_file(path, stages))
+        if conflicting_paths:
+            return MergeTreeResult(False, conflicting_paths)
+
+        return MergeTreeResult(True, (), repo_git.write_tree(env=self._env))
+
+    def cherry_pick(self, base_sha: str, sha: str, parent_sha: str) -> MergeTreeResult:
+        """Apply the changes of a commit to a tree-ish
+
+        Args:
+            base_sha (str): The tree-ish to cherry-pick onto
+            sha (str): The commit to be cherry-picked
+            parent_sha (str): The parent of the commit to be cherry-picked
+
+        Returns:
+            MergeTreeResult: The outcome, with the resulting tree if it was clean
+        """
+        return self.merge(parent_sha, base_sha, sha)
+
+    def _unmerged_entries(self) -> typing.Dict[str, typing.Dict[int, typing.Tuple[str, str]]]:
+        """The (mode, object id) of the stages of each unmerged path"""
+        entries = {}
+        output = self._repo.git.ls_files('-u', '-z', env=self._env)
+        for entry in output.split('\0'):
+            if not entry:
+                continue
+            info, path = entry.split('\t', 1)
+            mode, oid, stage = info.split()
+            entries.setdefault(path, {})[int(stage)] = (mode, oid)
+        return entries
+
+    def _merge_file(self, path: str, stages: typing.Dict[int, typing.Tuple[str, str]]) -> bool:
+        """Merge the contents of a file changed on both sides
+
+        Returns:
+            bool: True if the file was merged without conflicts
+        """
+        if sorted(stages) != [1, 2, 3] or \
+                any(mode not in ('100644', '100755') for mode, _ in stages.values()):
+            # Added, deleted, or not a regular file on one of the sides
+            return False
+
+        base_mode, ours_mode, theirs_mode = (stages[stage][0] for stage in (1, 2, 3))
+        if ours_mode != base_mode and theirs_mode != base_mode and ours_mode != theirs_mode:
+            return False
+        mode = theirs_mode if ours_mode == base_mode else ours_mode
+
+        file_names = []
+        for stage in (2, 1, 3):
+            file_name = os.path.join(self._directory.name, f'stage{stage}')
+            with open(file_name, 'wb') as f:
+                f.write(self._repo.git.cat_file('blob', stages[stage][1],
+                                                stdout_as_string=False))
+            file_names.append(file_name)
+
+        merged = subprocess.run(['git', 'merge-file', '-p', '-q', *file_names],
+                                capture_output=True, check=False)
+        if merged.returncode != 0:
+            return False
+
+        oid = subprocess.run(['git', '--git-dir', self._repo.git_dir,
+                              'hash-object', '-w', '--stdin'],
+                             input=merged.stdout, capture_output=True, check=True)
+        self._repo.git.update_index('--cacheinfo', f'{mode},{oid.stdout.decode().strip()},{path}',
+                                    env=self._env)
+        return True
+
+class CherryPicker:
+    """Cherry-picks commits without a worktree, writing the resulting trees
+
+    Use it as a context manager, or call close().
+    """
+
+    def __init__(self, git_dir: str, backend: str):
+        """
+        Args:
+            git_dir (str): The git directory of the repo
+            backend (str): Either 'batch' or 'legacy', see resolve_backend()
+        """
+        if backend == 'batch':
+            self._merger = MergeTreeBatch(git_dir)
+        else:
+            self._merger = IndexMerge(git_dir)
+        self._backend = backend
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Terminate the git process or remove the index file"""
+        self._merger.close()
+
+    def cherry_pick(self, onto: str, sha: str, parent_sha: str) -> MergeTreeResult:
+        """Apply the changes of a single commit
+
+        Args:
+            onto (str): The commit to apply the changes to
+            sha (str): The commit to be cherry-picked
+            parent_sha (str): The parent of the commit to be cherry-picked
+
+        Returns:
+            MergeTreeResult: The outcome, with the resulting tree if it was clean
+        """
+        if self._backend == 'batch':
+            return list(self._merger.cherry_pick(onto, [(sha, parent_sha)]))[0]
+        return self._merger.cherry_pick(onto, sha, parent_sha)
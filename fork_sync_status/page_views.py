@@ -0,0 +1,174 @@
+"""Precomputed views of fork sync data for the web page
+
+The page shows every commit list in a tab, and filters the tables with
+a regular expression per column. With the whole data set in a single
+JSON document, the page has to download and parse all of it before the
+first table is shown, and every key stroke in a filter matches every
+row.
+
+Here, the commits of each tab are selected once, when the data is
+generated, and written to one gzip-compressed file per tab. A small
+index file holds the meta data, the merge base, the numbers shown in
+the configuration table and the size of each view, so the page only
+downloads the index and the file of the open tab before it renders.
+
+Every view also carries a trigram index of the titles and authors of
+its commits: for each lowercase sequence of three characters, the
+positions of the commits containing it. A filter that is a plain
+substring is answered by intersecting the positions of its trigrams,
+and the regular expression is then only matched against those
+candidates. The positions are delta-encoded to keep the files small.
+"""
+
+import gzip
+import json
+import os
+import pathlib
+import typing
+
+import sync_data_io
+
+VIEWS_DIRECTORY_NAME = 'views'
+
+INDEX_FILE_NAME = 'index.json.gz'
+
+# The fields of the commits which are indexed by trigrams
+INDEXED_FIELDS = ('title', 'author')
+
+def _is_category(item: dict, tag: str) -> bool:
+    return not sync_data_io.is_reverted(item) and item['title'].startswith(tag)
+
+# The commits shown in each tab of the page, by the id of its table
+VIEWS = {
+    'commits_only_downstream': (
+        'downstream_commits',
+        lambda item: not (item.get('upstream_sha', None) or item.get('upstream_sha_guess', None))),
+    'commits_not_downstream': (
+        'upstream_commits',
+        lambda item: not (item.get('downstream_sha', None) or item.get('downstream_sha_guess', None))),
+    'commits_fromlist': ('downstream_commits', lambda item: bool(item.get('upstream_pr', None))),
+    'commits_fromtree': ('downstream_commits', lambda item: bool(item.get('upstream_sha', None))),
+    'commits_noup': ('downstream_commits', lambda item: item['title'].startswith('[nrf noup]')),
+    'commits_reverted_downstream': ('downstream_commits', sync_data_io.is_reverted),
+}
+
+def summary(data: dict) -> typing.Dict[str, int]:
+    """The numbers shown in the configuration table of the page
+
+    Args:
+        data (dict): The fork sync data of a single downstream revision
+
+    Returns:
+        dict: The numbers, by name
+    """
+    upstream = data.get('upstream_commits', [])
+    downstream = data.get('downstream_commits', [])
+    fromlist = [item for item in downstream if _is_category(item, '[nrf fromlist]')]
+    return {
+        'upstream_commits': len(upstream),
+        'downstream_commits': len(downstream),
+        'reverted': sum(1 for item in downstream if sync_data_io.is_reverted(item)),
+        'noup': sum(1 for item in downstream if _is_category(item, '[nrf noup]')),
+        'fromtree': sum(1 for item in downstream if _is_category(item, '[nrf fromtree]')),
+        'fromlist': len(fromlist),
+        'fromlist_likely_merged': sum(1 for item in fromlist
+                                      if item.get('upstream_sha_guess', None)),
+        'fromlist_not_merged': sum(1 for item in fromlist
+                                   if not item.get('upstream_sha_guess', None)),
+        'upstream_only': len(select_view(data, 'commits_not_downstream')),
+        'clean_cherry_pick': sum(1 for item in upstream
+                                 if item.get('supports_clean_cherry_pick', None)),
+    }
+
+def select_view(data: dict, view: str) -> typing.List[dict]:
+    """The commits shown in a tab, in the order of the data"""
+    list_name, predicate = VIEWS[view]
+    return [item for item in data.get(list_name, []) if predicate(item)]
+
+def trigrams(text: str) -> typing.Set[str]:
+    """The distinct lowercase sequences of three characters of a text"""
+    text = text.lower()
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+def trigram_index(commits: typing.List[dict], field: str) -> typing.Dict[str, typing.List[int]]:
+    """Index the commits containing each trigram of a field
+
+    Returns:
+        dict: The delta-encoded ascending positions of the commits, by trigram
+    """
+    postings = {}
+    for position, item in enumerate(commits):
+        for trigram in trigrams(item.get(field, None) or ''):
+            postings.setdefault(trigram, []).append(position)
+
+    index = {}
+    for trigram, positions in sorted(postings.items()):
+        index[trigram] = [positions[0]] + [b - a for a, b in zip(positions, positions[1:])]
+    return index
+
+def _write_gzip_json(path: pathlib.Path, value):
+    """Write a gzip-compressed JSON document, atomically"""
+    with gzip.open(f'{path}.tmp', 'wt', encoding='utf-8') as f:
+        json.dump(value, f, separators=(',', ':'))
+    os.replace(f'{path}.tmp', path)
+
+def write_branch_views(directory: pathlib.Path, data: dict) -> dict:
+    """Write the views of a single downstream revision
+
+    Returns:
+        dict: The index of the views
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    index = {
+        'meta': data['meta'],
+        'merge_base': data['merge_base'],
+        'summary': summary(data),
+        'views': {},
+    }
+    for view in VIEWS:
+        commits = select_view(data, view)
+        _write_gzip_json(directory / f'{view}.json.gz', {
+            'commits': commits,
+            'trigrams': {field: trigram_index(commits, field) for field in INDEXED_FIELDS},
+        })
+        index['views'][view] = {'file': f'{view}.json.gz', 'count': len(commits)}
+    _write_gzip_json(directory / INDEX_FILE_NAME, index)
+    return index
+
+def views_directory_for(data_path: typing.Union[str, pathlib.Path]) -> pathlib.Path:
+    """Where the views of fork sync data are stored
+
+    Args:
+        data_path: A JSON document or a directory with a manifest
+
+    Returns:
+        pathlib.Path: The directory next to the data
+    """
+    data_path = pathlib.Path(data_path)
+    if data_path.is_dir():
+        return data_path / VIEWS_DIRECTORY_NAME
+    return data_path.parent / VIEWS_DIRECTORY_NAME
+
+def write_page_views(data_path: typing.Union[str, pathlib.Path], data: dict):
+    """Write the views of fork sync data next to it
+
+    The views of several downstream revisions are written to one
+    subdirectory per revision, listed by the top-level index.
+
+    Args:
+        data_path: The file or directory the data was written to
+        data (dict): The fork sync data
+    """
+    directory = views_directory_for(data_path)
+    data = sync_data_io.as_plain_data(data)
+    if sync_data_io.BRANCHES_KEY not in data:
+        write_branch_views(directory, data)
+        return
+
+    directory.mkdir(parents=True, exist_ok=True)
+    branches = {}
+    for rev, branch_data in data[sync_data_io.BRANCHES_KEY].items():
+        name = sync_data_io.branch_directory_name(rev)
+        write_branch_views(directory / name, branch_data)
+        branches[rev] = {'directory': name}
+    _write_gzip_json(directory / INDEX_FILE_NAME, {sync_data_io.BRANCHES_KEY: branches})
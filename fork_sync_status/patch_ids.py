@@ -0,0 +1,94 @@
+"""Match upstream and downstream commits by their patch ID
+
+Commits that introduce the same change have the same stable patch ID,
+no matter their title or commit message. The patch IDs of both commit
+ranges are computed by one git log -p | git patch-id pipeline, and an
+index from patch ID to upstream commit is used to find the downstream
+commits carrying the same change.
+"""
+
+import subprocess
+import typing
+import git
+
+def iter_patch_ids(repo: git.Repo,
+                   revs: typing.List[str]) -> typing.Iterator[typing.Tuple[str, str]]:
+    """Compute the stable patch IDs of the commits of a revision range
+
+    Merge commits and commits without changes have no patch ID.
+
+    Args:
+        repo (git.Repo): The git repo
+        revs: The revisions to pass to git log, e.g. ['tip', '^base']
+
+    Yields:
+        tuple: (patch ID, commit SHA) while they are being computed
+    """
+    git_dir = ['git', '--git-dir', repo.git_dir]
+    log = subprocess.Popen(
+        [*git_dir, 'log', '-p', '--no-merges', '--no-color', '--no-ext-diff',
+         '--format=commit %H', *revs, '--'],
+        stdout=subprocess.PIPE)
+    patch_id = subprocess.Popen(
+        [*git_dir, 'patch-id', '--stable'],
+        stdin=log.stdout,
+        stdout=subprocess.PIPE,
+        text=True)
+    # Only patch-id reads from git log now
+    log.stdout.close()
+
+    try:
+        for line in patch_id.stdout:
+            patch, sha = line.split()
+            yield patch, sha
+    finally:
+        patch_id.stdout.close()
+        patch_id.wait()
+        if log.wait() != 0:
+            raise git.GitCommandError(['git', 'log', '-p', *revs], log.returncode)
+
+def match_patch_ids(repo: git.Repo,
+                    merge_base: str,
+                    upstream_tip: str,
+                    downstream_tip: str,
+                    upstream_items: list,
+                    downstream_items: list) -> int:
+    """Annotate commits carrying the same change on the other side
+
+    Sets patch_id_match on the upstream and downstream CommitRepr
+    objects that have a counterpart with the same patch ID.
+
+    Args:
+        repo (git.Repo): The git repo
+        merge_base (str): The merge base
+        upstream_tip (str): The upstream tip
+        downstream_tip (str): The downstream tip
+        upstream_items: The upstream CommitRepr objects
+        downstream_items: The downstream CommitRepr objects
+
+    Returns:
+        int: The number of downstream commits that were matched
+    """
+    upstream_by_sha = {item.sha: item for item in upstream_items}
+    downstream_by_sha = {item.sha: item for item in downstream_items}
+
+    upstream_by_patch_id = {}
+    downstream_patch_ids = []
+    for patch_id, sha in iter_patch_ids(repo, [upstream_tip, downstream_tip, f'^{merge_base}']):
+        if sha in upstream_by_sha:
+            upstream_by_patch_id.setdefault(patch_id, upstream_by_sha[sha])
+        elif sha in downstream_by_sha:
+            downstream_patch_ids.append((patch_id, downstream_by_sha[sha]))
+
+    match_count = 0
+    for patch_id, downstream_item in downstream_patch_ids:
+        upstream_item = upstream_by_patch_id.get(patch_id)
+        if upstream_item is None:
+            continue
+
+        downstream_item.patch_id_match = upstream_item.sha
+        if not upstream_item.patch_id_match:
+            upstream_item.patch_id_match = downstream_item.sha
+        match_count += 1
+
+    return match_count
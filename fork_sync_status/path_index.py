@@ -0,0 +1,265 @@
+"""Index of the paths changed by the analyzed commits
+
+The index is built with a single git log --name-only walk over the
+upstream and downstream ranges, parsed while it is being produced.
+Every path is stored once in a table, and every commit refers to its
+paths by their position in the table, in a compact array.
+
+Subsystems are defined by CODEOWNERS-style path patterns. The patterns
+are matched once per distinct path, after which the subsystems of a
+commit are found by OR-ing bit masks.
+"""
+
+import array
+import json
+import os
+import pathlib
+import re
+import subprocess
+import sys
+import typing
+import git
+
+import commit_log
+import sync_data_io
+
+INDEX_FILE_NAME = 'path_index.json'
+
+# Marks the start of a commit in the output of git log
+COMMIT_MARKER = '\x01'
+
+# CODEOWNERS-style patterns of the paths of each subsystem. A leading
+# slash anchors a pattern at the root of the repo, a trailing slash
+# matches everything in a directory, and * and ** match within a path
+# component and across components.
+SUBSYSTEM_PATHS = {
+    'Bluetooth': ('/subsys/bluetooth/', '/drivers/bluetooth/', '/include/zephyr/bluetooth/',
+                  '/samples/bluetooth/', '/tests/bluetooth/', '/tests/bsim/bluetooth/'),
+    'Networking': ('/subsys/net/', '/drivers/net/', '/drivers/ethernet/',
+                   '/include/zephyr/net/', '/samples/net/', '/tests/net/'),
+    'Kernel': ('/kernel/', '/include/zephyr/kernel.h', '/include/zephyr/kernel/'),
+    'Drivers': ('/drivers/', '/include/zephyr/drivers/'),
+    'Boards': ('/boards/',),
+    'Devicetree': ('/dts/', '*.dts', '*.dtsi', '*.overlay'),
+    'Build system': ('/cmake/', 'CMakeLists.txt', 'Kconfig*'),
+    'CI': ('/.github/', '/scripts/ci/'),
+}
+
+class PathIndex:
+    """The paths changed by each commit"""
+
+    def __init__(self):
+        self.paths: typing.List[str] = []
+        self._path_ids: typing.Dict[str, int] = {}
+        self.commits: typing.Dict[str, array.array] = {}
+
+    def add_commit(self, sha: str, paths: typing.Iterable[str]):
+        """Add the paths changed by a commit"""
+        path_ids = array.array('I')
+        for path in paths:
+            path_id = self._path_ids.get(path)
+            if path_id is None:
+                path_id = len(self.paths)
+                path = sys.intern(path)
+                self.paths.append(path)
+                self._path_ids[path] = path_id
+            path_ids.append(path_id)
+        self.commits[sys.intern(sha)] = path_ids
+
+    def commit_paths(self, sha: str) -> typing.List[str]:
+        """The paths changed by a commit, empty if it is not indexed"""
+        return [self.paths[path_id] for path_id in self.commits.get(sha, ())]
+
+    def to_dict(self) -> dict:
+        """Returns a dictionary representation"""
+        return {
+            'paths': self.paths,
+            'commits': {sha: path_ids.tolist() for sha, path_ids in self.commits.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, representation: dict) -> 'PathIndex':
+        """Create an index from its dictionary representation"""
+        index = cls()
+        index.paths = [sys.intern(path) for path in representation['paths']]
+        index._path_ids = {path: path_id for path_id, path in enumerate(index.paths)}
+        index.commits = {sys.intern(sha): array.array('I', path_ids)
+                         for sha, path_ids in representation['commits'].items()}
+        return index
+
+def parse_name_only_log(stream: typing.BinaryIO) \
+        -> typing.Iterator[typing.Tuple[str, typing.List[str]]]:
+    """Parse the output of git log --name-only -z --format=%x01%H
+
+    Args:
+        stream: The output of git log
+
+    Yields:
+        tuple: The SHA of each commit and the paths it changed
+    """
+    sha = None
+    paths = []
+    for token in commit_log.iter_nul_terminated(stream):
+        token = token.decode('utf-8', errors='surrogateescape')
+        if token.startswith(COMMIT_MARKER):
+            if sha:
+                yield sha, paths
+            sha = token[len(COMMIT_MARKER):]
+            paths = []
+        elif token:
+            # The first path of a commit follows a newline
+            paths.append(token[1:] if not paths and token.startswith('\n') else token)
+
+    if sha:
+        yield sha, paths
+
+def build_path_index(repo: git.Repo, revs: typing.List[str]) -> PathIndex:
+    """Index the paths changed by the commits of revision ranges
+
+    Args:
+        repo (git.Repo): The git repo
+        revs: The revisions to walk, e.g. the tips and the negated merge bases
+
+    Returns:
+        PathIndex: The index
+    """
+    index = PathIndex()
+    process = subprocess.Popen(
+        ['git', '--git-dir', repo.git_dir, 'log', '-z', '--name-only',
+         f'--format={COMMIT_MARKER}%H', *revs, '--'],
+        stdout=subprocess.PIPE)
+    try:
+        for sha, paths in parse_name_only_log(process.stdout):
+            index.add_commit(sha, paths)
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            raise git.GitCommandError(['git', 'log', '--name-only', *revs], process.returncode)
+
+    return index
+
+def index_file_for(data_path: typing.Union[str, pathlib.Path]) -> pathlib.Path:
+    """Where the index of fork sync data is stored
+
+    Args:
+        data_path: A JSON document, a manifest or a directory with a manifest
+
+    Returns:
+        pathlib.Path: The index file next to the data
+    """
+    data_path = pathlib.Path(data_path)
+    if data_path.is_dir():
+        return data_path / INDEX_FILE_NAME
+    return data_path.parent / INDEX_FILE_NAME
+
+def write_path_index(data_path: typing.Union[str, pathlib.Path], index: PathIndex):
+    """Write the index next to fork sync data"""
+    index_file = index_file_for(data_path)
+    with open(f'{index_file}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(index.to_dict(), f)
+    os.replace(f'{index_file}.tmp', index_file)
+
+def load_path_index(data_path: typing.Union[str, pathlib.Path]) -> typing.Optional[PathIndex]:
+    """Load the index stored next to fork sync data
+
+    Returns:
+        PathIndex: The index, or None if there is none
+    """
+    index_file = index_file_for(data_path)
+    if not index_file.exists():
+        return None
+
+    with open(index_file, 'r', encoding='utf-8') as f:
+        return PathIndex.from_dict(json.load(f))
+
+def _pattern_regex(pattern: str) -> str:
+    """Translate a CODEOWNERS-style pattern to a regular expression"""
+    anchored = pattern.startswith('/') or '/' in pattern.rstrip('/')
+    pattern = pattern.lstrip('/')
+    directory = pattern.endswith('/')
+
+    regex = ''
+    for part in re.split(r'(\*\*/|\*\*|\*|\?)', pattern.rstrip('/')):
+        if part == '**/':
+            regex += '(?:.*/)?'
+        elif part == '**':
+            regex += '.*'
+        elif part == '*':
+            regex += '[^/]*'
+        elif part == '?':
+            regex += '[^/]'
+        else:
+            regex += re.escape(part)
+
+    prefix = '' if anchored else '(?:.*/)?'
+    suffix = '/.*' if directory else '(?:/.*)?'
+    return f'{prefix}{regex}{suffix}'
+
+class SubsystemClassifier:
+    """Finds the subsystems of the commits of a path index"""
+
+    def __init__(self,
+                 index: PathIndex,
+                 subsystem_paths: typing.Dict[str, typing.Tuple[str, ...]] = None):
+        """
+        Args:
+            index (PathIndex): The index
+            subsystem_paths: The path patterns of each subsystem. Defaults
+                to SUBSYSTEM_PATHS.
+        """
+        subsystem_paths = subsystem_paths or SUBSYSTEM_PATHS
+        self._index = index
+        self.subsystems = list(subsystem_paths)
+        self._commit_masks: typing.Dict[str, int] = {}
+
+        regexes = [re.compile('|'.join(_pattern_regex(pattern) for pattern in patterns))
+                   for patterns in subsystem_paths.values()]
+        self._path_masks = [sum(1 << bit for bit, regex in enumerate(regexes)
+                                if regex.fullmatch(path))
+                            for path in index.paths]
+
+    def subsystem_bit(self, subsystem: str) -> int:
+        """The bit of a subsystem in the masks"""
+        return 1 << self.subsystems.index(subsystem)
+
+    def commit_mask(self, sha: str) -> int:
+        """The subsystems touched by a commit, as a bit mask"""
+        mask = self._commit_masks.get(sha)
+        if mask is None:
+            mask = 0
+            path_masks = self._path_masks
+            for path_id in self._index.commits.get(sha, ()):
+                mask |= path_masks[path_id]
+            self._commit_masks[sha] = mask
+        return mask
+
+    def commit_subsystems(self, sha: str) -> typing.List[str]:
+        """The subsystems touched by a commit"""
+        mask = self.commit_mask(sha)
+        return [subsystem for bit, subsystem in enumerate(self.subsystems) if mask & (1 << bit)]
+
+def sync_data_revs(repo: git.Repo, fork_sync_data: dict) -> typing.List[str]:
+    """The revisions to walk to index the commits of fork sync data
+
+    The ranges of several downstream revisions can have different merge
+    bases. A single walk covers all of them by excluding only the commits
+    reachable from every merge base, which may index a few extra commits.
+
+    Args:
+        repo (git.Repo): The git repo
+        fork_sync_data (dict): The fork sync data, of one or several downstream revisions
+
+    Returns:
+        list: The upstream and downstream tips, and the negated common merge base
+    """
+    branches = fork_sync_data.get(sync_data_io.BRANCHES_KEY, {'': fork_sync_data})
+    tips = {}
+    merge_bases = {}
+    for branch_data in branches.values():
+        tips[branch_data['meta']['upstream_head_sha']] = None
+        tips[branch_data['meta']['downstream_head_sha']] = None
+        merge_bases[branch_data['merge_base']['sha']] = None
+
+    if len(merge_bases) > 1:
+        merge_bases = {repo.git.merge_base('--octopus', *merge_bases): None}
+    return [*tips, *(f'^{merge_base}' for merge_base in merge_bases)]
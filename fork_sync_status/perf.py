@@ -0,0 +1,151 @@
+"""Instrumentation of the phases of a run
+
+The wall time, the CPU time and the git processes spawned are recorded
+for each phase. Phases are entered with the phase() context manager,
+which does nothing unless a recorder was started, so that the library
+functions can be instrumented without changing their behavior.
+
+Git processes are counted through the subprocess.Popen audit event, so
+the processes spawned by GitPython are counted as well. Their CPU time
+is taken from the resource usage of terminated child processes. Git
+processes spawned inside worker processes are not counted, but their
+CPU time is included once the workers have terminated.
+"""
+
+import contextlib
+import os
+import sys
+import threading
+import time
+import typing
+
+_recorder = None
+_audit_hook_installed = False
+
+def _children_cpu_seconds() -> float:
+    times = os.times()
+    return times.children_user + times.children_system
+
+def _is_git_command(args) -> bool:
+    if isinstance(args, (str, bytes)):
+        args = args.split()
+    if not args:
+        return False
+    executable = os.path.basename(os.fsdecode(args[0]))
+    return executable in ('git', 'git.exe')
+
+def _audit_hook(event: str, args: tuple):
+    if event == 'subprocess.Popen' and _recorder is not None and _is_git_command(args[1]):
+        _recorder.count_git_process()
+
+class PerfRecorder:
+    """Collects the measurements of the phases of a run"""
+
+    def __init__(self):
+        self.git_processes = 0
+        self.phases = {}
+        self._lock = threading.Lock()
+        # The phases entered by each thread, innermost last
+        self._active = threading.local()
+        self._start = self._snapshot()
+
+    def count_git_process(self):
+        """Count a git process, which may be spawned from any thread"""
+        with self._lock:
+            self.git_processes += 1
+
+    def _snapshot(self) -> typing.Tuple[float, float, int, float]:
+        return (time.perf_counter(), time.process_time(), self.git_processes,
+                _children_cpu_seconds())
+
+    def _measure(self, start: typing.Tuple[float, float, int, float]) -> dict:
+        end = self._snapshot()
+        return {
+            'wall_seconds': round(end[0] - start[0], 4),
+            'cpu_seconds': round(end[1] - start[1], 4),
+            'git_processes': end[2] - start[2],
+            'git_cpu_seconds': round(end[3] - start[3], 4),
+        }
+
+    @contextlib.contextmanager
+    def phase(self, name: str, commits: typing.Optional[int] = None):
+        """Measure a phase
+
+        A phase entered more than once accumulates its measurements.
+        Phases may be nested, in which case the measurements of the
+        inner phase are included in the outer one, and the inner phase
+        records the name of the outer one as 'parent'. Summing the phases
+        without a parent does not count anything twice.
+
+        Args:
+            name (str): The name of the phase
+            commits (int): The number of commits processed in the phase
+
+        Yields:
+            dict: Counters of the phase. The number of commits can be
+            stored as 'commits' if it is only known at the end.
+        """
+        counters = {} if commits is None else {'commits': commits}
+        active = self._active.__dict__.setdefault('phases', [])
+        parent = active[-1] if active else None
+        active.append(name)
+        start = self._snapshot()
+        try:
+            yield counters
+        finally:
+            active.pop()
+            commits = counters.get('commits')
+            result = self._measure(start)
+            previous = self.phases.get(name)
+            if previous:
+                for key, value in result.items():
+                    result[key] = round(previous[key] + value, 4)
+                if 'commits' in previous:
+                    commits = (commits or 0) + previous['commits']
+            if commits is not None:
+                result['commits'] = commits
+                result['commits_per_second'] = \
+                    round(commits / result['wall_seconds'], 1) if result['wall_seconds'] else None
+            if parent is not None and parent != name:
+                result['parent'] = parent
+            self.phases[name] = result
+
+    def to_dict(self) -> dict:
+        """The measurements in the format stored in the output meta data"""
+        return {
+            'total': self._measure(self._start),
+            'phases': dict(self.phases),
+        }
+
+def start() -> PerfRecorder:
+    """Start recording phases
+
+    Returns:
+        PerfRecorder: The recorder used by phase() until stop() is called
+    """
+    global _recorder, _audit_hook_installed
+    if not _audit_hook_installed:
+        # Audit hooks cannot be removed, the hook checks _recorder instead
+        sys.addaudithook(_audit_hook)
+        _audit_hook_installed = True
+    _recorder = PerfRecorder()
+    return _recorder
+
+def stop():
+    """Stop recording phases"""
+    global _recorder
+    _recorder = None
+
+def phase(name: str, commits: typing.Optional[int] = None):
+    """Measure a phase if a recorder was started
+
+    Args:
+        name (str): The name of the phase
+        commits (int): The number of commits processed in the phase
+
+    Returns:
+        A context manager yielding the counters of the phase
+    """
+    if _recorder is None:
+        return contextlib.nullcontext({})
+    return _recorder.phase(name, commits)
@@ -1,106 +1,356 @@
 import datetime
 import argparse
-import logging
+import collections
+import concurrent.futures
 import json
+import logging
+import pathlib
+import typing
+
+import os, time
 
-import influxdb_client, os, time
-from influxdb_client import InfluxDBClient, Point, WritePrecision
-from influxdb_client.client.write_api import SYNCHRONOUS
+import data_history
+import influx_writer
+import path_index
+import sync_data_io
 
 token = os.environ.get("INFLUXDB_TOKEN")
-org = "my-org"
-url = "https://ci-health-influxdb.nordicsemi.no"
-bucket="ruge"
 
-def get_entry(fork_sync_data):
-    time = str(datetime.datetime.fromtimestamp(fork_sync_data['meta']['authored_seconds_since_epoch'],
-                                               tz=datetime.timezone.utc))
+DEFAULT_URL = "https://ci-health-influxdb.nordicsemi.no"
+DEFAULT_ORG = "my-org"
+DEFAULT_BUCKET = "ruge"
+DEFAULT_SPOOL_DIR = pathlib.Path.home() / '.cache' / 'fork_sync_status'
+
+class Metric(typing.NamedTuple):
+    """A field of the entry, counting the commits of a list that match a predicate
 
-    def is_non_reverted_noup_commit(item):
-        if not item['title'].startswith('[nrf noup]'):
-            return False
+    All the commits of the list are counted if the predicate is None.
+    """
 
-        return item.get('reverted_by_sha', None) is None
+    field: str
+    commit_list: str
+    predicate: typing.Optional[typing.Callable[[dict], bool]]
 
-    def is_non_reverted_fromtree_commit(item):
-        if not item['title'].startswith('[nrf fromtree]'):
-            return False
+def non_reverted_with_prefix(prefix):
+    def predicate(item):
+        return item['title'].startswith(prefix) and not sync_data_io.is_reverted(item)
+    return predicate
 
-        return item.get('reverted_by_sha', None) is None
+def is_likely_merged_fromlist_commit(item):
+    if not item['title'].startswith('[nrf fromlist]'):
+        return False
 
-    def is_non_reverted_fromlist_commit(item):
-        if not item['title'].startswith('[nrf fromlist]'):
-            return False
+    if sync_data_io.is_reverted(item):
+        return False
 
-        return item.get('reverted_by_sha', None) is None
+    return bool(item.get('upstream_sha_guess', None))
 
-    def is_likely_merged_fromlist_commit(item):
-        if not item['title'].startswith('[nrf fromlist]'):
-            return False
+def is_upstream_only_commit(item):
+    return not item.get('downstream_sha', None) and not item.get('downstream_sha_guess', None)
 
-        if item.get('reverted_by_sha', None):
-            return False
-        
-        return item.get('upstream_sha_guess', None)
+def upstream_only_with_title_prefixes(prefixes):
+    def predicate(item):
+        return is_upstream_only_commit(item) and item['title'].startswith(prefixes)
+    return predicate
 
-    def upstream_only_commit(item):
-        return not item.get('downstream_sha', None) and not item.get('downstream_sha_guess', None)
+# Upstream-only commits are also counted for the subsystems listed here,
+# matched by the prefixes of the commit titles
+SUBSYSTEM_TITLE_PREFIXES = {
+    'Bluetooth': ('Bluetooth', 'bluetooth'),
+}
 
-    def bluetooth_upstream_only_commit(item):
-        if item.get('downstream_sha', None):
-            return False
-        
-        if item.get('downstream_sha_guess', None):
-            return False
-        
-        if item['title'].startswith('Bluetooth') or item['title'].startswith('bluetooth'):
-            return True
-    
-        return False
+# The 'Downstream fromtree commits' series holds the fromlist counts, which
+# used to be stored under that name by mistake. The fromtree counts are
+# stored in a new series, so that the change of meaning is not hidden in
+# the history of the old one.
+FROMTREE_FIELD = 'Downstream fromtree commits v2'
+
+METRICS = [
+    Metric('Commits upstream after upmerge', 'upstream_commits', None),
+    Metric('Commits downstream after upmerge', 'downstream_commits', None),
+    Metric('Downstream noup commits', 'downstream_commits', non_reverted_with_prefix('[nrf noup]')),
+    Metric(FROMTREE_FIELD, 'downstream_commits', non_reverted_with_prefix('[nrf fromtree]')),
+    Metric('Downstream fromlist commits', 'downstream_commits', non_reverted_with_prefix('[nrf fromlist]')),
+    Metric('Downstream fromlist commits likely merged', 'downstream_commits', is_likely_merged_fromlist_commit),
+    Metric('Downstream reverted commits', 'downstream_commits', sync_data_io.is_reverted),
+    Metric('Commits upstream only', 'upstream_commits', is_upstream_only_commit),
+] + [
+    Metric(f'{subsystem} commits upstream only', 'upstream_commits',
+           upstream_only_with_title_prefixes(prefixes))
+    for subsystem, prefixes in SUBSYSTEM_TITLE_PREFIXES.items()
+]
+
+def path_metrics(classifier):
+    """Metrics counting the commits by the subsystems of the paths they change
+
+    Args:
+        classifier (path_index.SubsystemClassifier): The subsystems of the commits
 
-    def get_len_from_list(filter_func, the_list):
-        return len(list(filter(filter_func, the_list)))
+    Returns:
+        list: The metrics
+    """
+    def touches(bit):
+        def predicate(item):
+            return bool(classifier.commit_mask(item['sha']) & bit)
+        return predicate
 
-    return {
+    def upstream_only_touching(bit):
+        def predicate(item):
+            return is_upstream_only_commit(item) and \
+                bool(classifier.commit_mask(item['sha']) & bit)
+        return predicate
+
+    metrics = []
+    for subsystem in classifier.subsystems:
+        bit = classifier.subsystem_bit(subsystem)
+        metrics.append(Metric(f'{subsystem} paths commits upstream only', 'upstream_commits',
+                              upstream_only_touching(bit)))
+        metrics.append(Metric(f'{subsystem} paths commits downstream', 'downstream_commits',
+                              touches(bit)))
+    return metrics
+
+def count_metrics(fork_sync_data, metrics=METRICS):
+    """Count the commits matching each metric
+
+    Every commit list is iterated once, no matter how many metrics there
+    are, so the lists can be generators as well.
+
+    Args:
+        fork_sync_data: The fork sync data. The commit lists can be any iterables.
+        metrics: The metrics to count
+
+    Returns:
+        dict: The count of each metric, in the order of the metrics
+    """
+    counts = {metric.field: 0 for metric in metrics}
+    for list_name in sync_data_io.COMMIT_LISTS:
+        list_metrics = [metric for metric in metrics if metric.commit_list == list_name]
+        if not list_metrics:
+            continue
+
+        predicates = [(metric.field, metric.predicate)
+                      for metric in list_metrics if metric.predicate]
+        total = 0
+        for item in fork_sync_data.get(list_name, ()):
+            total += 1
+            for field, predicate in predicates:
+                if predicate(item):
+                    counts[field] += 1
+
+        for metric in list_metrics:
+            if not metric.predicate:
+                counts[metric.field] = total
+
+    return counts
+
+def get_entry(fork_sync_data, classifier=None):
+    """Compute the entry of the data of one downstream revision
+
+    Args:
+        fork_sync_data: The fork sync data
+        classifier (path_index.SubsystemClassifier): If set, the commits
+            are also counted by the subsystems of the paths they change
+    """
+    time = str(datetime.datetime.fromtimestamp(fork_sync_data['meta']['authored_seconds_since_epoch'],
+                                               tz=datetime.timezone.utc))
+
+    entry = {
         'measurement': 'zephyr',
         'tags': {
             "mode": "measurement",
         },
         'time': time,
-        'fields': {
-            'Commits upstream after upmerge': len(fork_sync_data['upstream_commits']),
-            'Commits downstream after upmerge': len(fork_sync_data['downstream_commits']),
-            'Downstream noup commits': get_len_from_list(is_non_reverted_noup_commit, fork_sync_data['downstream_commits']),
-            'Downstream fromtree commits': get_len_from_list(is_non_reverted_fromtree_commit, fork_sync_data['downstream_commits']),
-            'Downstream fromtree commits': get_len_from_list(is_non_reverted_fromlist_commit, fork_sync_data['downstream_commits']),
-            'Downstream fromlist commits likely merged': get_len_from_list(is_likely_merged_fromlist_commit, fork_sync_data['downstream_commits']),
-            'Commits upstream only': get_len_from_list(upstream_only_commit, fork_sync_data['upstream_commits']),
-            'Bluetooth commits upstream only': get_len_from_list(bluetooth_upstream_only_commit, fork_sync_data['upstream_commits']),
-        }
+        'fields': count_metrics(fork_sync_data,
+                                METRICS + path_metrics(classifier) if classifier else METRICS),
     }
 
-def push_entry_to_influx(entry):
-    with influxdb_client.InfluxDBClient(url=url, token=token, org=org) as client:
-        with client.write_api(write_options=SYNCHRONOUS) as api:
-            api.write(bucket=bucket, org="my-org", record=entry)
+    # Run time of fork_sync_data.py, so that slowdowns can be charted as well
+    perf = fork_sync_data['meta'].get('perf')
+    if perf:
+        entry['fields']['Fork sync run seconds'] = perf['total']['wall_seconds']
+        entry['fields']['Fork sync git processes'] = perf['total']['git_processes']
+        for name, phase in perf['phases'].items():
+            # Nested phases are included in their parent
+            if 'parent' not in phase:
+                entry['fields'][f'Fork sync {name} seconds'] = phase['wall_seconds']
+
+    return entry
+
+def get_entries(fork_sync_data, changed_paths=None):
+    """Compute the entries of data covering one or several downstream revisions
+
+    With several revisions, there is one entry per revision, tagged with it.
+
+    Args:
+        fork_sync_data: The fork sync data
+        changed_paths (path_index.PathIndex): The paths changed by the
+            commits, used to count them by subsystem
+    """
+    classifier = path_index.SubsystemClassifier(changed_paths) if changed_paths else None
+    if sync_data_io.BRANCHES_KEY not in fork_sync_data:
+        return [get_entry(fork_sync_data, classifier)]
+
+    entries = []
+    for rev, branch_data in fork_sync_data[sync_data_io.BRANCHES_KEY].items():
+        entry = get_entry(branch_data, classifier)
+        entry['tags']['downstream_rev'] = rev
+        entries.append(entry)
+    return entries
+
+def push_entries_to_influx(entries, settings):
+    """Push entries through a single writer, resending spooled points first
+
+    Args:
+        entries: The entries to push
+        settings (influx_writer.WriterSettings): The server and the write options
+
+    Returns:
+        int: The number of points that had to be spooled
+    """
+    with influx_writer.InfluxWriter(settings) as writer:
+        writer.resend_spool()
+        writer.write(entries)
+
+    logging.info("Wrote %d points, spooled %d", writer.written, writer.spooled)
+    return writer.spooled
+
+def get_entries_from_json(content):
+    """Compute the entries of a serialized data.json, none for other content"""
+    fork_sync_data = json.loads(content)
+    if sync_data_io.is_manifest(fork_sync_data):
+        return []
+    return get_entries(fork_sync_data)
+
+def get_backfill_entries(repo_dir, rev_range, data_path, jobs):
+    """Compute the entries of every automatic commit of data.json
+
+    The historical versions of data.json are read from the object
+    database, so nothing is checked out. The JSON documents are parsed in
+    a worker pool. Only a bounded number of them are held in memory at
+    once, as every version can be several megabytes large.
+
+    Args:
+        repo_dir: The directory of the git repo
+        rev_range: The revision range to backfill, e.g. 'abc123..HEAD'
+        data_path: The path of data.json, relative to the root of the repo
+        jobs: The number of worker processes
+
+    Returns:
+        list: The entries, oldest first
+    """
+    versions = data_history.iter_data_versions(repo_dir, rev_range, data_path)
+    entries = []
+    if jobs <= 1:
+        for version in versions:
+            entries.extend(get_entries_from_json(version.content))
+        return entries
+
+    pending = collections.deque()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        for version in versions:
+            pending.append(executor.submit(get_entries_from_json, version.content))
+            if len(pending) >= jobs * 2:
+                entries.extend(pending.popleft().result())
+        for future in pending:
+            entries.extend(future.result())
+
+    return entries
+
+def add_writer_arguments(parser):
+    """Add the options of the InfluxDB writer to an argument parser"""
+    parser.add_argument('--url',
+                        default=DEFAULT_URL,
+                        help='URL of the InfluxDB server')
+    parser.add_argument('--org',
+                        default=DEFAULT_ORG)
+    parser.add_argument('--bucket',
+                        default=DEFAULT_BUCKET)
+    parser.add_argument('--batch-size',
+                        type=int,
+                        default=1000,
+                        help='Number of points written per request')
+    parser.add_argument('--flush-interval',
+                        type=int,
+                        default=1000,
+                        help='Milliseconds after which a partial batch is written')
+    parser.add_argument('--max-retries',
+                        type=int,
+                        default=5,
+                        help='Retries of a failed batch, with an exponential backoff')
+    parser.add_argument('--max-retry-time',
+                        type=int,
+                        default=60000,
+                        help='Milliseconds after which a failed batch is spooled')
+    parser.add_argument('--spool-dir',
+                        type=pathlib.Path,
+                        default=DEFAULT_SPOOL_DIR,
+                        help='Where points that could not be written are kept until '
+                             'the next run')
+
+def writer_settings(args):
+    """The InfluxDB writer settings of the parsed options of add_writer_arguments()"""
+    return influx_writer.WriterSettings(
+        url=args.url,
+        org=args.org,
+        bucket=args.bucket,
+        token=token,
+        batch_size=args.batch_size,
+        flush_interval_ms=args.flush_interval,
+        max_retries=args.max_retries,
+        max_retry_time_ms=args.max_retry_time,
+        spool_dir=args.spool_dir)
 
 def main():
+    logging.getLogger().setLevel('INFO')
+
     parser = argparse.ArgumentParser(
         prog="Push fork sync data to influxDb"
     )
     parser.add_argument('--input-file',
-                        type=argparse.FileType('r'))
+                        type=pathlib.Path,
+                        help='A data.json file, or the manifest or directory of sharded data')
     parser.add_argument('--dry-run', default=False, action='store_true')
+    add_writer_arguments(parser)
+    parser.add_argument('--backfill',
+                        default=False,
+                        action='store_true',
+                        help='Push an entry for every automatic commit of data.json '
+                             'in --backfill-range instead of --input-file')
+    parser.add_argument('--backfill-range',
+                        default='HEAD',
+                        help='The revision range to backfill, e.g. 472478d..HEAD')
+    parser.add_argument('--repo-dir',
+                        default='.',
+                        help='The git repo storing data.json')
+    parser.add_argument('--data-path',
+                        default=data_history.DEFAULT_DATA_PATH,
+                        help='The path of data.json relative to the root of the repo')
+    parser.add_argument('-j',
+                        '--jobs',
+                        type=int,
+                        default=os.cpu_count(),
+                        help='Number of worker processes used when backfilling')
 
     args = parser.parse_args()
 
-    fork_sync_data = json.load(args.input_file)
-    entry = get_entry(fork_sync_data)
+    if args.backfill:
+        start = time.perf_counter()
+        entries = get_backfill_entries(args.repo_dir, args.backfill_range,
+                                       args.data_path, args.jobs)
+        logging.info("Computed %d entries in %.2fs",
+                     len(entries), time.perf_counter() - start)
+    elif args.input_file:
+        entries = get_entries(sync_data_io.load_sync_data(args.input_file, ordered=False),
+                              path_index.load_path_index(args.input_file))
+    else:
+        parser.error('--input-file or --backfill is required')
 
     if args.dry_run:
-        print(entry)
-    else:
-        push_entry_to_influx(entry)
+        for entry in entries:
+            print(entry)
+        return
+
+    push_entries_to_influx(entries, writer_settings(args))
 
 if __name__ == '__main__':
     main()
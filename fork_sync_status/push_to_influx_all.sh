@@ -1,10 +1,7 @@
 #!/usr/bin/env bash
 set -e
 
-mkdir -p fork_sync_status/temp_dir_not_in_git
-
-cp fork_sync_status/push_to_influx_all.sh fork_sync_status/temp_dir_not_in_git/
-cp fork_sync_status/push_to_influx_if_autocommitted.sh fork_sync_status/temp_dir_not_in_git/
-cp fork_sync_status/push_to_influx.py fork_sync_status/temp_dir_not_in_git/
-
-git rebase -i 472478d --exec "cd fork_sync_status/temp_dir_not_in_git && ./push_to_influx_if_autocommitted.sh"
+# Push an entry for every automatic commit of data.json since 472478d.
+# The versions of data.json are read from the object database, nothing
+# is checked out.
+python3 fork_sync_status/push_to_influx.py --backfill --backfill-range 472478d..HEAD "$@"
@@ -0,0 +1,400 @@
+"""Indexed queries over fork sync data
+
+The data is loaded once, and indexes are built on the SHA, the category,
+the title prefix, the author, the authored date and the upstream PR of
+the commits. A query intersects the matching entries of the indexes
+instead of scanning all commits, and returns one page of the result.
+
+The queries can be run from the command line, or served as JSON by a
+small local HTTP service, which reloads the data when the file changes.
+
+Example:
+    python query.py --input-file data/data.json --category upstream_only \\
+        --area bluetooth --author "Jane Doe" --since 2024-01-01
+
+    python query.py --input-file data/data.json --serve --port 8000
+    curl 'http://localhost:8000/commits?category=upstream_only&area=bluetooth'
+"""
+
+import argparse
+import bisect
+import datetime
+import http.server
+import json
+import logging
+import pathlib
+import re
+import threading
+import typing
+import urllib.parse
+
+import sync_data_io
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# The filters of a query, and the index each of them is looked up in
+FILTERS = ('list', 'category', 'area', 'author', 'upstream_pr')
+
+# Prefixes of downstream commit titles, which are not part of the area
+RE_TITLE_TAG = re.compile(r'^(\[[^\]]*\]\s*)+')
+
+def title_area(title: str) -> typing.Optional[str]:
+    """The area of a commit, from the prefix of its title
+
+    For example 'bluetooth' for '[nrf fromtree] Bluetooth: Host: Fix'.
+
+    Returns:
+        str: The lower case area, or None if the title has no prefix
+    """
+    title = RE_TITLE_TAG.sub('', title)
+    if title.startswith('Revert "'):
+        title = title[len('Revert "'):]
+    area, separator, _ = title.partition(':')
+    if not separator or not area or len(area) > 40:
+        return None
+    return area.strip().lower()
+
+def parse_date(value: typing.Union[str, int, float, None]) -> typing.Optional[float]:
+    """Parse a date given as seconds since the epoch or in ISO 8601 format
+
+    Dates without a time zone are in UTC.
+
+    Returns:
+        float: The seconds since the epoch, or None if no date is given
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+
+    date = datetime.datetime.fromisoformat(value)
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=datetime.timezone.utc)
+    return date.timestamp()
+
+class QueryResult(typing.NamedTuple):
+    """One page of the commits matching a query"""
+
+    total: int
+    offset: int
+    limit: int
+    commits: typing.List[dict]
+
+    def to_dict(self) -> dict:
+        """Returns a dictionary representation"""
+        return self._asdict()
+
+class CommitIndex:
+    """Indexes over the commits of one downstream revision"""
+
+    def __init__(self, fork_sync_data: dict):
+        """
+        Args:
+            fork_sync_data (dict): The fork sync data of one downstream revision
+        """
+        self.meta = fork_sync_data.get('meta', {})
+        self.merge_base = fork_sync_data.get('merge_base', {})
+
+        # Every commit is referred to by its position in this list, so
+        # the index entries are ascending lists of positions
+        self.commits: typing.List[dict] = []
+        self._by_sha: typing.Dict[str, int] = {}
+        self._indexes: typing.Dict[str, typing.Dict[str, typing.List[int]]] = \
+            {name: {} for name in FILTERS}
+
+        dated = []
+        for list_name in sync_data_io.COMMIT_LISTS:
+            for item in fork_sync_data.get(list_name, []):
+                position = len(self.commits)
+                self.commits.append(item)
+                self._by_sha[item['sha']] = position
+
+                keys = {
+                    'list': list_name.split('_')[0],
+                    'category': sync_data_io.commit_category(list_name, item),
+                    'area': title_area(item['title']),
+                    'upstream_pr': item.get('upstream_pr'),
+                }
+                for name, key in keys.items():
+                    if key is not None:
+                        self._indexes[name].setdefault(str(key), []).append(position)
+                for key in {item.get('author'), item.get('author_email')}:
+                    if key:
+                        self._indexes['author'].setdefault(key.lower(), []).append(position)
+
+                dated.append((item.get('authored_seconds_since_epoch', 0), position))
+
+        dated.sort()
+        self._dates = [date for date, _ in dated]
+        self._positions_by_date = [position for _, position in dated]
+        self._sorted_shas = sorted(self._by_sha)
+
+    def keys(self, name: str) -> typing.Dict[str, int]:
+        """The keys of an index, with their number of commits"""
+        return {key: len(positions) for key, positions in sorted(self._indexes[name].items())}
+
+    def get(self, sha: str) -> typing.Optional[dict]:
+        """Look up a commit by its full or abbreviated SHA
+
+        Returns:
+            dict: The commit, or None if there is none or the SHA is ambiguous
+        """
+        position = self._by_sha.get(sha)
+        if position is not None:
+            return self.commits[position]
+
+        index = bisect.bisect_left(self._sorted_shas, sha)
+        matches = self._sorted_shas[index:index + 2]
+        if len(sha) < 4 or not matches or not matches[0].startswith(sha) or \
+                (len(matches) > 1 and matches[1].startswith(sha)):
+            return None
+        return self.commits[self._by_sha[matches[0]]]
+
+    def _date_range(self, since: typing.Optional[float],
+                    until: typing.Optional[float]) -> typing.List[int]:
+        start = 0 if since is None else bisect.bisect_left(self._dates, since)
+        end = len(self._dates) if until is None else bisect.bisect_right(self._dates, until)
+        return self._positions_by_date[start:end]
+
+    def query(self,
+              filters: typing.Optional[typing.Dict[str, str]] = None,
+              since: typing.Optional[float] = None,
+              until: typing.Optional[float] = None,
+              offset: int = 0,
+              limit: int = DEFAULT_PAGE_SIZE) -> QueryResult:
+        """Find the commits matching all of the given filters
+
+        Args:
+            filters (dict): The key to look up in each of the FILTERS indexes.
+                Authors are matched by name or email, case insensitively.
+            since (float): Only commits authored at or after this time
+            until (float): Only commits authored at or before this time
+            offset (int): The number of matching commits to skip
+            limit (int): The maximum number of commits to return
+
+        Returns:
+            QueryResult: The matching commits, in the order of the data
+        """
+        candidates = []
+        for name, key in (filters or {}).items():
+            if key is None or key == '':
+                continue
+            if name not in self._indexes:
+                raise ValueError(f'Unknown filter: {name}')
+            if name in ('author', 'area'):
+                key = key.lower()
+            candidates.append(self._indexes[name].get(str(key), []))
+
+        if since is not None or until is not None:
+            candidates.append(self._date_range(since, until))
+
+        if not candidates:
+            positions = range(len(self.commits))
+        else:
+            # Start from the most selective index
+            candidates.sort(key=len)
+            matches = set(candidates[0])
+            for positions in candidates[1:]:
+                matches.intersection_update(positions)
+            positions = sorted(matches)
+
+        limit = max(0, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+        return QueryResult(len(positions), offset, limit,
+                           [self.commits[position] for position in positions[offset:offset + limit]])
+
+class SyncDataIndex:
+    """The indexes of all downstream revisions of fork sync data"""
+
+    def __init__(self, fork_sync_data: dict):
+        branches = fork_sync_data.get(sync_data_io.BRANCHES_KEY, {'': fork_sync_data})
+        self.revisions = {rev: CommitIndex(branch_data) for rev, branch_data in branches.items()}
+
+    def revision(self, rev: typing.Optional[str] = None) -> CommitIndex:
+        """The index of a downstream revision, by default the first one
+
+        Raises:
+            KeyError: If the data has no such revision
+        """
+        if not rev:
+            return next(iter(self.revisions.values()))
+        return self.revisions[rev]
+
+    @classmethod
+    def load(cls, path: typing.Union[str, pathlib.Path]) -> 'SyncDataIndex':
+        """Load and index fork sync data written in any of the supported formats"""
+        return cls(sync_data_io.load_sync_data(path))
+
+class _ReloadingIndex:
+    """Holds the index of a data file, rebuilt when the file changes
+
+    The data is written by replacing the file, so the index is swapped
+    as a whole and requests in progress keep using the previous one.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self._path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._index = None
+        self.get()
+
+    def _file_stamp(self):
+        path = self._path
+        if path.is_dir():
+            path = path / sync_data_io.MANIFEST_FILE_NAME
+        stat = path.stat()
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def get(self) -> SyncDataIndex:
+        """The index of the current version of the file"""
+        stamp = self._file_stamp()
+        if stamp != self._stamp:
+            with self._lock:
+                if stamp != self._stamp:
+                    logging.info("Indexing %s", self._path)
+                    self._index = SyncDataIndex.load(self._path)
+                    self._stamp = stamp
+        return self._index
+
+def _query_parameters(parameters: typing.Dict[str, typing.List[str]]) -> dict:
+    """The keyword arguments of CommitIndex.query() from URL parameters"""
+    def single(name, default=None):
+        return parameters.get(name, [default])[-1]
+
+    return {
+        'filters': {name: single(name) for name in FILTERS if name in parameters},
+        'since': parse_date(single('since')),
+        'until': parse_date(single('until')),
+        'offset': int(single('offset', 0)),
+        'limit': int(single('limit', DEFAULT_PAGE_SIZE)),
+    }
+
+class QueryRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves queries as JSON
+
+    GET /commits?category=...&area=...&author=...&upstream_pr=...&list=...
+                &since=...&until=...&offset=...&limit=...&rev=...
+    GET /commits/<sha>?rev=...
+    GET /keys/<filter>?rev=...
+    GET /meta?rev=...
+    """
+
+    # Set by serve()
+    index: _ReloadingIndex = None
+
+    def do_GET(self):
+        """Handle a GET request"""
+        url = urllib.parse.urlsplit(self.path)
+        parameters = urllib.parse.parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+
+        try:
+            commit_index = self.index.get().revision(parameters.get('rev', [None])[-1])
+            if parts == ['commits']:
+                body = commit_index.query(**_query_parameters(parameters)).to_dict()
+            elif len(parts) == 2 and parts[0] == 'commits':
+                body = commit_index.get(parts[1])
+                if body is None:
+                    self._send(404, {'error': f'Unknown commit: {parts[1]}'})
+                    return
+            elif len(parts) == 2 and parts[0] == 'keys' and parts[1] in FILTERS:
+                body = commit_index.keys(parts[1])
+            elif parts == ['meta']:
+                body = {'meta': commit_index.meta, 'merge_base': commit_index.merge_base}
+            else:
+                self._send(404, {'error': f'Unknown path: {url.path}'})
+                return
+        except KeyError as e:
+            self._send(404, {'error': f'Unknown revision: {e}'})
+            return
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+            return
+
+        self._send(200, body)
+
+    def _send(self, status: int, body):
+        content = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format_string, *args):
+        logging.debug("%s - %s", self.address_string(), format_string % args)
+
+def serve(path: typing.Union[str, pathlib.Path], host: str, port: int):
+    """Serve queries over fork sync data until interrupted
+
+    Args:
+        path: A JSON document, a manifest or a directory with a manifest
+        host (str): The address to listen on
+        port (int): The port to listen on
+    """
+    handler = type('Handler', (QueryRequestHandler,), {'index': _ReloadingIndex(path)})
+    with http.server.ThreadingHTTPServer((host, port), handler) as server:
+        logging.info("Serving queries over %s on http://%s:%d", path, host, port)
+        server.serve_forever()
+
+def main():
+    """Main function of this script"""
+    logging.getLogger().setLevel('INFO')
+
+    parser = argparse.ArgumentParser(
+        prog="Query fork sync data",
+    )
+    parser.add_argument('--input-file',
+                        type=pathlib.Path,
+                        default='data/data.json',
+                        help='Fork sync data, as a JSON document, a manifest or a directory')
+    parser.add_argument('--serve',
+                        default=False,
+                        action='store_true',
+                        help='Serve the queries over HTTP instead of running one')
+    parser.add_argument('--host',
+                        default='localhost')
+    parser.add_argument('--port',
+                        type=int,
+                        default=8000)
+    parser.add_argument('--rev',
+                        help='The downstream revision to query when the data has several')
+    parser.add_argument('--sha',
+                        help='Look up a single commit by its full or abbreviated SHA')
+    for name in FILTERS:
+        parser.add_argument(f"--{name.replace('_', '-')}")
+    parser.add_argument('--since',
+                        help='Only commits authored since this date, e.g. 2024-01-01')
+    parser.add_argument('--until',
+                        help='Only commits authored until this date')
+    parser.add_argument('--offset',
+                        type=int,
+                        default=0)
+    parser.add_argument('--limit',
+                        type=int,
+                        default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.input_file, args.host, args.port)
+        return
+
+    commit_index = SyncDataIndex.load(args.input_file).revision(args.rev)
+    if args.sha:
+        print(json.dumps(commit_index.get(args.sha), indent=2))
+        return
+
+    result = commit_index.query({name: getattr(args, name) for name in FILTERS},
+                                parse_date(args.since), parse_date(args.until),
+                                args.offset, args.limit)
+    print(json.dumps(result.to_dict(), indent=2))
+
+if __name__ == '__main__':
+    main()
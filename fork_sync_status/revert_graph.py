@@ -0,0 +1,103 @@
+"""Resolution of reverts across the upstream and downstream commits
+
+Every "This reverts commit ..." reference of both ranges is indexed, in
+any order, so reverts are found no matter which side they are on or in
+which order the commits were listed. Chains of reverts are resolved to
+the effective state of each commit: a commit whose revert was reverted
+itself is in effect again.
+
+Each commit is visited a constant number of times, so the whole
+resolution is linear in the number of commits. Abbreviated references
+are looked up with a binary search in the sorted SHAs.
+"""
+
+import bisect
+import typing
+
+class RevertStats(typing.NamedTuple):
+    """Counts of the resolved reverts"""
+
+    # Commits referred to by at least one revert
+    reverted: int
+    # Commits which are reverted after resolving the chains
+    effectively_reverted: int
+
+def _abbreviated_lookup(shas: typing.List[str]) -> typing.Callable[[str], typing.Optional[str]]:
+    """Find the unique SHA starting with a prefix"""
+    sorted_shas = sorted(shas)
+
+    def lookup(prefix):
+        index = bisect.bisect_left(sorted_shas, prefix)
+        if index == len(sorted_shas) or not sorted_shas[index].startswith(prefix):
+            return None
+        if index + 1 < len(sorted_shas) and sorted_shas[index + 1].startswith(prefix):
+            # Ambiguous
+            return None
+        return sorted_shas[index]
+
+    return lookup
+
+def resolve_reverts(items: typing.Iterable) -> RevertStats:
+    """Link the reverted commits to their reverts and resolve the chains
+
+    Sets reverted_by_sha and effectively_reverted on every commit that
+    is reverted. If a commit was reverted several times, reverted_by_sha
+    refers to a revert that is in effect, if any.
+
+    Args:
+        items: The CommitRepr objects of both ranges, in any order
+
+    Returns:
+        RevertStats: The counts of reverted commits
+    """
+    items = list(items)
+    by_sha = {item.sha: item for item in items}
+    lookup = None
+
+    reverters = {}
+    for item in items:
+        reverts_sha = item.reverts_sha
+        if not reverts_sha:
+            continue
+
+        if reverts_sha not in by_sha:
+            if lookup is None:
+                lookup = _abbreviated_lookup(list(by_sha))
+            reverts_sha = lookup(reverts_sha)
+            if reverts_sha is None:
+                # Reverts a commit outside of the ranges
+                continue
+
+        reverters.setdefault(reverts_sha, []).append(item.sha)
+
+    # A commit is effectively reverted if one of its reverts is not
+    # effectively reverted itself. The chains are evaluated depth first
+    # without recursion, and every result is kept.
+    reverted = {}
+    for sha in reverters:
+        stack = [sha]
+        on_stack = {sha}
+        while stack:
+            current = stack[-1]
+            if current in reverted:
+                on_stack.discard(stack.pop())
+                continue
+
+            pending = [revert for revert in reverters.get(current, ())
+                       if revert not in reverted and revert not in on_stack]
+            if pending:
+                stack.extend(pending)
+                on_stack.update(pending)
+                continue
+
+            reverted[current] = any(not reverted.get(revert, False)
+                                    for revert in reverters.get(current, ()))
+            on_stack.discard(stack.pop())
+
+    for sha, reverts in reverters.items():
+        item = by_sha[sha]
+        effective = [revert for revert in reverts if not reverted.get(revert, False)]
+        item.reverted_by_sha = (effective or reverts)[0]
+        item.effectively_reverted = reverted[sha]
+
+    return RevertStats(len(reverters), sum(reverted[sha] for sha in reverters))
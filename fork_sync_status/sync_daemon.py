@@ -0,0 +1,179 @@
+"""Continuous updates of the fork sync data
+
+In watch mode, fork_sync_data.py keeps running. The repo, the executor,
+the cache of cherry-pick verdicts and the commit records of the last
+update stay in memory. The remotes are polled with git ls-remote, which
+transfers no objects, and the data is only updated when a tip moved.
+The update then fetches the new commits and reuses the earlier results,
+like an incremental run.
+
+The state of the loop is exposed as JSON by a small HTTP endpoint, so
+that a supervisor can check that the data is being kept up to date.
+"""
+
+import http.server
+import json
+import logging
+import threading
+import time
+import typing
+
+import git
+
+class DaemonStatus:
+    """The health of the update loop, shared with the health endpoint"""
+
+    def __init__(self, interval: float):
+        """
+        Args:
+            interval (float): The number of seconds between two polls
+        """
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self._last_poll = None
+        self._last_update = None
+        self._last_update_latency = None
+        self._last_error = None
+        self._updates = 0
+        self._failures = 0
+        self._tips = {}
+
+    def polled(self, when: float):
+        """Record a successful poll of the remotes"""
+        with self._lock:
+            self._last_poll = when
+            self._last_error = None
+
+    def updated(self, polled: float, tips: typing.Dict[str, str]):
+        """Record a successful update
+
+        Args:
+            polled (float): When the poll that triggered the update started
+            tips (dict): The tips the data was computed for
+        """
+        now = time.time()
+        with self._lock:
+            self._last_update = now
+            self._last_update_latency = round(now - polled, 3)
+            self._updates += 1
+            self._tips = dict(tips)
+
+    def failed(self, error: str):
+        """Record a failed poll or update"""
+        with self._lock:
+            self._last_error = error
+            self._failures += 1
+
+    def healthy(self) -> bool:
+        """Checks if the last update succeeded and the remotes are being polled"""
+        with self._lock:
+            return self._last_update is not None and self._last_error is None and \
+                time.time() - self._last_poll <= 3 * self.interval
+
+    def to_dict(self) -> dict:
+        """Returns a dictionary representation"""
+        healthy = self.healthy()
+        now = time.time()
+        with self._lock:
+            return {
+                'status': 'ok' if healthy else 'unhealthy',
+                'uptime_seconds': round(now - self._started, 3),
+                'interval_seconds': self.interval,
+                'last_poll': self._last_poll,
+                'last_update': self._last_update,
+                'last_update_age_seconds':
+                    round(now - self._last_update, 3) if self._last_update else None,
+                'last_update_latency_seconds': self._last_update_latency,
+                'last_error': self._last_error,
+                'updates': self._updates,
+                'failures': self._failures,
+                'tips': self._tips,
+            }
+
+def remote_tips(repo: git.Repo,
+                remote_name: str,
+                branches: typing.List[str]) -> typing.Dict[str, str]:
+    """The current tips of branches of a remote, without fetching
+
+    Args:
+        repo (git.Repo): The git repo
+        remote_name (str): The remote
+        branches: The branches
+
+    Returns:
+        dict: The SHA of each branch, by '<remote>/<branch>'
+    """
+    output = repo.git.ls_remote(remote_name, *(f'refs/heads/{branch}' for branch in branches))
+    tips = {}
+    for line in output.splitlines():
+        sha, _, ref = line.partition('\t')
+        tips[f"{remote_name}/{ref[len('refs/heads/'):]}"] = sha
+    return tips
+
+class _HealthRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Serves the DaemonStatus as JSON on /health"""
+
+    # Set by serve_health()
+    status: DaemonStatus = None
+
+    def do_GET(self):
+        """Handle a GET request"""
+        if self.path.split('?')[0].rstrip('/') != '/health':
+            self.send_error(404)
+            return
+
+        content = json.dumps(self.status.to_dict()).encode('utf-8')
+        self.send_response(200 if self.status.healthy() else 503)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format_string, *args):
+        logging.debug("%s - %s", self.address_string(), format_string % args)
+
+def serve_health(status: DaemonStatus, host: str, port: int) -> http.server.HTTPServer:
+    """Serve the health of the update loop in a background thread
+
+    Returns:
+        The server. Call shutdown() to stop it.
+    """
+    handler = type('Handler', (_HealthRequestHandler,), {'status': status})
+    server = http.server.ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info("Serving the health on http://%s:%d/health", host, port)
+    return server
+
+def watch(status: DaemonStatus,
+          poll: typing.Callable[[], typing.Dict[str, str]],
+          update: typing.Callable[[], None],
+          stop: threading.Event):
+    """Poll the remotes and update the data whenever a tip moved
+
+    The first poll always triggers an update. A failing poll or update
+    is logged and retried at the next poll.
+
+    Args:
+        status (DaemonStatus): The status to record the outcomes in
+        poll: Returns the current tips of the remotes
+        update: Fetches the remotes, then computes and writes the data
+        stop (threading.Event): Ends the loop once set
+    """
+    last_tips = None
+    while not stop.is_set():
+        started = time.time()
+        try:
+            tips = poll()
+            status.polled(started)
+            if tips != last_tips:
+                logging.info("Tips moved, updating: %s", tips)
+                update()
+                last_tips = tips
+                status.updated(started, tips)
+        except Exception as e:
+            # The loop has to survive network and repo failures
+            logging.exception("Update failed")
+            status.failed(f'{type(e).__name__}: {e}')
+
+        stop.wait(max(0.0, status.interval - (time.time() - started)))
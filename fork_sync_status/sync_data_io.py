@@ -0,0 +1,333 @@
+"""Reading and writing fork sync data
+
+The data is either written as a single JSON document, or as a sharded
+layout: a small manifest holding the meta data and the merge base, and
+one JSON file per category of commits. The shards can be fetched on
+demand, and the manifest records the order of the commits so that the
+original lists can be restored.
+
+In both cases the commits are serialized one at a time while they are
+written, so the whole document never exists in memory as a string. The
+commit records themselves are all held before the first byte is
+written, as the analysis needs every commit, so this does not bound
+the memory of a run. It only avoids the copy of the data as text.
+"""
+
+import json
+import os
+import pathlib
+import typing
+
+OUTPUT_FORMATS = ('json', 'sharded')
+
+MANIFEST_FILE_NAME = 'manifest.json'
+
+COMMIT_LISTS = ('downstream_commits', 'upstream_commits')
+
+# Holds the data of each downstream revision when several were analyzed
+BRANCHES_KEY = 'branches'
+
+def _as_dict(item) -> dict:
+    return item if isinstance(item, dict) else item.to_dict()
+
+def is_reverted(item: dict) -> bool:
+    """Whether a commit is reverted, once reverts of reverts are resolved
+
+    Older data only has the SHA of the revert.
+
+    Args:
+        item (dict): The dictionary representation of the commit
+    """
+    if 'effectively_reverted' in item:
+        return item['effectively_reverted']
+    return bool(item.get('reverted_by_sha', None))
+
+def commit_category(list_name: str, item: dict) -> str:
+    """The shard a commit is stored in
+
+    Every commit belongs to exactly one category.
+
+    Args:
+        list_name (str): 'upstream_commits' or 'downstream_commits'
+        item (dict): The dictionary representation of the commit
+
+    Returns:
+        str: The category
+    """
+    if list_name == 'upstream_commits':
+        if item.get('downstream_sha', None) or item.get('downstream_sha_guess', None):
+            return 'upstream_in_downstream'
+        return 'upstream_only'
+
+    # A commit whose revert was reverted stays in its category
+    if is_reverted(item) or item.get('reverts_sha', None):
+        return 'reverted'
+    if item.get('upstream_sha', None):
+        return 'fromtree'
+    if item.get('upstream_pr', None):
+        return 'fromlist'
+    if item['title'].startswith('[nrf noup]'):
+        return 'noup'
+    return 'downstream_other'
+
+def _write_json_array(stream: typing.TextIO, items: typing.Iterable):
+    """Write items as a JSON array, formatted like json.dumps() does"""
+    stream.write('[')
+    separator = ''
+    for item in items:
+        stream.write(separator)
+        stream.write(json.dumps(_as_dict(item)))
+        separator = ', '
+    stream.write(']')
+
+def write_sync_data(stream: typing.TextIO, data: dict):
+    """Write fork sync data as a single JSON document
+
+    The output is identical to json.dumps(data), but the commits, which
+    can be dictionaries or CommitRepr objects, are serialized one by one
+    instead of being joined into a single string.
+
+    Args:
+        stream: The stream to write to
+        data (dict): The fork sync data
+    """
+    stream.write('{')
+    separator = ''
+    for key, value in data.items():
+        stream.write(f'{separator}{json.dumps(key)}: ')
+        if key in COMMIT_LISTS:
+            _write_json_array(stream, value)
+        elif key == BRANCHES_KEY:
+            _write_branches(stream, value)
+        else:
+            stream.write(json.dumps(value))
+        separator = ', '
+    stream.write('}')
+
+def write_sync_data_file(path: typing.Union[str, pathlib.Path], data: dict):
+    """Write fork sync data as a single JSON document, atomically
+
+    The document is written to a temporary file which then replaces the
+    file, so readers never see a partially written document.
+
+    Args:
+        path: The file to write
+        data (dict): The fork sync data
+    """
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        write_sync_data(f, data)
+    os.replace(temp_path, path)
+
+def as_plain_data(data: dict) -> dict:
+    """Fork sync data with the CommitRepr objects converted to dictionaries
+
+    Returns:
+        dict: The data as it would be loaded from its JSON document
+    """
+    plain = {}
+    for key, value in data.items():
+        if key in COMMIT_LISTS:
+            plain[key] = [_as_dict(item) for item in value]
+        elif key == BRANCHES_KEY:
+            plain[key] = {rev: as_plain_data(branch_data) for rev, branch_data in value.items()}
+        else:
+            plain[key] = value
+    return plain
+
+def _write_branches(stream: typing.TextIO, branches: dict):
+    stream.write('{')
+    separator = ''
+    for rev, branch_data in branches.items():
+        stream.write(f'{separator}{json.dumps(rev)}: ')
+        write_sync_data(stream, branch_data)
+        separator = ', '
+    stream.write('}')
+
+class _ShardWriter:
+    """Streams the commits of one category to its shard file"""
+
+    def __init__(self, path: pathlib.Path):
+        self.file = open(path, 'w', encoding='utf-8')
+        self.count = 0
+        self.file.write('[')
+
+    def write(self, item: dict):
+        if self.count:
+            self.file.write(', ')
+        self.file.write(json.dumps(item))
+        self.count += 1
+
+    def close(self):
+        self.file.write(']')
+        self.file.close()
+
+def branch_directory_name(rev: str) -> str:
+    """The name of the directory the data of a downstream revision is written to"""
+    return rev.replace('/', '_')
+
+def write_sharded_sync_data(directory: pathlib.Path, data: dict):
+    """Write fork sync data as a manifest and one file per category
+
+    The data of several downstream revisions is written to one
+    subdirectory per revision, listed by the top-level manifest.
+
+    Args:
+        directory: The directory to write the files to
+        data (dict): The fork sync data
+    """
+    directory = pathlib.Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    if BRANCHES_KEY in data:
+        manifest = {key: value for key, value in data.items() if key != BRANCHES_KEY}
+        manifest[BRANCHES_KEY] = {}
+        for rev, branch_data in data[BRANCHES_KEY].items():
+            name = branch_directory_name(rev)
+            write_sharded_sync_data(directory / name, branch_data)
+            manifest[BRANCHES_KEY][rev] = {'directory': name}
+        _write_manifest(directory, manifest)
+        return
+
+    manifest = {key: value for key, value in data.items() if key not in COMMIT_LISTS}
+    manifest['shards'] = {}
+    manifest['order'] = {}
+
+    shards = {}
+    try:
+        for list_name in COMMIT_LISTS:
+            # Run-length encoded sequence of the categories of the commits
+            order = []
+            for item in data.get(list_name, []):
+                item = _as_dict(item)
+                category = commit_category(list_name, item)
+
+                if category not in shards:
+                    shards[category] = _ShardWriter(directory / f'{category}.json')
+                    manifest['shards'][category] = {
+                        'file': f'{category}.json',
+                        'list': list_name,
+                    }
+                shards[category].write(item)
+
+                if order and order[-1][0] == category:
+                    order[-1][1] += 1
+                else:
+                    order.append([category, 1])
+            manifest['order'][list_name] = order
+    finally:
+        for category, shard in shards.items():
+            shard.close()
+            manifest['shards'][category]['count'] = shard.count
+
+    _write_manifest(directory, manifest)
+
+def _write_manifest(directory: pathlib.Path, manifest: dict):
+    manifest_path = directory / MANIFEST_FILE_NAME
+    with open(f'{manifest_path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(f'{manifest_path}.tmp', manifest_path)
+
+def is_manifest(data: dict) -> bool:
+    """Checks if the loaded document is the manifest of a sharded layout"""
+    return ('shards' in data and 'order' in data) or \
+        any(isinstance(branch, dict) and 'directory' in branch
+            for branch in data.get(BRANCHES_KEY, {}).values())
+
+def load_shard(manifest_dir: pathlib.Path, manifest: dict, category: str) -> list:
+    """Load the commits of a single category
+
+    Args:
+        manifest_dir: The directory containing the manifest
+        manifest (dict): The manifest
+        category (str): The category to load
+
+    Returns:
+        list: The dictionary representations of the commits
+    """
+    shard = manifest['shards'].get(category)
+    if not shard:
+        return []
+
+    with open(pathlib.Path(manifest_dir) / shard['file'], 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_sync_data(path: typing.Union[str, pathlib.Path], ordered: bool = True) -> dict:
+    """Load fork sync data written in any of the supported formats
+
+    Args:
+        path: A JSON document, a manifest or a directory with a manifest
+        ordered (bool): If False, the commit lists of a sharded layout are
+            generators loading one shard at a time, and the commits are not
+            in their original order. This is enough to aggregate them.
+
+    Returns:
+        dict: The fork sync data in the single document format
+    """
+    path = pathlib.Path(path)
+    if path.is_dir():
+        path = path / MANIFEST_FILE_NAME
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    if not is_manifest(data):
+        return data
+
+    if BRANCHES_KEY in data:
+        data[BRANCHES_KEY] = {
+            rev: load_sync_data(path.parent / branch['directory'], ordered)
+            for rev, branch in data[BRANCHES_KEY].items()
+        }
+        return data
+
+    if not ordered:
+        return iter_from_manifest(path.parent, data)
+
+    return restore_from_manifest(path.parent, data)
+
+def _iter_shards(manifest_dir: pathlib.Path,
+                 manifest: dict,
+                 list_name: str) -> typing.Iterator[dict]:
+    for category, shard in manifest['shards'].items():
+        if shard['list'] == list_name:
+            yield from load_shard(manifest_dir, manifest, category)
+
+def iter_from_manifest(manifest_dir: pathlib.Path, manifest: dict) -> dict:
+    """Like restore_from_manifest(), with the commit lists as generators
+
+    Only one shard is held in memory at a time.
+
+    Args:
+        manifest_dir: The directory containing the manifest
+        manifest (dict): The manifest
+
+    Returns:
+        dict: The fork sync data, with commit lists ordered by category
+    """
+    data = {key: value for key, value in manifest.items() if key not in ('shards', 'order')}
+    for list_name in COMMIT_LISTS:
+        data[list_name] = _iter_shards(manifest_dir, manifest, list_name)
+
+    return data
+
+def restore_from_manifest(manifest_dir: pathlib.Path, manifest: dict) -> dict:
+    """Restore the single document format from a sharded layout
+
+    Args:
+        manifest_dir: The directory containing the manifest
+        manifest (dict): The manifest
+
+    Returns:
+        dict: The fork sync data with the commits in their original order
+    """
+    data = {key: value for key, value in manifest.items() if key not in ('shards', 'order')}
+    shards = {category: iter(load_shard(manifest_dir, manifest, category))
+              for category in manifest['shards']}
+
+    for list_name in COMMIT_LISTS:
+        data[list_name] = [next(shards[category])
+                           for category, count in manifest['order'].get(list_name, [])
+                           for _ in range(count)]
+
+    return data
@@ -0,0 +1,49 @@
+"""Cherry-pick checks run by the asynchronous pipeline"""
+
+import asyncio
+import pathlib
+import sys
+
+import git
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import async_pipeline
+import verdict_cache
+
+@pytest.fixture
+def repo(tmp_path) -> git.Repo:
+    repo = git.Repo.init(tmp_path / 'repo')
+    with repo.config_writer() as config:
+        config.set_value('user', 'name', 'Test')
+        config.set_value('user', 'email', 'test@localhost')
+    for name in ('base', 'picked'):
+        (pathlib.Path(repo.working_dir) / name).write_text(name, encoding='utf-8')
+        repo.index.add([name])
+        repo.index.commit(name)
+    return repo
+
+def test_failed_check_is_raised_and_not_cached(repo, tmp_path):
+    base, picked = repo.commit('HEAD~1'), repo.commit('HEAD')
+    base_tree = str(base.tree)
+    missing = '0' * 40
+
+    async def check(cache):
+        checker = async_pipeline.CherryPickChecker(repo.git_dir, str(base), 'legacy', 2,
+                                                   cache, base_tree)
+        futures = [checker.submit(str(picked), str(base)),
+                   checker.submit(missing, str(base))]
+        await asyncio.wait(futures)
+        assert futures[0].result().clean
+        await checker.close()
+
+    with verdict_cache.CherryPickCache(str(tmp_path / 'cache.sqlite')) as cache:
+        with pytest.raises(git.GitCommandError):
+            asyncio.run(check(cache))
+
+        # The successful check was cached nevertheless
+        results = cache.get_many(base_tree, 'legacy', [(str(picked), str(base)),
+                                                       (missing, str(base))])
+        assert results[0].clean
+        assert results[1] is None
@@ -0,0 +1,54 @@
+"""Cherry-picking commits without a worktree"""
+
+import pathlib
+import sys
+
+import git
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import cherry_pick_commits
+
+def commit_file(repo: git.Repo, name: str, content: str, parents=None) -> git.Commit:
+    (pathlib.Path(repo.working_dir) / name).write_text(content, encoding='utf-8')
+    repo.index.add([name])
+    return repo.index.commit(f'Change {name}', parent_commits=parents)
+
+@pytest.fixture
+def repo(tmp_path) -> git.Repo:
+    repo = git.Repo.init(tmp_path)
+    with repo.config_writer() as config:
+        config.set_value('user', 'name', 'Test')
+        config.set_value('user', 'email', 'test@localhost')
+    return repo
+
+def test_pick_commits(repo):
+    base = commit_file(repo, 'a', 'a\n')
+    picked = commit_file(repo, 'b', 'b\n')
+
+    results = cherry_pick_commits.pick_commits(repo, base, [picked], '[nrf fromtree] ',
+                                               backend='legacy')
+
+    assert len(results) == 1 and results[0].new_sha
+    new_commit = repo.commit(results[0].new_sha)
+    assert new_commit.parents == (base,)
+    assert new_commit.tree == picked.tree
+    assert new_commit.message.startswith('[nrf fromtree] Change b\n')
+    assert f'(cherry picked from commit {picked})' in new_commit.message
+
+def test_root_commit_is_rejected(repo):
+    root = commit_file(repo, 'a', 'a\n')
+
+    with pytest.raises(ValueError, match='root commit'):
+        cherry_pick_commits.pick_commits(repo, root, [root], backend='legacy')
+
+def test_merge_commit_is_rejected(repo):
+    base = commit_file(repo, 'a', 'a\n')
+    side = commit_file(repo, 'b', 'b\n')
+    repo.head.reset(base, index=True, working_tree=True)
+    main = commit_file(repo, 'c', 'c\n')
+    merge = commit_file(repo, 'b', 'b\n', parents=[main, side])
+
+    with pytest.raises(ValueError, match='merge commit'):
+        cherry_pick_commits.pick_commits(repo, base, [main, merge], backend='legacy')
@@ -0,0 +1,30 @@
+"""Grouping the commits of a series which can be applied independently"""
+
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import cherry_pick_series
+
+def test_disjoint_paths_are_independent():
+    groups = cherry_pick_series.group_independent([('a/x',), ('a/y',), ('b',)])
+    assert groups == [[0], [1], [2]]
+
+def test_common_paths_are_grouped_transitively():
+    groups = cherry_pick_series.group_independent(
+        [('a', 'b'), ('c',), ('b', 'd'), ('d',), ('c', 'e')])
+    assert groups == [[0, 2, 3], [1, 4]]
+
+def test_file_replaced_by_directory():
+    # The file 'a' is changed before and after paths below 'a/' are
+    groups = cherry_pick_series.group_independent(
+        [('a/x',), ('a/y/z',), ('a',), ('a/w',), ('b',)])
+    assert groups == [[0, 1, 2, 3], [4]]
+
+def test_nested_directory_replaced_by_file():
+    groups = cherry_pick_series.group_independent([('a/b/c',), ('a/d',), ('a/b',)])
+    assert groups == [[0, 2], [1]]
+
+def test_no_commits():
+    assert not cherry_pick_series.group_independent([])
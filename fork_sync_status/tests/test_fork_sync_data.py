@@ -0,0 +1,45 @@
+"""Parsing of the commit messages"""
+
+import pathlib
+import sys
+
+import git
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import fork_sync_data
+import sync_data_io
+
+REVERTED_SHA = 'a' * 40
+UPSTREAM_REVERT_SHA = 'b' * 40
+
+@pytest.fixture
+def repo(tmp_path) -> git.Repo:
+    repo = git.Repo.init(tmp_path)
+    with repo.config_writer() as config:
+        config.set_value('user', 'name', 'Test')
+        config.set_value('user', 'email', 'test@localhost')
+    return repo
+
+def commit_repr(repo: git.Repo, message: str) -> fork_sync_data.CommitRepr:
+    commit = repo.index.commit(message)
+    return fork_sync_data.CommitRepr(commit, parse_message_for_upstream_info=True)
+
+def test_downstream_revert(repo):
+    item = commit_repr(repo, f'[nrf noup] Revert "x"\n\nThis reverts commit {REVERTED_SHA}.\n')
+
+    assert item.reverts_sha == REVERTED_SHA
+    assert sync_data_io.commit_category('downstream_commits', item.to_dict()) == 'reverted'
+
+def test_picked_upstream_revert_stays_fromtree(repo):
+    item = commit_repr(repo, f'[nrf fromtree] Revert "x"\n\nThis reverts commit {REVERTED_SHA}.\n\n'
+                             f'(cherry picked from commit {UPSTREAM_REVERT_SHA})\n')
+
+    assert item.upstream_sha == UPSTREAM_REVERT_SHA
+    assert item.reverts_sha is None
+    assert sync_data_io.commit_category('downstream_commits', item.to_dict()) == 'fromtree'
+
+    # Also when restored from data written while the reference was kept
+    representation = {**item.to_dict(), 'reverts_sha': REVERTED_SHA}
+    assert fork_sync_data.CommitRepr.from_dict(representation).reverts_sha is None
@@ -0,0 +1,60 @@
+"""Reconstruction of the metrics over time"""
+
+import pathlib
+import sys
+
+import git
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import history_metrics
+
+DAY = 24 * 60 * 60
+START = 1700000000
+
+def commit_file(repo: git.Repo, name: str, day: int, parents=None) -> git.Commit:
+    (pathlib.Path(repo.working_dir) / name).write_text(name, encoding='utf-8')
+    repo.index.add([name])
+    date = f'{START + day * DAY} +0000'
+    return repo.index.commit(name, parent_commits=parents, author_date=date, commit_date=date)
+
+@pytest.fixture
+def repo(tmp_path) -> git.Repo:
+    """A fork of an upstream branch which merges a side branch
+
+    Upstream: base - m1 - merge - m2, with side1 - side2 merged from base
+    Downstream: base - [nrf noup] d1
+    """
+    repo = git.Repo.init(tmp_path, initial_branch='main')
+    with repo.config_writer() as config:
+        config.set_value('user', 'name', 'Test')
+        config.set_value('user', 'email', 'test@localhost')
+
+    base = commit_file(repo, 'base', 0)
+    repo.create_head('down', base)
+    side1 = commit_file(repo, 'side1', 1)
+    side2 = commit_file(repo, 'side2', 2)
+    repo.head.reset(base, index=True, working_tree=True)
+    m1 = commit_file(repo, 'm1', 3)
+    commit_file(repo, 'merge', 5, parents=[m1, side2])
+    commit_file(repo, 'm2', 7)
+    assert side1 in side2.parents
+
+    repo.head.reference = repo.heads.down
+    repo.head.reset(index=True, working_tree=True)
+    commit_file(repo, '[nrf noup] d1', 4)
+    return repo
+
+def test_merged_commits_are_counted(repo):
+    upstream, downstream = history_metrics.read_histories(repo, 'main', 'down', START)
+    samples = np.array([START + day * DAY for day in (2, 4, 6, 8)])
+    metrics = history_metrics.compute_metrics(upstream, downstream, samples)
+
+    # The side branch lands with the merge, on day 5
+    assert list(metrics['Commits upstream after upmerge']) == [0, 1, 4, 5]
+    assert list(metrics['Commits upstream only']) == [0, 1, 4, 5]
+    assert list(metrics['Downstream noup commits']) == [0, 1, 1, 1]
+    assert metrics['Commits upstream after upmerge'][-1] == \
+        int(repo.git.rev_list('--count', 'down..main'))
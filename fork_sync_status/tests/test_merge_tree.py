@@ -0,0 +1,51 @@
+"""Parsing the output of git merge-tree"""
+
+import io
+import pathlib
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import merge_tree
+
+TREE = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
+
+def batch_with_output(output: bytes, chunk_size: int = 65536) -> merge_tree.MergeTreeBatch:
+    """A MergeTreeBatch reading canned output instead of a git process"""
+    batch = merge_tree.MergeTreeBatch.__new__(merge_tree.MergeTreeBatch)
+    batch._reader = merge_tree._NulTokenReader(
+        io.BufferedReader(io.BytesIO(output), buffer_size=chunk_size))
+    return batch
+
+def test_legacy_status():
+    assert merge_tree.parse_legacy_status('')
+    assert not merge_tree.parse_legacy_status('changed in both\n  base 100644 ...')
+    assert not merge_tree.parse_legacy_status('added in remote\n  their 100644 ...')
+    with pytest.raises(ValueError):
+        merge_tree.parse_legacy_status('fatal: something else')
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 65536])
+def test_batch_results(chunk_size):
+    output = (f'1\0{TREE}\0\0'
+              f'0\0{TREE}\0drivers/a.c\0include/b h.h\0\0'
+              f'1\0{TREE}\0\0').encode()
+    batch = batch_with_output(output, chunk_size)
+
+    assert batch._read_result() == merge_tree.MergeTreeResult(True, (), TREE)
+    assert batch._read_result() == merge_tree.MergeTreeResult(
+        False, ('drivers/a.c', 'include/b h.h'), None)
+    assert batch._read_result() == merge_tree.MergeTreeResult(True, (), TREE)
+    with pytest.raises(EOFError):
+        batch._read_result()
+
+def test_batch_failure():
+    batch = batch_with_output(f'fatal\0{TREE}\0\0'.encode())
+    with pytest.raises(RuntimeError):
+        batch._read_result()
+
+def test_truncated_output():
+    batch = batch_with_output(f'0\0{TREE}\0drivers/a.c'.encode())
+    with pytest.raises(EOFError):
+        batch._read_result()
@@ -0,0 +1,99 @@
+"""The ways of running fork_sync_data.py produce identical data
+
+The cherry-pick checks can run serially, in threads, in processes or in
+the asynchronous pipeline, and an incremental run reuses the output of
+an earlier one. All of them must produce the same data as a full serial
+run. A tiny synthetic fork is analyzed through file:// remotes, so the
+tests run offline.
+"""
+
+import json
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / 'benchmarks'))
+
+import synthetic_fork
+
+SCRIPT = pathlib.Path(__file__).resolve().parents[1] / 'fork_sync_data.py'
+
+SPEC = synthetic_fork.ForkSpec(base_commits=20, upstream_commits=60, downstream_commits=30,
+                               file_count=20, conflict_ratio=0.5, revert_ratio=0.1)
+
+# Meta data describing the run rather than the fork
+RUN_META = ('authored_seconds_since_epoch', 'incremental', 'cherry_pick_cache', 'perf')
+
+def run(fork: synthetic_fork.SyntheticFork, directory: pathlib.Path, *args: str) -> dict:
+    """Analyze the fork in a clone of its own
+
+    Returns:
+        dict: The output
+    """
+    directory.mkdir()
+    output_file = directory / 'data.json'
+    subprocess.run([sys.executable, str(SCRIPT),
+                    '--upstream-url', fork.upstream_url,
+                    '--downstream-url', fork.downstream_url,
+                    '--clone-dir', str(directory / 'clone'),
+                    '--output-file', str(output_file),
+                    '--no-cherry-pick-cache', *args],
+                   check=True, capture_output=True)
+
+    return json.loads(output_file.read_text(encoding='utf-8'))
+
+def fork_data(data: dict) -> dict:
+    """The output without the meta data describing the run"""
+    return {**data, 'meta': {key: value for key, value in data['meta'].items()
+                             if key not in RUN_META}}
+
+@pytest.fixture(scope='module')
+def fork(tmp_path_factory) -> synthetic_fork.SyntheticFork:
+    return synthetic_fork.create_fork(tmp_path_factory.mktemp('fork'), SPEC)
+
+@pytest.fixture(scope='module')
+def serial_data(fork, tmp_path_factory) -> dict:
+    return fork_data(run(fork, tmp_path_factory.mktemp('serial') / 'run',
+                         '--cherry-pick-executor', 'serial'))
+
+def test_fork_has_cherry_pick_checks(serial_data):
+    # Only the clean outcomes are stored
+    results = [bool(item.get('supports_clean_cherry_pick'))
+               for item in serial_data['upstream_commits']
+               if not (item.get('downstream_sha') or item.get('downstream_sha_guess'))]
+    assert True in results
+    assert False in results
+    assert any(item.get('reverted_by_sha') for item in serial_data['downstream_commits'])
+
+@pytest.mark.parametrize('args', [
+    ('--cherry-pick-executor', 'thread', '-j', '4'),
+    ('--cherry-pick-executor', 'process', '-j', '2'),
+    ('--async-pipeline', '-j', '4'),
+], ids=['thread', 'process', 'async'])
+def test_executors_match_serial(fork, serial_data, tmp_path, args):
+    assert fork_data(run(fork, tmp_path / 'run', *args)) == serial_data
+
+def test_incremental_matches_full(fork, serial_data, tmp_path):
+    # Go back to an earlier state of the fork, then return to the tips
+    fork_directory = pathlib.Path(fork.upstream_url[len('file://'):]).parent
+    work = fork_directory / 'work'
+    tips = {}
+    for name, branch in (('upstream.git', 'upstream'), ('downstream.git', 'downstream')):
+        bare = fork_directory / name
+        tips[bare] = subprocess.run(['git', 'rev-parse', branch], cwd=work, check=True,
+                                    capture_output=True, text=True).stdout.strip()
+        subprocess.run(['git', 'push', '--quiet', '--force', str(bare),
+                        f'{branch}~5:refs/heads/main'], cwd=work, check=True)
+    try:
+        earlier = tmp_path / 'earlier'
+        run(fork, earlier)
+    finally:
+        for bare, tip in tips.items():
+            subprocess.run(['git', 'push', '--quiet', '--force', str(bare),
+                            f'{tip}:refs/heads/main'], cwd=work, check=True)
+
+    data = run(fork, tmp_path / 'run', '--incremental-from', str(earlier / 'data.json'))
+    assert data['meta']['incremental']
+    assert fork_data(data) == serial_data
@@ -0,0 +1,56 @@
+"""Precomputed views of the web page"""
+
+import gzip
+import json
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import page_views
+
+def decode(deltas):
+    positions = []
+    for delta in deltas:
+        positions.append((positions[-1] if positions else 0) + delta)
+    return positions
+
+def test_trigrams():
+    assert page_views.trigrams('ABcd') == {'abc', 'bcd'}
+    assert page_views.trigrams('ab') == set()
+
+def test_trigram_index_is_delta_encoded():
+    commits = [{'title': 'net: fix'}, {'title': 'Bluetooth'}, {'title': 'more net'},
+               {'title': 'NET'}]
+    index = page_views.trigram_index(commits, 'title')
+
+    assert decode(index['net']) == [0, 2, 3]
+    assert decode(index['blu']) == [1]
+    assert list(index) == sorted(index)
+
+def test_views_and_summary(tmp_path):
+    data = {
+        'meta': {}, 'merge_base': {},
+        'downstream_commits': [
+            {'sha': 'a', 'title': '[nrf noup] a', 'author': 'Ann'},
+            {'sha': 'b', 'title': '[nrf fromtree] b', 'author': 'Bob', 'upstream_sha': 'u'},
+        ],
+        'upstream_commits': [
+            {'sha': 'u', 'title': 'b', 'author': 'Bob', 'downstream_sha': 'b'},
+            {'sha': 'v', 'title': 'c', 'author': 'Cid', 'supports_clean_cherry_pick': True},
+        ],
+    }
+    (tmp_path / 'data.json').write_text(json.dumps(data))
+    page_views.write_page_views(tmp_path / 'data.json', data)
+
+    directory = tmp_path / page_views.VIEWS_DIRECTORY_NAME
+    with gzip.open(directory / page_views.INDEX_FILE_NAME) as f:
+        index = json.load(f)
+    assert index['summary']['noup'] == 1
+    assert index['summary']['upstream_only'] == 1
+    assert index['views']['commits_fromtree']['count'] == 1
+
+    with gzip.open(directory / 'commits_not_downstream.json.gz') as f:
+        view = json.load(f)
+    assert [item['sha'] for item in view['commits']] == ['v']
+    assert decode(view['trigrams']['author']['cid']) == [0]
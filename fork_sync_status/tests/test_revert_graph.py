@@ -0,0 +1,53 @@
+"""Resolution of revert chains"""
+
+import pathlib
+import sys
+import types
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import revert_graph
+
+def commit(sha: str, reverts_sha: str = None) -> types.SimpleNamespace:
+    return types.SimpleNamespace(sha=sha, reverts_sha=reverts_sha,
+                                 reverted_by_sha=None, effectively_reverted=None)
+
+def test_single_revert():
+    original, revert = commit('a' * 40), commit('b' * 40, 'a' * 40)
+    stats = revert_graph.resolve_reverts([revert, original])
+
+    assert stats == revert_graph.RevertStats(reverted=1, effectively_reverted=1)
+    assert original.reverted_by_sha == revert.sha
+    assert original.effectively_reverted
+    assert revert.reverted_by_sha is None
+
+def test_revert_of_revert_relands():
+    original = commit('a' * 40)
+    revert = commit('b' * 40, 'a' * 40)
+    reland = commit('c' * 40, 'b' * 40)
+    stats = revert_graph.resolve_reverts([reland, revert, original])
+
+    assert stats == revert_graph.RevertStats(reverted=2, effectively_reverted=1)
+    assert not original.effectively_reverted
+    assert revert.effectively_reverted
+    assert revert.reverted_by_sha == reland.sha
+
+def test_long_chain_alternates():
+    shas = [f'{index:040x}' for index in range(1, 1002)]
+    commits = [commit(shas[0])] + [commit(sha, previous) for previous, sha in zip(shas, shas[1:])]
+    revert_graph.resolve_reverts(reversed(commits))
+
+    # The last revert is in effect, so every other commit before it is
+    # reverted, and the original commit is in effect again
+    assert [item.effectively_reverted for item in commits[:4]] == [False, True, False, True]
+    assert commits[-2].effectively_reverted
+    assert commits[-1].effectively_reverted is None
+
+def test_abbreviated_and_unknown_references():
+    original = commit('1234567' + 'a' * 33)
+    revert = commit('b' * 40, '1234567')
+    outside = commit('c' * 40, 'd' * 40)
+    stats = revert_graph.resolve_reverts([original, revert, outside])
+
+    assert stats.reverted == 1
+    assert original.reverted_by_sha == revert.sha
@@ -0,0 +1,53 @@
+"""Writing and reading fork sync data"""
+
+import json
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import sync_data_io
+
+DATA = {
+    'meta': {'upstream_rev': 'main', 'downstream_rev': 'main'},
+    'merge_base': {'sha': '0' * 40},
+    'downstream_commits': [
+        {'sha': '1' * 40, 'title': '[nrf noup] a'},
+        {'sha': '2' * 40, 'title': '[nrf fromtree] b', 'upstream_sha': '5' * 40},
+        {'sha': '3' * 40, 'title': '[nrf noup] c', 'reverted_by_sha': '4' * 40,
+         'effectively_reverted': False},
+        {'sha': '4' * 40, 'title': 'Revert "[nrf noup] c"', 'reverts_sha': '3' * 40},
+        {'sha': '6' * 40, 'title': '[nrf fromlist] d', 'upstream_pr': 12},
+    ],
+    'upstream_commits': [
+        {'sha': '5' * 40, 'title': 'b', 'downstream_sha': '2' * 40},
+        {'sha': '7' * 40, 'title': 'e', 'supports_clean_cherry_pick': True},
+    ],
+}
+
+def test_single_document_matches_json_dumps(tmp_path):
+    path = tmp_path / 'data.json'
+    sync_data_io.write_sync_data_file(path, DATA)
+
+    assert path.read_text(encoding='utf-8') == json.dumps(DATA)
+    assert sync_data_io.load_sync_data(path) == DATA
+
+def test_manifest_round_trip(tmp_path):
+    sync_data_io.write_sharded_sync_data(tmp_path, DATA)
+
+    manifest = json.loads((tmp_path / sync_data_io.MANIFEST_FILE_NAME).read_text())
+    assert sync_data_io.is_manifest(manifest)
+    assert sync_data_io.load_sync_data(tmp_path) == DATA
+
+def test_branches_round_trip(tmp_path):
+    data = {'meta': DATA['meta'],
+            sync_data_io.BRANCHES_KEY: {'main': DATA, 'release/v1': DATA}}
+    sync_data_io.write_sharded_sync_data(tmp_path, data)
+
+    assert (tmp_path / 'release_v1' / sync_data_io.MANIFEST_FILE_NAME).exists()
+    assert sync_data_io.load_sync_data(tmp_path) == data
+
+def test_relanded_commit_keeps_its_category():
+    categories = [sync_data_io.commit_category('downstream_commits', item)
+                  for item in DATA['downstream_commits']]
+    assert categories == ['noup', 'fromtree', 'noup', 'reverted', 'fromlist']
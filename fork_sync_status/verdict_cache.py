@@ -0,0 +1,138 @@
+"""Persistent cache of cherry-pick verdicts
+
+The outcome of a cherry-pick check only depends on the tree the commit
+is applied to, the commit and its parent. The verdicts are therefore
+stored in a SQLite database keyed by those, so that subsequent runs only
+have to check commits that were not seen before.
+"""
+
+import json
+import sqlite3
+import time
+import typing
+
+from merge_tree import MergeTreeResult
+
+DEFAULT_MAX_ENTRIES = 200000
+
+class CherryPickCache:
+    """SQLite backed cache of merge-tree results
+
+    The least recently used entries are evicted when the cache is closed
+    and holds more than max_entries entries.
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self._connection = sqlite3.connect(path)
+        self._max_entries = max_entries
+        self._now = int(time.time())
+        self.hits = 0
+        self.misses = 0
+
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS verdicts ('
+            ' base_tree TEXT NOT NULL,'
+            ' sha TEXT NOT NULL,'
+            ' parent_sha TEXT NOT NULL,'
+            ' backend TEXT NOT NULL,'
+            ' clean INTEGER NOT NULL,'
+            ' conflicting_paths TEXT NOT NULL,'
+            ' last_used INTEGER NOT NULL,'
+            ' PRIMARY KEY (base_tree, sha, parent_sha, backend))')
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_many(self,
+                 base_tree: str,
+                 backend: str,
+                 commit_and_parent_shas: typing.List[typing.Tuple[str, str]]) \
+                     -> typing.List[typing.Optional[MergeTreeResult]]:
+        """Look up the verdicts for several commits
+
+        Args:
+            base_tree (str): The tree the commits are applied to
+            backend (str): The merge-tree backend producing the verdicts
+            commit_and_parent_shas: The commits along with their first parent
+
+        Returns:
+            list: The cached result for each commit, or None on a miss
+        """
+        results = []
+        found = []
+        for sha, parent_sha in commit_and_parent_shas:
+            row = self._connection.execute(
+                'SELECT clean, conflicting_paths FROM verdicts '
+                'WHERE base_tree = ? AND sha = ? AND parent_sha = ? AND backend = ?',
+                (base_tree, sha, parent_sha, backend)).fetchone()
+            if row is None:
+                self.misses += 1
+                results.append(None)
+            else:
+                self.hits += 1
+                found.append((self._now, base_tree, sha, parent_sha, backend))
+                results.append(MergeTreeResult(bool(row[0]), tuple(json.loads(row[1]))))
+
+        self._connection.executemany(
+            'UPDATE verdicts SET last_used = ? '
+            'WHERE base_tree = ? AND sha = ? AND parent_sha = ? AND backend = ?',
+            found)
+
+        return results
+
+    def put_many(self,
+                 base_tree: str,
+                 backend: str,
+                 commit_and_parent_shas: typing.List[typing.Tuple[str, str]],
+                 results: typing.List[MergeTreeResult]):
+        """Store the verdicts for several commits
+
+        Args:
+            base_tree (str): The tree the commits are applied to
+            backend (str): The merge-tree backend producing the verdicts
+            commit_and_parent_shas: The commits along with their first parent
+            results: The result for each commit
+        """
+        self._connection.executemany(
+            'INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(base_tree, sha, parent_sha, backend, int(result.clean),
+              json.dumps(list(result.conflicting_paths)), self._now)
+             for (sha, parent_sha), result in zip(commit_and_parent_shas, results)])
+        self._connection.commit()
+
+    def reset_stats(self):
+        """Start counting the hits and misses of a new run"""
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """Cache statistics in the format stored in the output meta data
+
+        The hits and misses are counted since the last reset_stats().
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def evict(self):
+        """Evict the least recently used entries beyond max_entries
+
+        Entries used from now on count as more recently used.
+        """
+        self._connection.execute(
+            'DELETE FROM verdicts WHERE rowid IN ('
+            ' SELECT rowid FROM verdicts ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self._max_entries,))
+        self._connection.commit()
+        self._now = max(self._now + 1, int(time.time()))
+
+    def close(self):
+        """Evict the least recently used entries and close the database"""
+        self.evict()
+        self._connection.close()